@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Time each stage of the mapping pipeline (read, project, import, select,
+    region, interpolate, color, render) on synthetic CASAS output tables
+    (see synthetic_data.py) of different sizes and at different region
+    resolutions. Everything runs in a throwaway GRASS GIS location with
+    synthetic elevation, crop and administrative division maps, so no
+    production data is needed. Timings are saved as JSON, one record per
+    stage, to compare runs before and after an upgrade, e.g.
+    python benchmarks/run_benchmarks.py --points 1000 --variables 1 10 """
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import importlib.util
+import json
+import pathlib
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import types
+import pandas as pd
+import synthetic_data as syn
+
+from typing import Optional
+
+CASAS_GIS_DIR = pathlib.Path(__file__).resolve().parents[1] / "casas_gis"
+RESULTS_DIR = pathlib.Path(__file__).resolve().parent / "results"
+
+# Lambert azimuthal equal area, as the mapping locations in locations.py
+LOCATION_CRS = "EPSG:3035"
+LOCATION_NAME = "casas_benchmark"
+DIVISION_GRID = (3, 4)
+MAX_ALTITUDE = 1200
+
+
+def load_modules():
+    """ GRASS GIS Python modules are imported first, then casas_gis is put
+        on sys.path: its grass.py would otherwise be found instead of the
+        grass package. grass.py itself is loaded as casas_grass. """
+    from dotenv import load_dotenv
+    load_dotenv()  # needed for grass_session
+    importlib.import_module("grass_session")
+    grass = importlib.import_module("grass.script")
+    sys.path.insert(0, str(CASAS_GIS_DIR))
+    spec = importlib.util.spec_from_file_location("casas_grass",
+                                                  CASAS_GIS_DIR / "grass.py")
+    pipeline = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(pipeline)
+    return types.SimpleNamespace(
+        grass=grass,
+        pipeline=pipeline,
+        k=importlib.import_module("constants"),
+        inp=importlib.import_module("input"),
+        pts=importlib.import_module("points"),
+        surf=importlib.import_module("interpolation"),
+        clr=importlib.import_module("color"),
+        cleanup=importlib.import_module("cleanup"))
+
+
+def get_location(gisdb: pathlib.Path,
+                 resolution: float):
+    """ Location settings (see locations.py) for the throwaway location. """
+    session = {"gisdb": str(gisdb),
+               "location": LOCATION_NAME,
+               "mapset": "PERMANENT"}
+    boundaries = {"map_name": "boundaries", "color": "23:23:23", "width": 3}
+    return {
+        "latlong_session": session,
+        "mapping_session": session,
+        "mapping_data": {
+            "coastline": boundaries,
+            "countries": boundaries,
+            "target_region": boundaries,
+            "admin_divisions": {
+                "map_name": "divisions",
+                "color": "23:23:23",
+                "width": 3,
+                "column": "code",
+                "division_names": tuple(
+                    f"D{cat}" for cat in
+                    range(1, DIVISION_GRID[0] * DIVISION_GRID[1] + 1))
+            },
+            "digital_elevation": "elevation",
+            "shaded_relief": "shaded_relief",
+            "crop": {
+                "harvest_area_fraction": "harvest_area_fraction"
+            }
+        },
+        "legend_settings": {
+            "room_for_bottom_legend": 0.37,
+            "bottom_location": (6, 10, 20, 80),
+            "right_location": (20, 80, 86, 90)
+        },
+        "region_settings": {
+            "full": {"north": "n+0", "south": "s-0", "east": "e+0",
+                     "west": "w-0", "resolution": resolution},
+            "subset": {"north": "n+0", "south": "s-0", "east": "e+0",
+                       "west": "w-0", "resolution": resolution}
+        }
+    }
+
+
+def make_base_maps(m: types.SimpleNamespace,
+                   bounds: tuple,
+                   resolution: float):
+    """ Synthetic elevation, shaded relief, crop fraction, administrative
+        divisions and boundary lines over the projected bounds. """
+    crs = m.pts.get_location_crs()
+    west, south, east, north = bounds
+    lon, lat = zip(*[(lon, lat)
+                     for lon in (west, (west + east) / 2, east)
+                     for lat in (south, (south + north) / 2, north)])
+    x, y = m.pts.project_coordinates(lon, lat, crs)
+    m.grass.run_command("g.region", n=max(y), s=min(y), e=max(x), w=min(x),
+                        res=resolution, flags="a")
+    m.grass.mapcalc("elevation = 750 * (1 + sin(x() / 40000.0) *"
+                    " cos(y() / 60000.0))", overwrite=True)
+    m.grass.mapcalc("harvest_area_fraction = (1 + sin((x() + y()) /"
+                    " 25000.0)) / 2", overwrite=True)
+    m.grass.run_command("r.relief", input="elevation",
+                        output="shaded_relief", overwrite=True)
+    rows, cols = DIVISION_GRID
+    m.grass.run_command("v.mkgrid", map="divisions", grid=f"{rows},{cols}",
+                        overwrite=True)
+    m.grass.run_command("v.db.addcolumn", map="divisions",
+                        columns="code varchar(8)")
+    m.grass.run_command("v.db.update", map="divisions", column="code",
+                        query_column="'D' || cat")
+    m.grass.run_command("v.type", input="divisions", output="boundaries",
+                        from_type="boundary", to_type="line",
+                        overwrite=True)
+
+
+@contextlib.contextmanager
+def timed(results: list,
+          stage: str,
+          **labels):
+    start = time.perf_counter()
+    yield
+    results.append({**labels,
+                    "stage": stage,
+                    "seconds": round(time.perf_counter() - start, 4)})
+    print(f"{labels} {stage}: {results[-1]['seconds']} s")
+
+
+def run_dataset(m: types.SimpleNamespace,
+                work_dir: pathlib.Path,
+                n_points: int,
+                n_variables: int,
+                resolutions: list,
+                engine: str,
+                native: bool,
+                results: list):
+    """ Time all stages for one synthetic table, with points read,
+        projected, imported and selected once and the rest once per region
+        resolution. """
+    labels = {"points": n_points, "variables": n_variables}
+    name = syn.table_name(n_points, n_variables)
+    input_dir = work_dir / "input" / name
+    tmp_dir = work_dir / "tmp" / name
+    syn.write_table(syn.make_table(n_points, n_variables),
+                    input_dir / f"{name}.txt")
+    m.cleanup.clean_up_vectors()
+    with timed(results, "read", **labels):
+        m.inp.select_tables(
+            m.inp.iter_tables("Longitude", "Latitude",
+                              syn.variable_names(n_variables),
+                              input_dir=input_dir),
+            tmp_dir=tmp_dir)
+    # Tables are read before the timer, "project" is reprojection only
+    frames = {path: pd.read_csv(path, sep="\t")
+              for path in sorted(tmp_dir.glob("*.txt"))}
+    with timed(results, "project", **labels):
+        crs = m.pts.get_location_crs()
+        projected = {path: m.pts.project_table(df, crs)
+                     for path, df in frames.items()}
+    with timed(results, "import", **labels):
+        for path, df in projected.items():
+            m.pts.stream_to_vector(
+                dfs=[df],
+                output_map=f"{m.k.IMPORTED_PREFIX}{path.stem}",
+                columns=("x double precision, y double precision, "
+                         f"{m.pipeline.get_point_columns(path)}"))
+    with timed(results, "select", **labels):
+        m.surf.select_interpolation_points(
+            m.k.mapping_data["digital_elevation"],
+            altitude_cap=MAX_ALTITUDE)
+    for resolution in resolutions:
+        labels["resolution"] = resolution
+        m.k.set_location(get_location(m.k.mapping_session["gisdb"],
+                                      resolution))
+        m.cleanup.clean_up_rasters()
+        with timed(results, "region", **labels):
+            divisions = m.k.mapping_data["admin_divisions"]
+            m.pipeline.set_mapping_region(
+                map_of_subregions=divisions["map_name"],
+                column_name=divisions["column"],
+                selected_subregions=",".join(divisions["division_names"]))
+            m.pipeline.set_crop_area(
+                m.k.mapping_data["digital_elevation"],
+                MAX_ALTITUDE,
+                m.k.mapping_data["crop"]["harvest_area_fraction"],
+                0.3)
+        with timed(results, "interpolate", **labels):
+            m.surf.interpolate_points_idw(engine=engine)
+        sel_vector_list, (idw_rasters, _) = m.pipeline.get_maps_to_draw(
+            mapping_mapset=m.k.mapping_session["mapset"])
+        with timed(results, "color", **labels):
+            for idw_raster in idw_rasters:
+                m.clr.set_color_rule(raster_map=idw_raster,
+                                     color_rule="panoply.txt")
+        with timed(results, "render", **labels):
+            (fig_width, fig_height,
+             number_of_cols, number_of_rows) = m.pipeline.set_output_image(1)
+            m.pipeline.loop_and_map_png(extension=m.k.PNG,
+                                        surf_raster_list=idw_rasters,
+                                        sel_vector_list=sel_vector_list,
+                                        fig_width=fig_width,
+                                        fig_height=fig_height,
+                                        number_of_cols=number_of_cols,
+                                        number_of_rows=number_of_rows,
+                                        background_color="white",
+                                        native=native)
+    shutil.rmtree(tmp_dir)
+
+
+def run_benchmarks(points: list,
+                   variables: list,
+                   resolutions: list,
+                   engine: Optional[str] = "grass",
+                   native: Optional[bool] = False,
+                   keep_location: Optional[bool] = False):
+    """ Run all combinations of points and variables in a new location in
+        a temporary GRASS GIS database. Returns timing records and
+        information on the machine and GRASS GIS version. """
+    m = load_modules()
+    work_dir = pathlib.Path(tempfile.mkdtemp(prefix="casas_benchmark_"))
+    gisdb = work_dir / "grassdata"
+    gisdb.mkdir()
+    location = get_location(gisdb, min(resolutions))
+    m.k.set_location(location)
+    m.k.CACHE_DIR = work_dir / "cache"
+    m.k.use_output_dir(work_dir / "out")
+    results = []
+    grass_version = {}
+    try:
+        with m.pipeline.Session(**location["mapping_session"],
+                                create_opts=LOCATION_CRS):
+            make_base_maps(m, syn.DEFAULT_BOUNDS, min(resolutions))
+            grass_version = m.grass.parse_command("g.version", flags="g")
+            for n_points in points:
+                for n_variables in variables:
+                    run_dataset(m, work_dir, n_points, n_variables,
+                                resolutions, engine, native, results)
+    finally:
+        if keep_location:
+            print(f"Benchmark location kept in {gisdb}")
+        else:
+            shutil.rmtree(work_dir)
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "machine": {"platform": platform.platform(),
+                        "processor": platform.processor(),
+                        "python": platform.python_version(),
+                        "grass": grass_version.get("version")},
+            "settings": {"engine": engine, "native": native},
+            "results": results}
+
+
+def write_results(benchmark: dict,
+                  outfile: Optional[pathlib.Path] = None):
+    if outfile is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        stamp = benchmark["created"].replace(":", "")
+        outfile = RESULTS_DIR / f"benchmark_{stamp}.json"
+    with open(outfile, "w") as f:
+        json.dump(benchmark, f, indent=4)
+    print(f"\nBenchmark results written to {outfile}")
+    return outfile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time casas_gis pipeline stages on synthetic data")
+    parser.add_argument("--points", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--variables", type=int, nargs="+",
+                        default=[1, 10, 50])
+    parser.add_argument("--resolutions", type=float, nargs="+",
+                        default=[1000, 5000],
+                        help="region resolutions in meters")
+    parser.add_argument("--engine", choices=["grass", "numpy"],
+                        default="grass", help="IDW engine")
+    parser.add_argument("--native", action="store_true",
+                        help="draw PNG maps in Python (see grass.py)")
+    parser.add_argument("--keep-location", action="store_true")
+    parser.add_argument("--output", type=pathlib.Path)
+    args = parser.parse_args()
+    write_results(run_benchmarks(points=args.points,
+                                 variables=args.variables,
+                                 resolutions=args.resolutions,
+                                 engine=args.engine,
+                                 native=args.native,
+                                 keep_location=args.keep_location),
+                  outfile=args.output)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Synthetic CASAS output tables, in the same tab-separated layout as
+    casas_gis/input_data/coffee_03oct19_avg.txt, for benchmarks. Points are
+    scattered over a longitude/latitude box and variables are smooth fields
+    with some noise, so that interpolated maps look like model output. """
+
+import argparse
+import pathlib
+import numpy as np
+import pandas as pd
+
+from typing import Optional
+
+# About the extent of Andalusia (west, south, east, north)
+DEFAULT_BOUNDS = (-7.5, 36.0, -1.6, 38.7)
+
+
+def variable_names(n_variables: int):
+    return [f"var{i:02d}" for i in range(1, n_variables + 1)]
+
+
+def make_table(n_points: int,
+               n_variables: int,
+               bounds: Optional[tuple] = DEFAULT_BOUNDS,
+               seed: Optional[int] = 0):
+    """ CASAS output table of n_points weather stations and n_variables
+        model output columns. The same seed gives the same table. """
+    rng = np.random.default_rng(seed)
+    west, south, east, north = bounds
+    lon = rng.uniform(west, east, n_points).round(4)
+    lat = rng.uniform(south, north, n_points).round(4)
+    table = {"file": "SyntheticGIS",
+             "days": 1783,
+             "Path_Archivo": [f"C:\\Synthetic\\WX\\station_{i:06d}.txt"
+                              for i in range(n_points)],
+             "Longitude": lon,
+             "Latitude": lat}
+    for variable in variable_names(n_variables):
+        scale, lon_frequency, lat_frequency, phase = rng.uniform(
+            (100, 0.5, 0.5, 0), (10000, 3, 3, np.pi))
+        field = (np.sin(lon * lon_frequency + phase) *
+                 np.cos(lat * lat_frequency) + 1)
+        noise = rng.normal(0, 0.05, n_points)
+        table[variable] = (scale * (field + noise)).round(2)
+    table["displaydays"] = 1053
+    table["year"] = "avg"
+    return pd.DataFrame(table)
+
+
+def write_table(df: pd.DataFrame,
+                path: pathlib.Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(path, sep="\t", index=False)
+    return path
+
+
+def table_name(n_points: int,
+               n_variables: int):
+    return f"synthetic_{n_points}pts_{n_variables}vars_avg"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write synthetic CASAS output tables")
+    parser.add_argument("--points", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--variables", type=int, nargs="+",
+                        default=[1, 10, 50])
+    parser.add_argument("--output", type=pathlib.Path,
+                        default=pathlib.Path("synthetic_input"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for n_points in args.points:
+        for n_variables in args.variables:
+            path = args.output / f"{table_name(n_points, n_variables)}.txt"
+            write_table(make_table(n_points, n_variables, seed=args.seed),
+                        path)
+            print(f"Wrote {path}")
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Pipeline stages (import points, set region, build mask, interpolate,
+    clip, statistics and export) behind one interface, so that the same
+    workflow runs on GRASS GIS maps or on arrays in memory.
+    GrassBackend keeps points and rasters as GRASS GIS maps in the current
+    mapset, through the same modules as the rest of the pipeline.
+    MemoryBackend keeps them as pandas tables and NumPy arrays (NaN is
+    NULL), with no subprocess or file involved, which is faster when the
+    region fits in memory. Input rasters can be read from, and results
+    written to, the current mapset (load_rasters and save_to_mapset), so
+    that the rest of the pipeline works on GRASS GIS maps either way (see
+    grass.run_backend_stages). Reading and writing GeoTIFF files needs
+    rasterio (optional, see pyproject.toml extras). """
+
+import abc
+import os
+import pathlib
+import numpy as np
+import pandas as pd
+import constants as k
+import gis_init as ini
+import cache
+import idw
+import mapcalc
+import points as pts
+import interpolation as surf
+
+from typing import Optional
+
+try:
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.warp import Resampling, reproject
+except ImportError:
+    rasterio = None
+
+grass = ini.GrassModule("grass.script")
+garray = ini.GrassModule("grass.script.array")
+
+
+class Backend(abc.ABC):
+    """ Points are tables with projected x and y as first two columns and
+        one column per attribute. Rasters and point sets are referred to by
+        name, as GRASS GIS maps are. """
+
+    @abc.abstractmethod
+    def import_points(self, name: str, df: pd.DataFrame):
+        """ Store a table of points as name. """
+
+    @abc.abstractmethod
+    def set_region(self,
+                   north: float,
+                   south: float,
+                   east: float,
+                   west: float,
+                   resolution: float):
+        """ Set the grid that rasters cover, with bounds aligned to the
+            resolution (as g.region -a). Returns the region as
+            grass.region() does. """
+
+    @abc.abstractmethod
+    def build_mask(self,
+                   output: str,
+                   region_raster: Optional[str] = None,
+                   digital_elevation_map: Optional[str] = None,
+                   max_altitude: Optional[float] = None,
+                   crop_area: Optional[str] = None,
+                   crop_fraction_cap: Optional[float] = None):
+        """ Raster that is 1 where all given conditions hold and NULL
+            elsewhere: data in region_raster, elevation below max_altitude,
+            crop fraction above crop_fraction_cap or, without a cap, crop
+            present (see grass.set_crop_area). """
+
+    @abc.abstractmethod
+    def interpolate(self,
+                    points: str,
+                    column: str,
+                    output: str,
+                    mask: Optional[str] = None,
+                    number_of_points: Optional[int] = 3,
+                    power: Optional[float] = 2.0):
+        """ IDW surface of a column of points, NULL outside mask. Returns
+            statistics of the surface (see stats). """
+
+    @abc.abstractmethod
+    def clip(self,
+             raster: str,
+             output: str,
+             mask: Optional[str] = None,
+             min_value: Optional[float] = None,
+             max_value: Optional[float] = None):
+        """ Raster values inside mask and strictly between min_value and
+            max_value, NULL elsewhere. """
+
+    @abc.abstractmethod
+    def stats(self, raster: str):
+        """ Number of non-NULL cells, min, max and mean, as floats. """
+
+    @abc.abstractmethod
+    def export(self, raster: str, outfile: os.PathLike):
+        """ Write a raster to a GeoTIFF file. """
+
+    @abc.abstractmethod
+    def load_rasters(self, raster_maps: list):
+        """ Make raster maps of the current mapset (e.g., elevation) usable
+            as rasters of the same name, once the region is set. """
+
+    @abc.abstractmethod
+    def save_to_mapset(self, rasters: list, points: list):
+        """ Make rasters and point sets maps of the current mapset, for the
+            stages that only run as GRASS GIS modules (e.g., maps). """
+
+
+class GrassBackend(Backend):
+    """ Stages run as GRASS GIS modules in the current session. """
+
+    def import_points(self, name: str, df: pd.DataFrame):
+        pts.stream_to_vector(dfs=[df],
+                             output_map=name,
+                             columns=get_vector_columns(df))
+
+    def set_region(self,
+                   north: float,
+                   south: float,
+                   east: float,
+                   west: float,
+                   resolution: float):
+        grass.run_command("g.region", n=north, s=south, e=east, w=west,
+                          res=resolution, flags="a")
+        return grass.region()
+
+    def build_mask(self,
+                   output: str,
+                   region_raster: Optional[str] = None,
+                   digital_elevation_map: Optional[str] = None,
+                   max_altitude: Optional[float] = None,
+                   crop_area: Optional[str] = None,
+                   crop_fraction_cap: Optional[float] = None):
+        if crop_area is None:
+            crop_condition = None
+        elif crop_fraction_cap is not None:
+            crop_condition = f"{crop_area} > {crop_fraction_cap}"
+        else:
+            crop_condition = f"{crop_area} == 1"
+        altitude_condition = (None if digital_elevation_map is None else
+                              mapcalc.all_of(
+                                  f"!isnull({digital_elevation_map})",
+                                  mapcalc.within(digital_elevation_map,
+                                                 max_value=max_altitude)))
+        mapcalc.evaluate([
+            mapcalc.assign(output, mapcalc.where("1",
+                                                 region_raster,
+                                                 crop_condition,
+                                                 altitude_condition))])
+
+    def interpolate(self,
+                    points: str,
+                    column: str,
+                    output: str,
+                    mask: Optional[str] = None,
+                    number_of_points: Optional[int] = 3,
+                    power: Optional[float] = 2.0):
+        # Same weights, and weight cache, as the NumPy IDW engine
+        _, raster_stats = idw.interpolate_vector_idw_numpy(
+            vector_map=points,
+            column_name=column,
+            output_map=output,
+            number_of_points=number_of_points,
+            power=power,
+            region_raster=mask)
+        return self.univar_stats(raster_stats)
+
+    def clip(self,
+             raster: str,
+             output: str,
+             mask: Optional[str] = None,
+             min_value: Optional[float] = None,
+             max_value: Optional[float] = None):
+        mapcalc.evaluate([
+            mapcalc.assign(output,
+                           mapcalc.where(raster,
+                                         mask,
+                                         mapcalc.within(raster,
+                                                        min_value,
+                                                        max_value)))])
+
+    def stats(self, raster: str):
+        return self.univar_stats(surf.get_raster_stats(raster))
+
+    @staticmethod
+    def univar_stats(raster_stats: dict):
+        """ Backend statistics from r.univar -g output. """
+        return {key: float(raster_stats.get(key, "nan"))
+                for key in ("n", "min", "max", "mean")}
+
+    def export(self, raster: str, outfile: os.PathLike):
+        grass.run_command("r.out.gdal", overwrite=True,
+                          input=raster,
+                          output=outfile,
+                          format="GTiff")
+
+    def load_rasters(self, raster_maps: list):
+        # Already maps of the current mapset
+        pass
+
+    def save_to_mapset(self, rasters: list, points: list):
+        pass
+
+
+class MemoryBackend(Backend):
+    """ Stages run on tables and arrays kept in this object. Input rasters
+        (e.g., elevation and crop fraction) are added as arrays covering the
+        region (add_raster) or read from files (read_raster). crs (e.g.,
+        "EPSG:3035") is only needed to read and write files. """
+
+    def __init__(self, crs: Optional[str] = None):
+        self.crs = crs
+        self.region = None
+        self.points = {}
+        self.rasters = {}
+        self._weight_matrices = {}
+
+    def import_points(self, name: str, df: pd.DataFrame):
+        self.points[name] = df.copy()
+
+    def set_region(self,
+                   north: float,
+                   south: float,
+                   east: float,
+                   west: float,
+                   resolution: float):
+        north = np.ceil(north / resolution) * resolution
+        south = np.floor(south / resolution) * resolution
+        east = np.ceil(east / resolution) * resolution
+        west = np.floor(west / resolution) * resolution
+        rows = int(round((north - south) / resolution))
+        cols = int(round((east - west) / resolution))
+        self.region = {"n": north, "s": south, "e": east, "w": west,
+                       "nsres": resolution, "ewres": resolution,
+                       "rows": rows, "cols": cols, "cells": rows * cols}
+        return self.region
+
+    def add_raster(self, name: str, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        shape = (self.region["rows"], self.region["cols"])
+        if values.shape != shape:
+            raise ValueError(f"Raster {name} is {values.shape}, the region"
+                             f" is {shape}")
+        self.rasters[name] = values
+
+    def get_raster(self, name: Optional[str]):
+        """ Array of a raster, or None for no raster (no condition). """
+        return None if name is None else self.rasters[name]
+
+    def build_mask(self,
+                   output: str,
+                   region_raster: Optional[str] = None,
+                   digital_elevation_map: Optional[str] = None,
+                   max_altitude: Optional[float] = None,
+                   crop_area: Optional[str] = None,
+                   crop_fraction_cap: Optional[float] = None):
+        mask = np.ones((self.region["rows"], self.region["cols"]), bool)
+        # Comparisons with NaN are False, as with NULL in r.mapcalc
+        with np.errstate(invalid="ignore"):
+            if region_raster is not None:
+                region_values = self.get_raster(region_raster)
+                mask &= ~np.isnan(region_values) & (region_values != 0)
+            if crop_area is not None and crop_fraction_cap is not None:
+                mask &= self.get_raster(crop_area) > crop_fraction_cap
+            elif crop_area is not None:
+                mask &= self.get_raster(crop_area) == 1
+            if digital_elevation_map is not None:
+                elevation = self.get_raster(digital_elevation_map)
+                mask &= ~np.isnan(elevation)
+                if max_altitude is not None:
+                    mask &= elevation < max_altitude
+        self.rasters[output] = np.where(mask, 1.0, np.nan)
+
+    def get_mask(self, mask: Optional[str]):
+        """ Boolean array, True where the mask raster has data. """
+        if mask is None:
+            return np.ones((self.region["rows"], self.region["cols"]), bool)
+        return ~np.isnan(self.get_raster(mask))
+
+    def interpolate(self,
+                    points: str,
+                    column: str,
+                    output: str,
+                    mask: Optional[str] = None,
+                    number_of_points: Optional[int] = 3,
+                    power: Optional[float] = 2.0):
+        df = self.points[points]
+        df = df[df[column].notna()]
+        point_coords = df.iloc[:, :2].to_numpy(dtype=float)
+        cells = self.get_mask(mask)
+        weights = self.get_weight_matrix(point_coords, cells,
+                                         number_of_points, power)
+        surface = np.full(cells.shape, np.nan)
+        surface[cells] = weights @ df[column].to_numpy(dtype=float)
+        self.rasters[output] = surface
+        return self.stats(output)
+
+    def get_weight_matrix(self,
+                          point_coords: np.ndarray,
+                          cells: np.ndarray,
+                          number_of_points: int,
+                          power: float):
+        """ IDW weights (see idw.idw_weight_matrix), kept for all columns
+            interpolated on the same points, region and mask. """
+        key = cache.hash_key(point_coords, cache.region_key(self.region),
+                             cells, number_of_points, power)
+        if key not in self._weight_matrices:
+            eastings, northings = idw.region_cell_centers(self.region)
+            self._weight_matrices[key] = idw.idw_weight_matrix(
+                point_coords=point_coords,
+                target_coords=np.column_stack((eastings[cells],
+                                               northings[cells])),
+                number_of_points=number_of_points,
+                power=power)
+        return self._weight_matrices[key]
+
+    def clip(self,
+             raster: str,
+             output: str,
+             mask: Optional[str] = None,
+             min_value: Optional[float] = None,
+             max_value: Optional[float] = None):
+        values = self.get_raster(raster)
+        keep = self.get_mask(mask) & ~np.isnan(values)
+        with np.errstate(invalid="ignore"):
+            if min_value is not None:
+                keep &= values > min_value
+            if max_value is not None:
+                keep &= values < max_value
+        self.rasters[output] = np.where(keep, values, np.nan)
+
+    def stats(self, raster: str):
+        values = self.get_raster(raster)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return {"n": 0.0, "min": np.nan, "max": np.nan, "mean": np.nan}
+        return {key: float(value)
+                for key, value in idw.get_array_stats(values).items()}
+
+    def load_rasters(self, raster_maps: list):
+        for raster_map in raster_maps:
+            self.add_raster(raster_map,
+                            garray.array(mapname=raster_map, null="nan"))
+
+    def save_to_mapset(self, rasters: list, points: list):
+        """ Write rasters as raster maps, in the current region, which must
+            be the one set with set_region, and point sets as vector maps. """
+        for name in rasters:
+            # NaN is the null value of floating point GRASS rasters
+            raster = garray.array()
+            raster[...] = self.get_raster(name)
+            raster.write(mapname=name, overwrite=True)
+        for name in points:
+            pts.stream_to_vector(dfs=[self.points[name]],
+                                 output_map=name,
+                                 columns=get_vector_columns(self.points[name]))
+
+    def get_transform(self):
+        return from_origin(self.region["w"], self.region["n"],
+                           self.region["ewres"], self.region["nsres"])
+
+    def read_raster(self,
+                    name: str,
+                    path: os.PathLike,
+                    band: Optional[int] = 1):
+        """ Add a raster read from a file (e.g., GeoTIFF), resampled to the
+            region with nearest neighbour, as GRASS GIS does. """
+        require_rasterio()
+        values = np.full((self.region["rows"], self.region["cols"]), np.nan)
+        with rasterio.open(path) as source:
+            reproject(source=rasterio.band(source, band),
+                      destination=values,
+                      src_nodata=source.nodata,
+                      dst_transform=self.get_transform(),
+                      dst_crs=self.crs or source.crs,
+                      dst_nodata=np.nan,
+                      resampling=Resampling.nearest)
+        self.rasters[name] = values
+
+    def export(self, raster: str, outfile: os.PathLike):
+        require_rasterio()
+        values = self.get_raster(raster)
+        with rasterio.open(pathlib.Path(outfile), "w",
+                           driver="GTiff",
+                           height=values.shape[0],
+                           width=values.shape[1],
+                           count=1,
+                           dtype="float64",
+                           crs=self.crs,
+                           transform=self.get_transform(),
+                           nodata=np.nan) as destination:
+            destination.write(values, 1)
+
+
+def get_vector_columns(df: pd.DataFrame):
+    """ v.in.ascii column definitions for a table of points, named as its
+        columns. """
+    return ", ".join(f"{column} double precision" for column in df.columns)
+
+
+def require_rasterio():
+    if rasterio is None:
+        raise ImportError("rasterio is needed to read and write raster"
+                          " files in memory, install it with"
+                          " 'poetry install -E raster'")
+
+
+def get_backend(name: Optional[str] = k.GRASS_BACKEND, **kwargs):
+    """ Backend by name (see k.BACKENDS); kwargs go to its constructor. """
+    backends = {k.GRASS_BACKEND: GrassBackend,
+                k.MEMORY_BACKEND: MemoryBackend}
+    if name not in backends:
+        raise ValueError(f"Unknown backend '{name}', "
+                         f"use one of {sorted(k.BACKENDS)}")
+    return backends[name](**kwargs)
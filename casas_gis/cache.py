@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Keys and file locations for results that are cached across variables,
+    years and runs (see k.CACHE_DIR). Keys are content hashes, so a cached
+    result is reused only when all of its inputs are unchanged.
+    Interpolated rasters are cached as raster maps in the mapping mapset
+    (see k.CACHED_RASTER_PREFIX), with an index file that keeps their
+    statistics and last use, so that the least recently used ones are
+    removed when the cache grows beyond k.RASTER_CACHE_SIZE. Region
+    settings are saved with g.region save (see k.CACHED_REGION_PREFIX). """
+
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+import numpy as np
+import constants as k
+import gis_init as ini
+
+from typing import Optional
+
+grass = ini.GrassModule("grass.script")
+
+REGION_KEYS = ("n", "s", "e", "w", "nsres", "ewres", "rows", "cols")
+
+
+def hash_key(*parts):
+    """ Hex digest of any mix of NumPy arrays, dictionaries, strings and
+        numbers. Arrays are hashed by dtype, shape and content. """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            array = np.ascontiguousarray(part)
+            digest.update(f"{array.dtype}{array.shape}".encode())
+            digest.update(array.tobytes())
+        elif isinstance(part, dict):
+            digest.update(json.dumps(part, sort_keys=True,
+                                     default=str).encode())
+        else:
+            digest.update(repr(part).encode())
+        # Separator, so that ("ab", "c") and ("a", "bc") differ
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def region_key(region: dict):
+    """ Part of a grass.region() dictionary that defines the cell grid. """
+    return {key: region[key] for key in REGION_KEYS}
+
+
+def cache_file(kind: str,
+               key: str,
+               suffix: str,
+               cache_dir: Optional[str] = None):
+    """ Path of a cached file of a given kind (e.g., 'idw_weights'). """
+    cache_dir = pathlib.Path(k.CACHE_DIR if cache_dir is None else cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir / f"{kind}_{key[:32]}{suffix}"
+
+
+@contextlib.contextmanager
+def atomic_file(path: os.PathLike,
+                mode: Optional[str] = "wb"):
+    """ File object to write path through a temporary file in the same
+        directory, which replaces path only once writing is done, so that
+        neither an interrupted run nor another process reading path sees a
+        partial file. """
+    path = pathlib.Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent,
+                                    prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_name, path)
+    except BaseException:
+        pathlib.Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def touch_cache_file(path: os.PathLike):
+    """ Mark a cached file as used, see prune_cache_files. """
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)
+
+
+def prune_cache_files(kind: str,
+                      suffix: str,
+                      max_files: int,
+                      cache_dir: Optional[str] = None):
+    """ Remove cached files of a given kind beyond max_files, least recently
+        used (i.e., modified, see touch_cache_file) first. """
+    cache_dir = pathlib.Path(k.CACHE_DIR if cache_dir is None else cache_dir)
+    cached_files = []
+    for path in cache_dir.glob(f"{kind}_*{suffix}"):
+        with contextlib.suppress(FileNotFoundError):
+            cached_files.append((path.stat().st_mtime, path))
+    cached_files.sort()
+    for _, path in cached_files[:-max_files]:
+        path.unlink(missing_ok=True)
+
+
+def get_raster_index_file():
+    """ Index of cached rasters for the current location and mapset. """
+    grass_env = grass.gisenv()
+    return cache_file(f"rasters_{grass_env['LOCATION_NAME']}",
+                      grass_env["MAPSET"], ".json")
+
+
+def read_raster_index():
+    index_file = get_raster_index_file()
+    if not index_file.exists():
+        return {}
+    with open(index_file) as f:
+        return json.load(f)
+
+
+def write_raster_index(raster_index: dict):
+    with atomic_file(get_raster_index_file(), "w") as f:
+        json.dump(raster_index, f, indent=1)
+
+
+def restore_raster(key: str,
+                   output_map: str):
+    """ Copy the cached raster for key to output_map. Returns the raster
+        statistics stored with it, or None if there is no valid entry. A
+        quantile sketch stored with it is returned under "sketch". """
+    raster_index = read_raster_index()
+    entry = raster_index.get(key)
+    if entry is None:
+        return None
+    if not grass.find_file(entry["raster"], element="cell",
+                           mapset=".")["name"]:
+        # Cached raster was removed outside of the cache
+        del raster_index[key]
+        write_raster_index(raster_index)
+        return None
+    grass.run_command("g.copy", overwrite=True, quiet=True,
+                      raster=f"{entry['raster']},{output_map}")
+    entry["last_used"] = time.time()
+    write_raster_index(raster_index)
+    print(f"Reusing cached raster for {output_map}")
+    if "sketch" in entry:
+        return {**entry["stats"], "sketch": entry["sketch"]}
+    return entry["stats"]
+
+
+def store_raster(key: str,
+                 raster_map: str,
+                 raster_stats: dict,
+                 max_entries: Optional[int] = k.RASTER_CACHE_SIZE,
+                 sketch: Optional[dict] = None):
+    """ Add a copy of raster_map to the cache under key, then remove least
+        recently used cached rasters beyond max_entries. The key is also
+        recorded in the metadata of raster_map and of its copy (see
+        get_raster_key). sketch is the state of a quantile sketch of the
+        raster cells (see sketch.QuantileSketch.to_dict). """
+    set_raster_key(raster_map, key)
+    cached_raster = f"{k.CACHED_RASTER_PREFIX}{key[:16]}"
+    grass.run_command("g.copy", overwrite=True, quiet=True,
+                      raster=f"{raster_map},{cached_raster}")
+    raster_index = read_raster_index()
+    raster_index[key] = {"raster": cached_raster,
+                         "source": raster_map,
+                         "stats": {name: float(value) for name, value
+                                   in raster_stats.items()},
+                         "last_used": time.time()}
+    if sketch is not None:
+        raster_index[key]["sketch"] = sketch
+    least_recently_used = sorted(raster_index,
+                                 key=lambda x: raster_index[x]["last_used"])
+    for old_key in least_recently_used[:-max_entries]:
+        grass.run_command("g.remove", flags="f", quiet=True,
+                          type="raster",
+                          name=raster_index.pop(old_key)["raster"])
+    write_raster_index(raster_index)
+
+
+def set_raster_key(raster_map: str,
+                   key: str):
+    """ Record the cache key of a raster as its source2 metadata field.
+        g.copy keeps it, so rasters restored from the cache have it too,
+        while it is gone once the raster is written again. """
+    grass.run_command("r.support", quiet=True,
+                      map=raster_map,
+                      source2=f"{k.CACHE_KEY_TAG}{key}")
+
+
+def get_raster_key(raster_map: str):
+    """ Cache key a raster was stored or restored under, or None, so that
+        results derived from it can be keyed without reading its cells. """
+    source = grass.raster_info(raster_map).get("source2") or ""
+    source = source.strip('"')
+    if not source.startswith(k.CACHE_KEY_TAG):
+        return None
+    return source[len(k.CACHE_KEY_TAG):]
+
+
+def get_input_raster_key(raster_map: str):
+    """ Key of an input raster (e.g., elevation) that changes when the
+        raster is imported again or edited, without reading its cells: its
+        cell file, whose path holds database, location and mapset, with the
+        size and time of that file, and its r.info metadata. """
+    cell_file = grass.find_file(raster_map, element="cell")["file"]
+    if not cell_file:
+        raise ValueError(f"Raster map <{raster_map}> not found")
+    cell_stat = os.stat(cell_file)
+    return hash_key(cell_file, cell_stat.st_size, cell_stat.st_mtime_ns,
+                    grass.raster_info(raster_map))
+
+
+def clear_raster_cache():
+    """ Remove all cached rasters of the current mapset and their index. """
+    grass.run_command("g.remove", flags="f", verbose=True,
+                      type="raster", pattern=f"{k.CACHED_RASTER_PREFIX}*")
+    get_raster_index_file().unlink(missing_ok=True)
+
+
+def store_region(key: str):
+    """ Save the current region under key. """
+    grass.run_command("g.region", overwrite=True,
+                      save=f"{k.CACHED_REGION_PREFIX}{key[:16]}")
+
+
+def restore_region(key: str):
+    """ Set the current region to the one saved under key. Returns False,
+        leaving the region as it is, when there is none. """
+    saved_region = f"{k.CACHED_REGION_PREFIX}{key[:16]}"
+    if not grass.find_file(saved_region, element="windows",
+                           mapset=".")["name"]:
+        return False
+    grass.run_command("g.region", region=saved_region)
+    print(f"Reusing cached region {saved_region}")
+    return True
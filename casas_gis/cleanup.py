@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -15,17 +15,12 @@
 # Clenaup routine?
 # See https://grasswiki.osgeo.org/wiki/Converting_Bash_scripts_to_Python
 
-import os
 import constants as k
+import gis_init as ini
+import cache
 
-from dotenv import load_dotenv
-
-load_dotenv()  # needed for grass_session
-
-from grass_session import Session  # noqa E402
-import grass.script as grass  # noqa E402
-
-grassbin = os.getenv("GRASSBIN")
+Session = ini.Session
+grass = ini.GrassModule("grass.script")
 
 
 def print_grass_environment():
@@ -64,3 +59,8 @@ def clean_up_rasters():
     grass.run_command("g.remove",
                       flags="f", verbose=True,
                       type="raster", pattern=f"{k.BSPLINE_PREFIX}*")
+
+
+def clean_up_raster_cache():
+    """ Remove interpolated rasters kept across runs (see cache.py). """
+    cache.clear_raster_cache()
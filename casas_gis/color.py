@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -20,9 +20,19 @@
 # https://jiffyclub.github.io/palettable/
 # https://seaborn.pydata.org/
 
+import functools
+import os
+import pathlib
+import numpy as np
 import constants as k
+import gis_init as ini
+import sketch
 
-import grass.script as grass  # noqa E402
+from PIL import ImageColor
+from typing import Optional
+
+grass = ini.GrassModule("grass.script")
+garray = ini.GrassModule("grass.script.array")
 
 
 def set_color_rule(raster_map: str,
@@ -31,3 +41,232 @@ def set_color_rule(raster_map: str,
                       # flags="ge",
                       map=raster_map,
                       rules=k.COLOR_DIR / color_rule)
+
+
+def read_color_rule(color_rule: str):
+    """ Breakpoints of a color rules file (see r.colors rules option) as a
+        list of (value, is_percent, (r, g, b)). Only value/color lines are
+        read; comments, nv, default and end lines are skipped. """
+    breakpoints = []
+    with open(k.COLOR_DIR / color_rule) as f:
+        for line in f:
+            fields = line.split()
+            if (not fields or fields[0].startswith("#") or
+                    fields[0] in ("nv", "default", "end")):
+                continue
+            value, color = fields[0], fields[1]
+            is_percent = value.endswith("%")
+            breakpoints.append((float(value.rstrip("%")), is_percent,
+                                parse_rgb(color)))
+    return breakpoints
+
+
+def parse_rgb(color: str):
+    """ (r, g, b) of a color given as r:g:b or by name. """
+    if ":" in color:
+        return tuple(int(c) for c in color.split(":"))
+    return ImageColor.getrgb(color)[:3]
+
+
+@functools.lru_cache(maxsize=None)
+def get_color_table(color_rule: str,
+                    min_value: float,
+                    max_value: float,
+                    size: int = 256):
+    """ Lookup table of size colors (uint8 array shaped (size, 3)) for
+        equally spaced values from min_value to max_value, interpolated
+        between color rule breakpoints as r.colors does. Percentages are
+        relative to the min_value to max_value range. """
+    breakpoints = read_color_rule(color_rule)
+    values = [min_value + (max_value - min_value) * value / 100
+              if is_percent else value
+              for value, is_percent, _ in breakpoints]
+    colors = np.array([rgb for _, _, rgb in breakpoints], dtype=float)
+    table_values = np.linspace(min_value, max_value, size)
+    return np.column_stack([np.interp(table_values, values, colors[:, c])
+                            for c in range(3)]).round().astype(np.uint8)
+
+
+def get_rasters_sketch(raster_maps: list,
+                       compression: Optional[int] = 100):
+    """ Quantile sketch of the cells of all raster_maps, read one raster at
+        a time, so memory holds a single raster plus the sketch. """
+    rasters_sketch = sketch.QuantileSketch(compression)
+    for raster_map in raster_maps:
+        rasters_sketch.update(garray.array(mapname=raster_map, null="nan"))
+    return rasters_sketch
+
+
+def merge_sketches(raster_maps: list,
+                   sketches: Optional[dict] = None):
+    """ One quantile sketch of all raster_maps from sketches made while
+        interpolating (see interpolation.run_interpolation_jobs), or None
+        when one of them is missing. """
+    if sketches is None or any(raster_map not in sketches
+                               for raster_map in raster_maps):
+        return None
+    merged_sketch = sketch.QuantileSketch(sketches[raster_maps[0]]
+                                          .compression)
+    for raster_map in raster_maps:
+        merged_sketch.merge(sketches[raster_map])
+    return merged_sketch
+
+
+def get_range_color_rule(color_rule: str,
+                         min_value: float,
+                         max_value: float,
+                         abs_min: Optional[float] = None,
+                         abs_max: Optional[float] = None,
+                         outlier_low: Optional[str] = None,
+                         outlier_high: Optional[str] = None):
+    """ Text of a color rule with breakpoints turned into values from
+        min_value to max_value, as multiColorRule.pl did for the overall
+        range of a batch. When the range is narrower than the data
+        (abs_min, abs_max), values beyond it get the end colors or, as in
+        getBoxplotColorRule.pl, the outlier_low and outlier_high colors.
+        Outlier colors stop just short of min_value and max_value, so that
+        no value has two breakpoints. """
+    breakpoints = read_color_rule(color_rule)
+    # Gap between an outlier band and the rule, well below the precision
+    # of the data yet kept apart by format_value
+    gap = 1e-7 * (max(abs(min_value), abs(max_value), max_value - min_value)
+                  or 1)
+    lines = []
+    if abs_min is not None and abs_min < min_value - gap:
+        if outlier_low is None:
+            lines.append(format_line(abs_min, breakpoints[0][2]))
+        else:
+            low_color = parse_rgb(outlier_low)
+            lines.append(format_line(abs_min, low_color))
+            lines.append(format_line(min_value - gap, low_color))
+    for value, is_percent, rgb in breakpoints:
+        if is_percent:
+            value = min_value + (max_value - min_value) * value / 100
+        lines.append(format_line(value, rgb))
+    if abs_max is not None and abs_max > max_value + gap:
+        if outlier_high is None:
+            lines.append(format_line(abs_max, breakpoints[-1][2]))
+        else:
+            high_color = parse_rgb(outlier_high)
+            lines.append(format_line(max_value + gap, high_color))
+            lines.append(format_line(abs_max, high_color))
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+
+def format_line(value: float,
+                rgb: tuple):
+    """ Line of a color rules file, with enough digits to keep values that
+        differ by a relative 1e-7 apart. """
+    return f"{value:.10g} {format_rgb(rgb)}"
+
+
+def format_rgb(rgb: tuple):
+    return ":".join(str(c) for c in rgb)
+
+
+def set_shared_color_rule(raster_maps: list,
+                          color_rule: str,
+                          low_cut: Optional[float] = None,
+                          high_cut: Optional[float] = None,
+                          quantile_range: Optional[tuple] = None,
+                          rasters_sketch: Optional[sketch.QuantileSketch] =
+                          None):
+    """ Apply one color rule adjusted to the overall range of all
+        raster_maps with a single r.colors call, so that all maps share the
+        same legend. The range is the overall min and max, or the
+        quantile_range quantiles (e.g., (0.02, 0.98)) to keep a few extreme
+        cells from washing out the colors, optionally cut at low_cut and
+        high_cut. Returns the (min, max) range of the rule. """
+    if rasters_sketch is None:
+        rasters_sketch = get_rasters_sketch(raster_maps)
+    if quantile_range is None:
+        min_value, max_value = rasters_sketch.min, rasters_sketch.max
+    else:
+        min_value, max_value = rasters_sketch.quantile(quantile_range)
+    if low_cut is not None:
+        min_value = max(min_value, low_cut)
+    if high_cut is not None:
+        max_value = min(max_value, high_cut)
+    rule = get_range_color_rule(color_rule,
+                                float(min_value),
+                                float(max_value),
+                                abs_min=float(rasters_sketch.min),
+                                abs_max=float(rasters_sketch.max))
+    grass.write_command("r.colors",
+                        map=",".join(raster_maps),
+                        rules="-",
+                        stdin=rule)
+    return float(min_value), float(max_value)
+
+
+def get_boxplot_stats(values_sketch: sketch.QuantileSketch,
+                      whisker_coefficient: Optional[float] = 1.5):
+    """ Box plot statistics as R boxplot.stats, from a quantile sketch:
+        quartiles, and whiskers whisker_coefficient times the interquartile
+        range beyond them. Whiskers end at the limits themselves (capped at
+        min and max), not at the most extreme values within the limits,
+        which a sketch does not keep. """
+    q1, median, q3 = values_sketch.quantile([0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    return {"min": float(values_sketch.min),
+            "whisker_low": float(max(values_sketch.min,
+                                     q1 - whisker_coefficient * iqr)),
+            "q1": float(q1),
+            "median": float(median),
+            "q3": float(q3),
+            "whisker_high": float(min(values_sketch.max,
+                                      q3 + whisker_coefficient * iqr)),
+            "max": float(values_sketch.max)}
+
+
+def write_boxplot_color_rule(color_rule: str,
+                             boxplot_stats: dict,
+                             name: str,
+                             outlier_low: Optional[str] = None,
+                             outlier_high: Optional[str] = None,
+                             rule_dir: Optional[os.PathLike] = None):
+    """ Port of getBoxplotColorRule.pl (non-divergent rules): colors of
+        color_rule spread between the whiskers, outliers below and above
+        them in outlier_low and outlier_high (default: k.OUTLIER_LOW and
+        k.OUTLIER_HIGH). Returns the path of the rule file. """
+    outlier_low = outlier_low or k.OUTLIER_LOW
+    outlier_high = outlier_high or k.OUTLIER_HIGH
+    rule_dir = k.RENDER_DIR if rule_dir is None else rule_dir
+    rule_file = pathlib.Path(rule_dir) / f"{name}_boxplot_color_rule.txt"
+    with open(rule_file, "w") as f:
+        f.write(f"# {color_rule} spread between box plot whiskers\n"
+                f"# to rasters {name}\n")
+        f.write(get_range_color_rule(color_rule,
+                                     boxplot_stats["whisker_low"],
+                                     boxplot_stats["whisker_high"],
+                                     abs_min=boxplot_stats["min"],
+                                     abs_max=boxplot_stats["max"],
+                                     outlier_low=outlier_low,
+                                     outlier_high=outlier_high))
+    return rule_file
+
+
+def set_boxplot_color_rule(raster_maps: list,
+                           color_rule: str,
+                           values_sketch: Optional[sketch.QuantileSketch] =
+                           None,
+                           outlier_low: Optional[str] = None,
+                           outlier_high: Optional[str] = None):
+    """ Apply a box plot color rule (see write_boxplot_color_rule) to all
+        raster_maps with a single r.colors call. Statistics come from
+        values_sketch, e.g., made while interpolating (see
+        interpolation.run_interpolation_jobs), or else from all raster
+        cells. Returns the box plot statistics. """
+    if values_sketch is None:
+        values_sketch = get_rasters_sketch(raster_maps)
+    boxplot_stats = get_boxplot_stats(values_sketch)
+    rule_file = write_boxplot_color_rule(color_rule,
+                                         boxplot_stats,
+                                         name=raster_maps[0],
+                                         outlier_low=outlier_low,
+                                         outlier_high=outlier_high)
+    grass.run_command("r.colors",
+                      map=",".join(raster_maps),
+                      rules=rule_file)
+    return boxplot_stats
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Put maps together from image layers with Pillow, see
+    https://pillow.readthedocs.io/en/stable/reference/Image.html
+    Layers that are the same for every map (shaded relief, coastline,
+    administrative boundaries, map box) are rendered once and composited
+    with the layers that change from map to map (colored surface, points
+    and legend).
+    Maps can also be drawn entirely here from raster arrays, applying a
+    color lookup table (see color.get_color_table) and drawing points and
+    legend with Pillow, with no GRASS GIS display command involved. """
+
+import os
+import numpy as np
+import constants as k
+
+from typing import Optional
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+LEGEND_FONTS = ("Arial.ttf", "DejaVuSans.ttf")
+
+
+def read_layer(path: os.PathLike):
+    """ Image layer as RGBA, copied so that the file can be removed. """
+    with Image.open(path) as image:
+        return image.convert("RGBA")
+
+
+def blend_intensity(surface: Image.Image,
+                    relief: Image.Image):
+    """ Combine a colored surface with shaded relief the way d.his does:
+        each color is scaled by the relief intensity. Where the surface is
+        transparent (NULL cells) the relief shows through as grey, and the
+        result is transparent where the relief is. """
+    intensity = np.asarray(relief.convert("L"), dtype=float) / 255
+    relief_alpha = np.asarray(relief.convert("RGBA"))[..., 3]
+    return Image.fromarray(shade(np.asarray(surface.convert("RGBA")),
+                                 intensity,
+                                 relief_alpha))
+
+
+def shade(surface_rgba: np.ndarray,
+          intensity: np.ndarray,
+          alpha: np.ndarray):
+    """ Array version of blend_intensity. Scaling red, green and blue by
+        intensity (0 to 1) is the same as scaling the value (V) of the
+        color in HSV, leaving hue and saturation as they are. """
+    surface_rgba = surface_rgba.astype(float) / 255
+    surface_alpha = surface_rgba[..., 3:]
+    # Transparent surface cells are white, i.e., plain intensity
+    color = surface_rgba[..., :3] * surface_alpha + (1 - surface_alpha)
+    rgb = color * intensity[..., np.newaxis] * 255
+    return np.dstack((rgb.round().astype(np.uint8),
+                      alpha.astype(np.uint8)))
+
+
+def apply_color_table(values: np.ndarray,
+                      color_table: np.ndarray,
+                      min_value: float,
+                      max_value: float,
+                      outlier_colors: Optional[tuple] = None):
+    """ RGBA array of raster values colored with a lookup table covering
+        min_value to max_value. NaN (NULL) cells are transparent. Values
+        beyond the range get the end colors of the table or, with
+        outlier_colors, a pair of (r, g, b) colors for values below and
+        above it (see color.write_boxplot_color_rule). """
+    rgba = np.zeros(values.shape + (4,), dtype=np.uint8)
+    valid = ~np.isnan(values)
+    value_range = max_value - min_value
+    if value_range > 0:
+        scaled = (values[valid] - min_value) / value_range
+    else:
+        scaled = np.zeros(np.count_nonzero(valid))
+    indices = np.clip(np.round(scaled * (len(color_table) - 1)),
+                      0, len(color_table) - 1).astype(int)
+    rgba[valid, :3] = color_table[indices]
+    rgba[valid, 3] = 255
+    if outlier_colors is not None:
+        low_color, high_color = outlier_colors
+        # Comparisons with NaN are False, so NULL cells stay transparent
+        with np.errstate(invalid="ignore"):
+            rgba[values < min_value, :3] = low_color
+            rgba[values > max_value, :3] = high_color
+    return rgba
+
+
+def relief_intensity(relief: np.ndarray):
+    """ Shaded relief values scaled to 0-1 over their range, as a grey
+        color table does, and opacity (NULL cells are transparent). """
+    valid = ~np.isnan(relief)
+    low, high = np.nanmin(relief), np.nanmax(relief)
+    intensity = np.zeros(relief.shape)
+    if high > low:
+        intensity[valid] = (relief[valid] - low) / (high - low)
+    else:
+        intensity[valid] = 1.0
+    return intensity, np.where(valid, 255, 0)
+
+
+def map_frame(region: dict,
+              size: tuple):
+    """ Part of an image of size (width, height) where d.* commands draw
+        the region, as (left, top, width, height) in pixels: the region
+        scaled to fit, keeping its aspect ratio, and centered. The rest of
+        the image is the room left for the legend (see
+        grass.set_output_image). """
+    width, height = size
+    region_width = region["e"] - region["w"]
+    region_height = region["n"] - region["s"]
+    scale = min(width / region_width, height / region_height)
+    frame_width, frame_height = region_width * scale, region_height * scale
+    return ((width - frame_width) / 2, (height - frame_height) / 2,
+            frame_width, frame_height)
+
+
+def map_pixels(x: np.ndarray,
+               y: np.ndarray,
+               region: dict,
+               frame: tuple):
+    """ Pixel column and row of coordinates on an image where the region
+        is drawn in frame (see map_frame). """
+    left, top, width, height = frame
+    cols = left + (x - region["w"]) / (region["e"] - region["w"]) * width
+    rows = top + (region["n"] - y) / (region["n"] - region["s"]) * height
+    return cols, rows
+
+
+def draw_points(image: Image.Image,
+                cols: np.ndarray,
+                rows: np.ndarray,
+                size: Optional[int] = 15,
+                width: Optional[int] = 2,
+                color: Optional[str] = "white",
+                fill_color: Optional[str] = "black"):
+    """ Draw points as circles, the way d.vect icon=basic/point does. """
+    draw = ImageDraw.Draw(image)
+    radius = size / 2
+    for col, row in zip(cols, rows):
+        draw.ellipse((col - radius, row - radius, col + radius, row + radius),
+                     fill=fill_color, outline=color, width=width)
+
+
+def get_legend_font(size: int):
+    for font in LEGEND_FONTS:
+        try:
+            return ImageFont.truetype(font, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def draw_legend(image: Image.Image,
+                color_table: np.ndarray,
+                min_value: float,
+                max_value: float,
+                at: Optional[tuple] = (6, 10, 20, 80),
+                labelnum: Optional[int] = 5,
+                color: Optional[str] = "black"):
+    """ Draw a smooth horizontal color bar with tick marks and labels, the
+        way d.legend -st does. at is bottom, top, left, right as percent of
+        the image, with 0,0 at lower left (see grass.map_legend). """
+    width, height = image.size
+    bottom, top, left, right = at
+    x0, x1 = round(left / 100 * width), round(right / 100 * width)
+    y0 = round((1 - top / 100) * height)
+    y1 = round((1 - bottom / 100) * height)
+    indices = np.linspace(0, len(color_table) - 1, x1 - x0).round()
+    bar = np.repeat(color_table[indices.astype(int)][np.newaxis],
+                    y1 - y0, axis=0)
+    image.paste(Image.fromarray(bar).convert("RGBA"), (x0, y0))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((x0, y0, x1, y1), outline=color)
+    font = get_legend_font(max(y1 - y0, 10))
+    tick_length = (y1 - y0) // 3
+    for label_x, label_value in zip(np.linspace(x0, x1, labelnum),
+                                    np.linspace(min_value, max_value,
+                                                labelnum)):
+        draw.line((label_x, y0 - tick_length, label_x, y0),
+                  fill=color)
+        # Labels go above the bar, which sits near the bottom edge
+        draw.text((label_x, y0 - tick_length), f"{label_value:.4g}",
+                  fill=color, font=font, anchor="md")
+
+
+def render_map(values: np.ndarray,
+               relief: np.ndarray,
+               color_table: np.ndarray,
+               size: tuple,
+               cols: np.ndarray,
+               rows: np.ndarray,
+               overlay: Optional[Image.Image] = None,
+               background_color: Optional[str] = k.NO_BG_COLOR,
+               legend_at: Optional[tuple] = (6, 10, 20, 80),
+               value_range: Optional[tuple] = None,
+               frame: Optional[tuple] = None,
+               outlier_colors: Optional[tuple] = None):
+    """ Map image from arrays of raster values and shaded relief of the
+        same region: surface colored through color_table and blended with
+        the relief, then the overlay (e.g., coastline), points at pixel
+        cols and rows and legend. The color table covers value_range, by
+        default the range of the values, and values beyond it get the end
+        colors or outlier_colors (see apply_color_table). The surface is
+        drawn in frame (see map_frame), by default the whole image. """
+    if value_range is None:
+        value_range = (np.nanmin(values), np.nanmax(values))
+    min_value, max_value = value_range
+    intensity, alpha = relief_intensity(relief)
+    surface = shade(apply_color_table(values, color_table,
+                                      min_value, max_value,
+                                      outlier_colors=outlier_colors),
+                    intensity, alpha)
+    left, top, frame_width, frame_height = ((0, 0, *size) if frame is None
+                                            else frame)
+    surface_layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    surface_layer.paste(
+        Image.fromarray(surface).resize((round(frame_width),
+                                         round(frame_height)),
+                                        Image.NEAREST),
+        (round(left), round(top)))
+    layers = [surface_layer]
+    if overlay is not None:
+        layers.append(overlay)
+    top = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw_points(top, cols, rows)
+    draw_legend(top, color_table, min_value, max_value, at=legend_at)
+    layers.append(top)
+    return composite_layers(layers, background_color=background_color)
+
+
+def composite_layers(layers: list,
+                     background_color: Optional[str] = k.NO_BG_COLOR):
+    """ Stack RGBA layers of the same size, first one at the bottom, on a
+        background color or on a transparent background. """
+    if background_color == k.NO_BG_COLOR:
+        image = Image.new("RGBA", layers[0].size, (0, 0, 0, 0))
+    else:
+        image = Image.new("RGBA", layers[0].size,
+                          ImageColor.getrgb(background_color))
+    for layer in layers:
+        image = Image.alpha_composite(image, layer)
+    return image
@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -15,38 +15,77 @@
 import pathlib
 import locations as loc
 
-# Specify (existing) locations and mapsets
-latlong_session = loc.colombia["latlong_session"]
-mapping_session = loc.colombia["mapping_session"]
-mapping_data = loc.colombia["mapping_data"]
-legend_settings = loc.colombia["legend_settings"]
-region = loc.colombia["region_settings"]
+# Entry of locations.py used unless another one is chosen with use_location.
+# Location settings are looked up on first use (see __getattr__), so that
+# importing this module has no side effects.
+DEFAULT_LOCATION = "colombia"
+LOCATION_SETTINGS = {"latlong_session": "latlong_session",
+                     "mapping_session": "mapping_session",
+                     "mapping_data": "mapping_data",
+                     "legend_settings": "legend_settings",
+                     "region": "region_settings"}
+
+
+def use_location(location_name: str):
+    """ Point the location settings (latlong_session, mapping_session,
+        mapping_data, legend_settings and region) to an entry of
+        locations.py, e.g., in each process of a batch run (see
+        grass.run_locations). """
+    set_location(getattr(loc, location_name))
+
+
+def set_location(location: dict):
+    """ Like use_location, for a location dictionary with the same keys as
+        the entries of locations.py (e.g., a location made on the fly). """
+    for setting, key in LOCATION_SETTINGS.items():
+        globals()[setting] = location[key]
+
+
+def __getattr__(name: str):
+    """ Location settings of DEFAULT_LOCATION when none was chosen. """
+    if name not in LOCATION_SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute"
+                             f" {name!r}")
+    use_location(DEFAULT_LOCATION)
+    return globals()[name]
+
 
 # Contents of the following dirs should be copied to a results directory
 # and cleaned up for the next run?
 
 # Temporary directory for text files
 TMP_DIR = pathlib.Path(__file__).parent / "tmp"
-pathlib.Path(TMP_DIR).mkdir(parents=True, exist_ok=True)
+
+# Directory for intermediate images and PostScript files made while
+# drawing maps
+RENDER_DIR = TMP_DIR
 
 # Directory for GIS output files
 OUT_DIR = pathlib.Path(__file__).parent / "out"
-pathlib.Path(OUT_DIR).mkdir(parents=True, exist_ok=True)
 
 # Directory for PNG output files
 PNG_DIR = OUT_DIR / "png"
-pathlib.Path(PNG_DIR).mkdir(parents=True, exist_ok=True)
 
 # Directory for PostScript output files
 PS_DIR = OUT_DIR / "postscript"
-pathlib.Path(PS_DIR).mkdir(parents=True, exist_ok=True)
+
+# Directories for other vector output files (see export.py)
+EPS_DIR = OUT_DIR / "eps"
+PDF_DIR = OUT_DIR / "pdf"
+SVG_DIR = OUT_DIR / "svg"
 
 # Directory for report files
 REPORT_DIR = OUT_DIR / "reports"
-pathlib.Path(REPORT_DIR).mkdir(parents=True, exist_ok=True)
+
+# Directory for cached intermediate results (e.g., interpolation weights)
+CACHE_DIR = pathlib.Path(__file__).parent / "cache"
 
 # Directory for color rule files
 COLOR_DIR = pathlib.Path(__file__).parent / "color_rules"
+# Box plot outliers, darker than the ends of panoply.txt as in
+# getCustomColorRule.pl (see color.write_boxplot_color_rule)
+OUTLIER_LOW = "0:0:121"
+OUTLIER_HIGH = "87:0:0"
 # pathlib.Path(REPORT_DIR).mkdir(parents=True, exist_ok=True)
 
 # Output file extensions
@@ -56,21 +95,89 @@ PS = "ps"
 EPS = "eps"
 PDF = "pdf"
 SVG = "svg"
-SUPPORTED_FILE_TYPES = {PNG, PS}
+SUPPORTED_FILE_TYPES = {PNG, PS, EPS, PDF, SVG}
+# Formats made from the Encapsulated PostScript written by ps.map
+VECTOR_FILE_TYPES = {PS, EPS, PDF, SVG}
+# PNG maps made from the ps.map output (see export.py), pixels per inch
+EXPORT_PNG_RESOLUTION = 150
+OUTPUT_DIRS = {PNG: PNG_DIR, PS: PS_DIR, EPS: EPS_DIR, PDF: PDF_DIR,
+               SVG: SVG_DIR}
+# Output of each location of a batch run goes to a subdirectory of this
+BASE_OUT_DIR = OUT_DIR
+
+
+def use_output_dir(out_dir: pathlib.Path):
+    """ Point the output directories above to subdirectories of out_dir,
+        so that locations mapped at the same time do not overwrite each
+        other's maps, reports and intermediate files. """
+    global OUT_DIR, PNG_DIR, PS_DIR, EPS_DIR, PDF_DIR, SVG_DIR
+    global REPORT_DIR, OUTPUT_DIRS, RENDER_DIR
+    OUT_DIR = pathlib.Path(out_dir)
+    PNG_DIR = OUT_DIR / "png"
+    PS_DIR = OUT_DIR / "postscript"
+    EPS_DIR = OUT_DIR / "eps"
+    PDF_DIR = OUT_DIR / "pdf"
+    SVG_DIR = OUT_DIR / "svg"
+    REPORT_DIR = OUT_DIR / "reports"
+    OUTPUT_DIRS = {PNG: PNG_DIR, PS: PS_DIR, EPS: EPS_DIR, PDF: PDF_DIR,
+                   SVG: SVG_DIR}
+    RENDER_DIR = OUT_DIR / "tmp"
+    make_dirs()
+
+
+def make_dirs():
+    """ Create the directories above, when a run starts rather than when
+        this module is imported. """
+    for directory in (TMP_DIR, OUT_DIR, *OUTPUT_DIRS.values(), REPORT_DIR,
+                      RENDER_DIR, CACHE_DIR):
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+
 
 IDW = "idw"
 BSPLINE = "bspline"
 INTERPOLATION_METHODS = {IDW, BSPLINE}
 
+# Tykhonov regularization parameters (lambda_i) tried first when tuning
+# v.surf.bspline, then refined around the best one (see interpolation.py)
+BSPLINE_COARSE_LAMBDAS = (0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+BSPLINE_CV_FOLDS = 5
+
+# Engines computing IDW surfaces (v.surf.idw or in-process, see idw.py)
+GRASS_ENGINE = "grass"
+NUMPY_ENGINE = "numpy"
+IDW_ENGINES = {GRASS_ENGINE, NUMPY_ENGINE}
+
+# Backends running pipeline stages (GRASS GIS maps or arrays, see backend.py)
+GRASS_BACKEND = "grass"
+MEMORY_BACKEND = "memory"
+BACKENDS = {GRASS_BACKEND, MEMORY_BACKEND}
+
 IMPORTED_PREFIX = "imp_"
 SELECTED_PREFIX = "sel_"
+# Attribute columns of imported points that are not model output variables
+POINT_COLUMNS = {"cat", "x", "y", "lon", "lat", "elevation"}
 
 IDW_PREFIX = "idw_"
 BSPLINE_PREFIX = "bspline_"
 INTERPOLATION_PREFIXES = {IDW_PREFIX, BSPLINE_PREFIX}
 
 DRAPE_PREFIX = "drape_"
+# Interpolated rasters kept across runs (see cache.py)
+CACHED_RASTER_PREFIX = "cache_"
+RASTER_CACHE_SIZE = 200
+# IDW weight matrices kept on disk and in memory (see idw.py)
+IDW_WEIGHTS_CACHE_SIZE = 20
+IDW_WEIGHTS_MEMORY_SIZE = 4
+# Before the cache key in raster metadata, fits in 80 chars (see cache.py)
+CACHE_KEY_TAG = "casas_gis:"
+# Mapping region settings kept across runs (see cache.py)
+CACHED_REGION_PREFIX = "cache_region_"
+CROP_MASK = "mask_crop"
+CROP_ELEVATION_MASK = "mask_crop_elevation"
 REGION_RASTER = "mapping_region"
+# Saved region and mapset prefix used by parallel workers (see parallel.py)
+SHARED_REGION = "casas_shared_region"
+TMP_MAPSET_PREFIX = "tmp_casas_"
 NO_BG_COLOR = "none"
 
 BASE_PAPER_SIDE = 5
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Turn the Encapsulated PostScript map written once by ps.map into every
+    requested format: PostScript and EPS are copies, PDF is made with
+    ps2pdf (Ghostscript), and SVG and PNG with pdftocairo (Poppler) from
+    the PDF, see
+    https://ghostscript.com/docs/9.54.0/Ps2pdf.htm
+    https://poppler.freedesktop.org/
+    Programs needed for the requested formats are checked before any map is
+    converted (see check_converters). Maps are converted in a thread pool,
+    since the work is done by external processes. """
+
+import os
+import pathlib
+import shutil
+import subprocess
+import constants as k
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# External programs needed by each format made from EPS
+CONVERTERS = {k.PDF: ("ps2pdf",),
+              k.SVG: ("ps2pdf", "pdftocairo"),
+              k.PNG: ("ps2pdf", "pdftocairo")}
+
+
+def check_converters(file_types: list):
+    """ Raise an error naming the missing programs, and the formats that
+        need them, unless all programs for file_types are installed. """
+    missing = {}
+    for file_type in file_types:
+        for program in CONVERTERS.get(file_type, ()):
+            if shutil.which(program) is None:
+                missing.setdefault(program, []).append(file_type)
+    if missing:
+        raise RuntimeError(
+            "Programs needed for the requested output formats were not"
+            " found: " + ", ".join(f"{program} ({', '.join(formats)})"
+                                   for program, formats in
+                                   missing.items()) +
+            ". ps2pdf comes with Ghostscript and pdftocairo with Poppler.")
+
+
+def export_maps(eps_files: list,
+                file_types: list,
+                n_workers: Optional[int] = None):
+    """ Convert EPS files to all file_types in parallel. Each EPS file is
+        removed once converted. Returns lists of output files, one list per
+        EPS file. """
+    check_converters(file_types)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(export_eps, eps_file, file_types)
+                   for eps_file in eps_files]
+        return [future.result() for future in futures]
+
+
+def export_eps(eps_file: os.PathLike,
+               file_types: list,
+               tmp_dir: Optional[os.PathLike] = None,
+               png_resolution: Optional[int] = k.EXPORT_PNG_RESOLUTION):
+    """ Write an EPS map in file_types to the output directory of each
+        format (see k.OUTPUT_DIRS), under the same name, then remove it.
+        A PDF only needed for SVG or PNG goes to tmp_dir (default: next to
+        the EPS file). PNG maps are png_resolution pixels per inch. """
+    eps_file = pathlib.Path(eps_file)
+    output_files = []
+    for file_type in (k.PS, k.EPS):
+        if file_type in file_types:
+            output_file = get_output_file(eps_file, file_type)
+            shutil.copyfile(eps_file, output_file)
+            output_files.append(output_file)
+    if any(file_type in file_types for file_type in (k.PDF, k.SVG, k.PNG)):
+        if k.PDF in file_types:
+            pdf_file = get_output_file(eps_file, k.PDF)
+            output_files.append(pdf_file)
+        else:
+            tmp_dir = eps_file.parent if tmp_dir is None else tmp_dir
+            pdf_file = pathlib.Path(tmp_dir) / f"{eps_file.stem}.pdf"
+        # Crop to the bounding box, not to a paper size
+        run_converter("ps2pdf", "-dEPSCrop", eps_file, pdf_file)
+        if k.SVG in file_types:
+            svg_file = get_output_file(eps_file, k.SVG)
+            run_converter("pdftocairo", "-svg", pdf_file, svg_file)
+            output_files.append(svg_file)
+        if k.PNG in file_types:
+            png_file = get_output_file(eps_file, k.PNG)
+            # With -singlefile, pdftocairo adds the .png extension
+            run_converter("pdftocairo", "-png", "-singlefile",
+                          "-r", png_resolution, pdf_file,
+                          png_file.with_suffix(""))
+            output_files.append(png_file)
+        if k.PDF not in file_types:
+            pdf_file.unlink()
+    eps_file.unlink()
+    return output_files
+
+
+def get_output_file(eps_file: pathlib.Path,
+                    file_type: str):
+    return k.OUTPUT_DIRS[file_type] / f"{eps_file.stem}.{file_type}"
+
+
+def run_converter(program: str, *args):
+    subprocess.run([program, *(str(arg) for arg in args)], check=True)
@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -12,6 +12,14 @@
 #
 #               SPDX-License-Identifier: GPL-3.0-or-later
 
+""" GRASS GIS database path and lazy access to GRASS GIS Python modules.
+    grass_session finds GRASS GIS (GRASSBIN, read from .env) and makes its
+    Python modules importable, which takes a GRASS GIS startup. Modules
+    refer to GRASS GIS through GrassModule and Session, so that this only
+    happens when a GRASS GIS stage actually runs. """
+
+import functools
+import importlib
 import pathlib
 
 # define GRASS DATABASE
@@ -19,4 +27,29 @@ import pathlib
 gisdb = pathlib.Path.home() / "grassdata"
 # the following path is the default path on MS Windows
 # gisdb = os.path.join(os.path.expanduser("~"), "Documents/grassdata")
-print(gisdb)
+
+
+@functools.lru_cache(maxsize=None)
+def import_grass_module(name: str):
+    """ Import a GRASS GIS Python module (e.g., grass.script), after
+        setting up grass_session the first time. """
+    from dotenv import load_dotenv
+    load_dotenv()  # needed for grass_session
+    importlib.import_module("grass_session")
+    return importlib.import_module(name)
+
+
+class GrassModule:
+    """ Stand-in for a GRASS GIS Python module, imported on first use of
+        one of its attributes. """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attribute: str):
+        return getattr(import_grass_module(self.name), attribute)
+
+
+def Session(*args, **kwargs):
+    """ grass_session.Session, see GrassModule. """
+    return import_grass_module("grass_session").Session(*args, **kwargs)
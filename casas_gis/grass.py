@@ -29,26 +29,46 @@
     """
 
 import os
+import functools
+import itertools
+import json
 import pathlib
+import string
+import time
+import numpy as np
+import pandas as pd
 import constants as k
+import gis_init as ini
+import locations as loc
 import cleanup
+import cache
+import composite as comp
+import export
 import interpolation as surf
+import mapcalc
 import color as clr
+import points as pts
+import input as inp
+import parallel as par
+import backend as bk
+import tracing
 
-from dotenv import load_dotenv
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
 from typing import Optional
 
-load_dotenv()  # needed for grass_session
+Session = ini.Session
+grass = ini.GrassModule("grass.script")
+garray = ini.GrassModule("grass.script.array")
 
-from grass_session import Session  # noqa E402
-import grass.script as grass  # noqa E402
 
-grassbin = os.getenv("GRASSBIN")
-
-
-def ascii_to_vector(tmp_dir=k.TMP_DIR):
+def ascii_to_vector(tmp_dir=k.TMP_DIR,
+                    wide_table: Optional[bool] = False):
     """ Import ASCII files generated in input.py module
-        to a vector file in a given GRASS GIS location. """
+        to a vector file in a given GRASS GIS location. With wide_table,
+        each file holds all selected variables of a CASAS output table (see
+        input.select_variables) and is imported once as a single vector
+        map with one attribute column per variable. """
     print('\nImport text files in temporary directory to vector maps:\n')
     pathlist = pathlib.Path(tmp_dir).rglob('*.txt')
     for path in pathlist:
@@ -60,15 +80,148 @@ def ascii_to_vector(tmp_dir=k.TMP_DIR):
                           skip=1,
                           separator='tab',
                           x=1, y=2, z=0,
-                          columns=f"lon double precision, \
-                          lat double precision, \
-                          {mapname} double precision")
+                          columns=get_point_columns(path, wide_table))
+    print('\nChecking if the imported vectors are there:\n')
+    grass.run_command("g.list",
+                      flags="p", verbose=True,
+                      type="vector", mapset=".")
+
+
+def ascii_to_projected_vector(tmp_dir=k.TMP_DIR,
+                              wide_table: Optional[bool] = False,
+                              digital_elevation_map: Optional[str] = None,
+                              altitude_cap: Optional[float] = None,
+                              lower_bound: Optional[float] = None,
+                              upper_bound: Optional[float] = None):
+    """ Import ASCII files generated in input.py module straight to the
+        current projected location. Longitude and latitude are projected
+        in bulk with pyproj (see points.py), so no lat/long location and no
+        v.proj run per vector are needed. Longitude and latitude are kept
+        as attribute columns, as they are after v.proj.
+        When digital_elevation_map is given, elevation is sampled and
+        points are filtered in memory, with the same options as
+        interpolation.select_interpolation_points, and imported directly
+        as selected vectors ready for interpolation. """
+    print('\nImport and project text files in temporary directory'
+          ' to vector maps:\n')
+    select_in_memory = digital_elevation_map is not None
+    prefix = k.SELECTED_PREFIX if select_in_memory else k.IMPORTED_PREFIX
+    crs = pts.get_location_crs()
+    pathlist = pathlib.Path(tmp_dir).rglob('*.txt')
+    for path in pathlist:
+        mapname = pathlib.Path(path).stem
+        df = pd.read_csv(path, sep='\t')
+        df_projected = pts.prepare_table(
+            df, crs,
+            value_columns=list(df.columns[2:]),
+            digital_elevation_map=digital_elevation_map,
+            altitude_cap=altitude_cap,
+            lower_bound=lower_bound,
+            upper_bound=upper_bound)
+        columns = ("x double precision, y double precision, "
+                   f"{get_point_columns(path, wide_table)}")
+        if select_in_memory:
+            columns += ", elevation double precision"
+        pts.stream_to_vector(dfs=[df_projected],
+                             output_map=f"{prefix}{mapname}",
+                             columns=columns)
     print('\nChecking if the imported vectors are there:\n')
     grass.run_command("g.list",
                       flags="p", verbose=True,
                       type="vector", mapset=".")
 
 
+def tables_to_vector(tables,
+                     wide_table: Optional[bool] = False,
+                     digital_elevation_map: Optional[str] = None,
+                     altitude_cap: Optional[float] = None,
+                     lower_bound: Optional[float] = None,
+                     upper_bound: Optional[float] = None):
+    """ Import (name, table) pairs from input.iter_tables straight to the
+        current projected location, streaming rows to v.in.ascii through
+        stdin, so that no intermediate text files are written. Chunks of
+        the same table go to the same vector map. Maps are named, and
+        points projected and selected, as in ascii_to_projected_vector. """
+    print('\nImport and project tables to vector maps:\n')
+    select_in_memory = digital_elevation_map is not None
+    prefix = k.SELECTED_PREFIX if select_in_memory else k.IMPORTED_PREFIX
+    crs = pts.get_location_crs()
+    for key, chunks in itertools.groupby(tables, key=lambda x: x[0]):
+        processes = {}
+        try:
+            for _, df in chunks:
+                for mapname, df_part in split_table(key, df,
+                                                    wide_table).items():
+                    variable_names = list(df_part.columns[2:])
+                    df_projected = pts.prepare_table(
+                        df_part, crs,
+                        value_columns=variable_names,
+                        digital_elevation_map=digital_elevation_map,
+                        altitude_cap=altitude_cap,
+                        lower_bound=lower_bound,
+                        upper_bound=upper_bound)
+                    if mapname not in processes:
+                        column_names = ["x", "y", "lon", "lat",
+                                        *variable_names]
+                        if select_in_memory:
+                            column_names.append("elevation")
+                        processes[mapname] = pts.start_vector_import(
+                            output_map=f"{prefix}{mapname}",
+                            columns=", ".join(
+                                f"{column_name} double precision"
+                                for column_name in column_names))
+                    pts.write_to_vector_import(processes[mapname],
+                                               df_projected)
+            for mapname, process in processes.items():
+                pts.finish_vector_import(process, f"{prefix}{mapname}")
+        except BaseException:
+            # No partial vector map is left, nor v.in.ascii waiting on stdin
+            for process in processes.values():
+                pts.abort_vector_import(process)
+            raise
+    print('\nChecking if the imported vectors are there:\n')
+    grass.run_command("g.list",
+                      flags="p", verbose=True,
+                      type="vector", mapset=".")
+
+
+def split_table(name: str,
+                df: pd.DataFrame,
+                wide_table: Optional[bool] = False):
+    """ Parts of a table from input.iter_tables to import as vector maps,
+        keyed by map name: the whole table or, unless wide_table, one part
+        per variable, with the variable column named after the map as in
+        files written by input.py. """
+    if wide_table:
+        return {name: df}
+    return {f"{name}_{column}": (df.iloc[:, [0, 1, i]]
+                                 .rename(columns={column:
+                                                  f"{name}_{column}"}))
+            for i, column in enumerate(df.columns[2:], 2)}
+
+
+def get_point_columns(path: os.PathLike,
+                      wide_table: Optional[bool] = False):
+    """ v.in.ascii column definitions for a file written by input.py: lon
+        and lat, then one column named after the file or, for wide tables,
+        one column per variable named as in the file header. """
+    mapname = pathlib.Path(path).stem
+    if wide_table:
+        variable_names = get_table_header(path)[2:]
+    else:
+        variable_names = [mapname]
+    variable_columns = ", ".join(f"{variable_name} double precision"
+                                 for variable_name in variable_names)
+    return ("lon double precision, lat double precision, "
+            f"{variable_columns}")
+
+
+def get_table_header(path: os.PathLike):
+    """ Column names in the first line of a tab-separated text file. """
+    with open(path) as f:
+        return f.readline().strip().split("\t")
+
+
 def project_vector_to_current_location(source_location, source_mapset,
                                        tmp_dir=k.TMP_DIR):
     """ Project imported vector from a latitude/longitude unprojected
@@ -91,10 +244,24 @@ def project_vector_to_current_location(source_location, source_mapset,
 
 def set_mapping_region(map_of_subregions,
                        column_name,
-                       selected_subregions: Optional[str] = None):
+                       selected_subregions: Optional[str] = None,
+                       use_cache: Optional[bool] = False):
     """ Define GRASS GIS region for computations mapping, including
         geographical extent and spatial resolution.
-        The 'field type' argument can be 'CHARACTER' or 'INTEGER' """
+        The 'field type' argument can be 'CHARACTER' or 'INTEGER'
+        With use_cache, region and mapping region raster made before from
+        the same location, subregions and region settings are restored
+        instead (see cache.py). """
+    key = cache.hash_key("mapping_region",
+                         grass.gisenv()["LOCATION_NAME"],
+                         map_of_subregions,
+                         column_name,
+                         selected_subregions,
+                         k.region)
+    if (use_cache and cache.restore_region(key) and
+            cache.restore_raster(key, k.REGION_RASTER) is not None):
+        print(grass.region())
+        return
     if selected_subregions is not None:
         list_of_selected_subregions = selected_subregions.split(",")
         sql_conditions = []
@@ -137,6 +304,9 @@ def set_mapping_region(map_of_subregions,
                       output=k.REGION_RASTER,
                       use="val",
                       value=1)
+    if use_cache:
+        cache.store_region(key)
+        cache.store_raster(key, k.REGION_RASTER, {})
     # Return “g.region -gu” as a dictionary
     grass_region = grass.region()
     print(grass_region)
@@ -145,30 +315,56 @@ def set_mapping_region(map_of_subregions,
 def set_crop_area(digital_elevation_map,
                   max_altitude,
                   crop_area: Optional[str] = None,
-                  crop_fraction_cap: Optional[float] = None):
+                  crop_fraction_cap: Optional[float] = None,
+                  use_cache: Optional[bool] = False):
     """ Use various olive growing areas for masking model output (i.e., map
         model output only inside olive growing areas obtained from various
         sources). Note that when crop_fraction_cap is not None, the function
         will look for a crop_area raster map where each cell value is the
-        fraction of area in that cell that is covered by a certain crop. """
+        fraction of area in that cell that is covered by a certain crop.
+        With use_cache, masks made before from the same inputs, region and
+        mapping region are restored instead (see cache.py). """
+    if use_cache:
+        key = cache.hash_key("crop_area",
+                             grass.gisenv()["LOCATION_NAME"],
+                             cache.region_key(grass.region()),
+                             np.asarray(garray.array(mapname=k.REGION_RASTER)),
+                             digital_elevation_map,
+                             max_altitude,
+                             crop_area,
+                             crop_fraction_cap)
+        mask_keys = {mask: cache.hash_key(key, mask)
+                     for mask in (k.CROP_MASK, k.CROP_ELEVATION_MASK)}
+        if all(cache.restore_raster(mask_key, mask) is not None
+               for mask, mask_key in mask_keys.items()):
+            return
     if crop_area is None:
         # Just use the whole mapping region from set_mapping_region()
-        calc_expression_crop = (f"mask_crop = if (({k.REGION_RASTER},")
-    if (crop_area is not None) and (crop_fraction_cap is not None):
+        crop_condition = None
+    elif crop_fraction_cap is not None:
         # Select cells where land fraction covered by crop is above cap
-        calc_expression_crop = (f"mask_crop = if (({k.REGION_RASTER} &&"
-                                f" {crop_area} > {crop_fraction_cap}),")
+        crop_condition = f"{crop_area} > {crop_fraction_cap}"
     else:
         # Select cells where crop is present (value = 1)
-        calc_expression_crop = (f"mask_crop = if (({k.REGION_RASTER} &&"
-                                f" {crop_area} == 1),")
-    # Put altitude values in crop area selected above, otherwise no data.
-    calc_expression_crop += f" {digital_elevation_map}, null())"
-    grass.mapcalc(calc_expression_crop, overwrite=True)
-    calc_expression_altitude = ("mask_crop_elevation ="
-                                f" if (mask_crop < {max_altitude}, mask_crop,"
-                                " null())")
-    grass.mapcalc(calc_expression_altitude, overwrite=True)
+        crop_condition = f"{crop_area} == 1"
+    # Put altitude values in crop area selected above, otherwise no data,
+    # and in a second mask only below max_altitude. Both masks are written
+    # by the same r.mapcalc run.
+    mapcalc.evaluate([
+        mapcalc.assign(k.CROP_MASK,
+                       mapcalc.where(digital_elevation_map,
+                                     k.REGION_RASTER,
+                                     crop_condition)),
+        mapcalc.assign(k.CROP_ELEVATION_MASK,
+                       mapcalc.where(digital_elevation_map,
+                                     k.REGION_RASTER,
+                                     crop_condition,
+                                     mapcalc.within(digital_elevation_map,
+                                                    max_value=max_altitude)))
+    ])
+    if use_cache:
+        for mask, mask_key in mask_keys.items():
+            cache.store_raster(mask_key, mask, {})
 
 
 def set_output_image(fig_resolution,
@@ -200,33 +396,154 @@ def set_output_image(fig_resolution,
     # on top and legend at bottom?
 
 
+PSMAP_TEMPLATE = """
+# GRASS GIS ps.map instruction file
+
+paper
+    width $paper_width
+    height $paper_height
+    left $left_margin
+    right $right_margin
+    bottom $bottom_margin
+    top $top_margin
+end
+
+border y
+    color black
+    width 1
+end
+
+# Main raster
+raster $drape_map
+
+# Legend
+colortable y
+    raster $interpolated_raster
+    where $legend_x $legend_y
+    # range 1 211
+    # height 0.2
+    # cols 10
+    width $legend_width
+    height $legend_height
+    font Helvetica
+    # fontsize 12
+end
+
+text 50% -40% $sample_text
+    color black
+    # width 1
+    # background white
+    # fontsize 12
+    # ref lower left
+end
+$points
+
+# Some boundary lines
+vlines $target_region
+    type boundary
+    color black
+    width 3
+    lpos 0
+end
+
+# Some boundary lines
+vlines $admin_divisions
+    type boundary
+    color black
+    width 1
+    lpos 0
+end
+
+# Some boundary lines
+vlines $countries
+    type boundary
+    color grey
+    width 2
+    lpos 0
+end
+
+# Some boundary lines
+vlines $coastline
+    type boundary
+    color grey
+    width 3
+    lpos 0
+end
+
+"""
+
+# Left out of ps.map instructions for maps without selected points
+PSMAP_POINTS = """
+# Input points
+vpoints $selected_points
+    type point
+    color white
+    fcolor black
+    width 0.5
+    symbol basic/circle
+    size 2
+end
+"""
+
+
 def write_psmap_instructions(interpolated_raster: str,
-                             selected_points: str,
+                             selected_points: Optional[str],
                              fig_width: float,
                              fig_height: float,
                              outfile_name: str,
                              outfile_path: Optional[os.PathLike] = None,
-                             margin: Optional[float] = 0.1):
+                             margin: Optional[float] = 0.1,
+                             number_of_cols: Optional[int] = None,
+                             number_of_rows: Optional[int] = None):
     """ Generates text file including mapping instructions to serve as input
-        to ps.map GRASS GIS command. Returns output file name with path. """
-    outfile_path = k.PS_DIR or outfile_path
+        to ps.map GRASS GIS command. Returns output file name with path.
+        Only the map names are filled in here; everything else comes from
+        a template filled once per layout (see get_psmap_template). Points
+        are left out when selected_points is None. """
+    outfile_path = k.PS_DIR if outfile_path is None else outfile_path
     outfile_name = f"{outfile_name}.psmap"
     outfile = outfile_path / outfile_name
-    for prefix in k.INTERPOLATION_PREFIXES:
-        print(interpolated_raster)
-        if interpolated_raster.startswith(prefix):
-            drape_map_name = interpolated_raster.replace(prefix,
-                                                         k.DRAPE_PREFIX, 1)
-    grass.run_command("r.shade", overwrite=True,
-                      flags="c",
-                      shade={k.mapping_data["shaded_relief"]},
-                      color=interpolated_raster,
-                      output=drape_map_name,
-                      brighten=0)
+    drape_map_name = make_drape_raster(interpolated_raster)
     # Need to find a way to place legend and text nicely
     # Another idea could be have different pieces of pasmap_file
     # that are combined according to specific context/options.
     # https://grass.osgeo.org/grass80/manuals/ps.map.html
+    psmap_template = get_psmap_template(
+        fig_width=fig_width,
+        fig_height=fig_height,
+        number_of_cols=number_of_cols,
+        number_of_rows=number_of_rows,
+        margin=margin,
+        target_region=k.mapping_data["target_region"]["map_name"],
+        admin_divisions=k.mapping_data["admin_divisions"]["map_name"],
+        countries=k.mapping_data["countries"]["map_name"],
+        coastline=k.mapping_data["coastline"]["map_name"])
+    points = ("" if selected_points is None else
+              string.Template(PSMAP_POINTS).substitute(
+                  selected_points=selected_points))
+    psmap_file = psmap_template.substitute(
+        drape_map=drape_map_name,
+        interpolated_raster=interpolated_raster,
+        points=points)
+
+    with open(outfile, 'w') as f:
+        f.write(psmap_file)
+        return outfile
+
+
+@functools.lru_cache(maxsize=None)
+def get_psmap_template(fig_width: float,
+                       fig_height: float,
+                       number_of_cols: Optional[int],
+                       number_of_rows: Optional[int],
+                       margin: float,
+                       target_region: str,
+                       admin_divisions: str,
+                       countries: str,
+                       coastline: str):
+    """ PSMAP_TEMPLATE with paper, legend placement and boundary vectors
+        filled in, leaving only the per-map fields ($drape_map,
+        $interpolated_raster, $points). """
     (paper_width, paper_height,
      bottom_legend) = map_legend(extension=k.PS,
                                  fig_width=fig_width,
@@ -250,94 +567,62 @@ def write_psmap_instructions(interpolated_raster: str,
         left_margin = (paper_width - paper_height) * 0.5
     # https://unicode-table.com/en/
     sample_text = "this is sample text"
-    psmap_file = f"""
-        # GRASS GIS ps.map instruction file
-
-        paper
-            width {paper_width}
-            height {paper_height}
-            left {left_margin}
-            right {right_margin}
-            bottom {bottom_margin}
-            top {top_margin}
-        end
-
-        border y
-            color black
-            width 1
-        end
-
-        # Main raster
-        raster {drape_map_name}
-
-        # Legend
-        colortable y
-            raster {interpolated_raster}
-            where {legend_x} {legend_y}
-            # range 1 211
-            # height 0.2
-            # cols 10
-            width {legend_width}
-            height {legend_height}
-            font Helvetica
-            # fontsize 12
-        end
-
-        text 50% -40% {sample_text}
-            color black
-            # width 1
-            # background white
-            # fontsize 12
-            # ref lower left
-        end
-
-        # Input points
-        vpoints {selected_points}
-            type point
-            color white
-            fcolor black
-            width 0.5
-            symbol basic/circle
-            size 2
-        end
-
-        # Some boundary lines
-        vlines {k.mapping_data["target_region"]["map_name"]}
-            type boundary
-            color black
-            width 3
-            lpos 0
-        end
-
-        # Some boundary lines
-        vlines {k.mapping_data["admin_divisions"]["map_name"]}
-            type boundary
-            color black
-            width 1
-            lpos 0
-        end
-
-        # Some boundary lines
-        vlines {k.mapping_data["countries"]["map_name"]}
-            type boundary
-            color grey
-            width 2
-            lpos 0
-        end
-
-        # Some boundary lines
-        vlines {k.mapping_data["coastline"]["map_name"]}
-            type boundary
-            color grey
-            width 3
-            lpos 0
-        end
-
-        """
+    return string.Template(string.Template(PSMAP_TEMPLATE).safe_substitute(
+        paper_width=paper_width,
+        paper_height=paper_height,
+        left_margin=left_margin,
+        right_margin=right_margin,
+        bottom_margin=bottom_margin,
+        top_margin=top_margin,
+        legend_x=legend_x,
+        legend_y=legend_y,
+        legend_width=legend_width,
+        legend_height=legend_height,
+        sample_text=sample_text,
+        target_region=target_region,
+        admin_divisions=admin_divisions,
+        countries=countries,
+        coastline=coastline))
 
-    with open(outfile, 'w') as f:
-        f.write(psmap_file)
-        return outfile
+
+def make_drape_raster(interpolated_raster: str):
+    """ Drape the colors of an interpolated raster over the shaded relief
+        with r.shade, or copy the drape from the raster cache when one was
+        already made from the same interpolation inputs, color table and
+        shaded relief. Drapes of rasters that were not cached themselves
+        are not cached either. Returns the name of the drape raster. """
+    drape_map_name = f"{k.DRAPE_PREFIX}{interpolated_raster}"
+    for prefix in k.INTERPOLATION_PREFIXES:
+        if interpolated_raster.startswith(prefix):
+            drape_map_name = interpolated_raster.replace(prefix,
+                                                         k.DRAPE_PREFIX, 1)
+    key = get_drape_key(interpolated_raster)
+    if key is not None and cache.restore_raster(key,
+                                                drape_map_name) is not None:
+        return drape_map_name
+    grass.run_command("r.shade", overwrite=True,
+                      flags="c",
+                      shade=k.mapping_data["shaded_relief"],
+                      color=interpolated_raster,
+                      output=drape_map_name,
+                      brighten=0)
+    if key is not None:
+        cache.store_raster(key, drape_map_name, {})
+    return drape_map_name
+
+
+def get_drape_key(interpolated_raster: str):
+    """ Cache key of a drape raster: cache key of the interpolated raster
+        (see cache.get_raster_key), which already covers its inputs and the
+        region, its color table and the shaded relief map. None when the
+        interpolated raster has no cache key. """
+    raster_key = cache.get_raster_key(interpolated_raster)
+    if raster_key is None:
+        return None
+    color_table = grass.read_command("r.colors.out", map=interpolated_raster)
+    shaded_relief = grass.find_file(k.mapping_data["shaded_relief"],
+                                    element="cell")["fullname"]
+    return cache.hash_key("drape", raster_key, color_table, shaded_relief)
 
 
 # In general, do each step for all maps
@@ -354,42 +639,107 @@ def make_maps(fig_width: float,
               number_of_rows: int,
               background_color: Optional[str] = k.NO_BG_COLOR,
               file_types: Optional[list] = None,
-              interpolation_method: Optional[str] = None):
-    """ Currently only png and ps (PostScript) formats are supported. """
+              interpolation_method: Optional[str] = None,
+              n_workers: Optional[int] = None,
+              static_layers: Optional[bool] = False,
+              native: Optional[bool] = False,
+              common_legend: Optional[bool] = False,
+              boxplot_colors: Optional[bool] = False,
+              sketches: Optional[dict] = None,
+              png_from_ps: Optional[bool] = False):
+    """ Supported formats are png, ps (PostScript), eps, pdf and svg.
+        Maps are listed once for all formats. Vector formats come from a
+        single ps.map run per map (see loop_and_map_ps), and external
+        converters are checked before anything is rendered (see
+        export.py). PNG maps are drawn with d.* commands or, with
+        png_from_ps, converted from the same ps.map output, with its layout
+        instead of the d.* one. With n_workers, PNG maps are
+        rendered and vector formats converted in a pool of workers. With
+        static_layers, d.* PNG maps are composited on layers rendered once
+        for all maps; with native, they are drawn from raster arrays in
+        Python (see loop_and_map_png). With common_legend, all
+        IDW maps, and all B-spline maps, share a color rule adjusted to their
+        overall range (see color.set_shared_color_rule). With
+        boxplot_colors, the shared rule spans the box plot whiskers and
+        outliers get colors of their own (see color.set_boxplot_color_rule).
+        Shared ranges come from sketches made while interpolating, when
+        given (see interpolation.run_interpolation_jobs), instead of
+        reading all rasters again. """
+    extensions = [k.PNG] if file_types is None else file_types
     try:
-        if any(f not in k.SUPPORTED_FILE_TYPES for f in file_types):
+        if any(f not in k.SUPPORTED_FILE_TYPES for f in extensions):
             raise NotImplementedError("\nNot implemented error:\n"
-                                      "Only PNG and PostScript output"
-                                      " is implemented!\n"
-                                      "Please select PNG and/or PostScript"
-                                      " output.\n")
+                                      "Only PNG, PostScript, EPS, PDF and"
+                                      " SVG output is implemented!\n"
+                                      "Please select among these"
+                                      " formats.\n")
     except NotImplementedError as nie:
         print(nie)
-    extensions = [k.PNG] if file_types is None else file_types
-    for extension in extensions:
-        if extension == "png":
-            make_png_maps(extension=extension,
-                          fig_width=fig_width,
-                          fig_height=fig_height,
-                          number_of_cols=number_of_cols,
-                          number_of_rows=number_of_rows,
-                          background_color=background_color)
-        elif extension == "ps":
-            make_ps_maps(extension=extension,
-                         fig_width=fig_width,
-                         fig_height=fig_height)
+    sel_vector_list, surf_raster_lists = get_maps_to_draw(
+        mapping_mapset=k.mapping_session["mapset"])
+    vector_file_types = [extension for extension in extensions
+                         if extension in k.VECTOR_FILE_TYPES]
+    png_from_ps = png_from_ps and k.PNG in extensions
+    # Formats made from the ps.map output
+    ps_file_types = vector_file_types + [k.PNG] * png_from_ps
+    export.check_converters(ps_file_types)
+    for surf_raster_list in surf_raster_lists:
+        if not surf_raster_list:
+            continue
+        with tracing.stage("color"):
+            value_range = outlier_colors = None
+            rasters_sketch = (clr.merge_sketches(surf_raster_list, sketches)
+                              if boxplot_colors or common_legend else None)
+            if boxplot_colors:
+                boxplot_stats = clr.set_boxplot_color_rule(
+                    raster_maps=surf_raster_list,
+                    color_rule="panoply.txt",
+                    values_sketch=rasters_sketch)
+                value_range = (boxplot_stats["whisker_low"],
+                               boxplot_stats["whisker_high"])
+                # Same colors as the rule, for maps drawn in Python
+                outlier_colors = (k.OUTLIER_LOW, k.OUTLIER_HIGH)
+            elif common_legend:
+                value_range = clr.set_shared_color_rule(
+                    raster_maps=surf_raster_list,
+                    color_rule="panoply.txt",
+                    rasters_sketch=rasters_sketch)
+            elif ps_file_types or (k.PNG in extensions and not native):
+                for surf_raster in surf_raster_list:
+                    clr.set_color_rule(raster_map=surf_raster,
+                                       color_rule="panoply.txt")
+        if k.PNG in extensions and not png_from_ps:
+            with tracing.stage("render png"):
+                loop_and_map_png(extension=k.PNG,
+                                 surf_raster_list=surf_raster_list,
+                                 sel_vector_list=sel_vector_list,
+                                 fig_width=fig_width,
+                                 fig_height=fig_height,
+                                 number_of_cols=number_of_cols,
+                                 number_of_rows=number_of_rows,
+                                 background_color=background_color,
+                                 n_workers=n_workers,
+                                 static_layers=static_layers,
+                                 native=native,
+                                 value_range=value_range,
+                                 outlier_colors=outlier_colors)
+        if ps_file_types:
+            with tracing.stage("render vector"):
+                loop_and_map_ps(file_types=ps_file_types,
+                                surf_raster_list=surf_raster_list,
+                                sel_vector_list=sel_vector_list,
+                                fig_width=fig_width,
+                                fig_height=fig_height,
+                                number_of_cols=number_of_cols,
+                                number_of_rows=number_of_rows,
+                                n_workers=n_workers)
         # map_legend() here ???
         # See func def below
 
 
-def make_png_maps(extension: str,
-                  fig_width: float,
-                  fig_height: float,
-                  number_of_cols: int,
-                  number_of_rows: int,
-                  background_color: Optional[str] = k.NO_BG_COLOR):
-    """ Cycle through interpolated surfaces and generate maps. """
-    mapping_mapset = k.mapping_session["mapset"]
+def get_maps_to_draw(mapping_mapset: str):
+    """ Selected points vectors and lists of interpolated surfaces (IDW
+        and B-spline) in the mapping mapset. """
     sel_vector_list = get_map_list_from_pattern(
         map_type="vector",
         pattern="sel_*",
@@ -402,40 +752,7 @@ def make_png_maps(extension: str,
         map_type="raster",
         pattern="bspline_*",
         mapping_mapset=mapping_mapset)
-    for surf_raster_list in (idw_rasters_list, bspline_rasters_list):
-        loop_and_map_png(extension=extension,
-                         surf_raster_list=surf_raster_list,
-                         sel_vector_list=sel_vector_list,
-                         fig_width=fig_width,
-                         fig_height=fig_height,
-                         number_of_cols=number_of_cols,
-                         number_of_rows=number_of_rows,
-                         background_color=background_color)
-
-
-def make_ps_maps(extension: str,
-                 fig_width: float,
-                 fig_height: float):
-    """ Cycle through interpolated surfaces and generate maps. """
-    mapping_mapset = k.mapping_session["mapset"]
-    sel_vector_list = get_map_list_from_pattern(
-        map_type="vector",
-        pattern="sel_*",
-        mapping_mapset=mapping_mapset)
-    idw_rasters_list = get_map_list_from_pattern(
-        map_type="raster",
-        pattern="idw_*",
-        mapping_mapset=mapping_mapset)
-    bspline_rasters_list = get_map_list_from_pattern(
-        map_type="raster",
-        pattern="bspline_*",
-        mapping_mapset=mapping_mapset)
-    for surf_raster_list in (idw_rasters_list, bspline_rasters_list):
-        loop_and_map_ps(extension=extension,
-                        surf_raster_list=surf_raster_list,
-                        sel_vector_list=sel_vector_list,
-                        fig_width=fig_width,
-                        fig_height=fig_height)
+    return sel_vector_list, (idw_rasters_list, bspline_rasters_list)
 
 
 def loop_and_map_png(extension: str,
@@ -445,7 +762,31 @@ def loop_and_map_png(extension: str,
                      fig_height: float,
                      number_of_cols: int,
                      number_of_rows: int,
-                     background_color: Optional[str] = k.NO_BG_COLOR):
+                     background_color: Optional[str] = k.NO_BG_COLOR,
+                     n_workers: Optional[int] = None,
+                     static_layers: Optional[bool] = False,
+                     native: Optional[bool] = False,
+                     value_range: Optional[tuple] = None,
+                     outlier_colors: Optional[tuple] = None):
+    """ Draw maps on a d.mon PNG monitor, one after another. With
+        n_workers, static_layers or native, maps are instead rendered
+        straight to file with no monitor involved (see render_png_maps).
+        Maps must already have their colors (see make_maps). """
+    if n_workers is not None or static_layers or native:
+        render_png_maps(extension=extension,
+                        surf_raster_list=surf_raster_list,
+                        sel_vector_list=sel_vector_list,
+                        fig_width=fig_width,
+                        fig_height=fig_height,
+                        number_of_cols=number_of_cols,
+                        number_of_rows=number_of_rows,
+                        background_color=background_color,
+                        n_workers=n_workers,
+                        static_layers=static_layers,
+                        native=native,
+                        value_range=value_range,
+                        outlier_colors=outlier_colors)
+        return
     # Debugging code follows as a reminder that when no PNG monitor is
     # running, the monitor variable is as string of length == zero.
     monitor = grass.read_command("d.mon", flags="p", quiet=True).strip()
@@ -455,31 +796,129 @@ def loop_and_map_png(extension: str,
     # and needs to be closed before the for loop below starts.
     if len(monitor) > 0:
         grass.run_command("d.mon", stop=extension)
-    # There should probably be a way to adjust vector line size depending on
-    # fig_width,fig_height or maybe number_of_cols,number_of_rows (rescale)
-    for idw_raster, sel_vector in zip(surf_raster_list, sel_vector_list):
+    for idw_raster in surf_raster_list:
+        sel_vector = get_points_for_raster(idw_raster, sel_vector_list)
         outfile = k.PNG_DIR / f"{idw_raster}.{extension}"
-        clr.set_color_rule(raster_map=idw_raster,
-                           color_rule="panoply.txt")
-
         grass.run_command("d.mon", overwrite=True,
                           start=extension,
                           width=fig_width,
                           height=fig_height,
                           bgcolor=background_color,
                           output=outfile)
-        grass.run_command("d.his",
-                          i=k.mapping_data["shaded_relief"],
-                          h=idw_raster)
-        grass.run_command("d.vect",
-                          map=k.mapping_data["coastline"]["map_name"],
-                          color=k.mapping_data["coastline"]["color"],
-                          width=k.mapping_data["coastline"]["width"])
-        grass.run_command("d.vect",
-                          map=k.mapping_data["admin_divisions"]["map_name"],
-                          type="boundary",
-                          color="black",
-                          width=3)
+        draw_png_layers(idw_raster=idw_raster,
+                        sel_vector=sel_vector,
+                        fig_width=fig_width,
+                        fig_height=fig_height,
+                        number_of_cols=number_of_cols,
+                        number_of_rows=number_of_rows)
+        grass.run_command("d.mon", stop=extension)
+
+
+def render_png_maps(extension: str,
+                    surf_raster_list: list,
+                    sel_vector_list: list,
+                    fig_width: float,
+                    fig_height: float,
+                    number_of_cols: int,
+                    number_of_rows: int,
+                    background_color: Optional[str] = k.NO_BG_COLOR,
+                    n_workers: Optional[int] = None,
+                    static_layers: Optional[bool] = False,
+                    native: Optional[bool] = False,
+                    value_range: Optional[tuple] = None,
+                    outlier_colors: Optional[tuple] = None):
+    """ Render maps straight to file, in a pool of n_workers processes or,
+        when n_workers is None, one after another in this process. With
+        static_layers, layers that are the same for all maps are rendered
+        once (see get_static_layers) and only the colored surface, points
+        and legend are rendered per map (see render_composited_png_map).
+        With native, only the static overlay is rendered by GRASS GIS and
+        maps are drawn in Python (see render_native_png_map), with colors
+        over value_range when given, or else over each map's range, and
+        outlier_colors beyond value_range. """
+    jobs = [{"idw_raster": idw_raster,
+             "sel_vector": get_points_for_raster(idw_raster,
+                                                 sel_vector_list),
+             "outfile": k.PNG_DIR / f"{idw_raster}.{extension}",
+             "fig_width": fig_width,
+             "fig_height": fig_height,
+             "number_of_cols": number_of_cols,
+             "number_of_rows": number_of_rows,
+             "background_color": background_color}
+            for idw_raster in surf_raster_list]
+    render_function = render_png_map
+    if static_layers or native:
+        # Rendered here, before workers start, so they are rendered once
+        relief_file, overlay_file = get_static_layers(fig_width, fig_height)
+        for job in jobs:
+            job.update(overlay_file=overlay_file)
+            if native:
+                job.update(value_range=value_range,
+                           outlier_colors=outlier_colors)
+            else:
+                job.update(relief_file=relief_file)
+        render_function = (render_native_png_map if native
+                           else render_composited_png_map)
+    if n_workers is None:
+        for job in jobs:
+            render_function(**job)
+    else:
+        par.map_in_sessions(session_settings=k.mapping_session,
+                            func=render_function,
+                            jobs=jobs,
+                            n_workers=n_workers)
+
+
+def draw_png_layers(idw_raster: str,
+                    sel_vector: Optional[str],
+                    fig_width: float,
+                    fig_height: float,
+                    number_of_cols: int,
+                    number_of_rows: int,
+                    env: Optional[dict] = None):
+    """ Draw all layers of a map with d.* commands, either on the current
+        monitor or, with env from get_render_env, straight to a file. """
+    # There should probably be a way to adjust vector line size depending on
+    # fig_width,fig_height or maybe number_of_cols,number_of_rows (rescale)
+    grass.run_command("d.his",
+                      i=k.mapping_data["shaded_relief"],
+                      h=idw_raster,
+                      env=env)
+    draw_static_overlay(env=env)
+    draw_points_and_legend(idw_raster=idw_raster,
+                           sel_vector=sel_vector,
+                           fig_width=fig_width,
+                           fig_height=fig_height,
+                           number_of_cols=number_of_cols,
+                           number_of_rows=number_of_rows,
+                           env=env)
+
+
+def draw_static_overlay(env: Optional[dict] = None):
+    """ Layers drawn over the colored surface that are the same for all
+        maps of a region. """
+    grass.run_command("d.vect",
+                      map=k.mapping_data["coastline"]["map_name"],
+                      color=k.mapping_data["coastline"]["color"],
+                      width=k.mapping_data["coastline"]["width"],
+                      env=env)
+    grass.run_command("d.vect",
+                      map=k.mapping_data["admin_divisions"]["map_name"],
+                      type="boundary",
+                      color="black",
+                      width=3,
+                      env=env)
+    draw_map_box(env=env)
+
+
+def draw_points_and_legend(idw_raster: str,
+                           sel_vector: Optional[str],
+                           fig_width: float,
+                           fig_height: float,
+                           number_of_cols: int,
+                           number_of_rows: int,
+                           env: Optional[dict] = None):
+    if sel_vector is not None:
         grass.run_command("d.vect",
                           map=sel_vector,
                           type="point",
@@ -487,34 +926,252 @@ def loop_and_map_png(extension: str,
                           fill_color="black",
                           icon="basic/point",
                           size=15,
-                          width=2)
-        draw_map_box()
-        map_legend(extension=extension,
-                   map_name=idw_raster,
-                   fig_width=fig_width,
-                   fig_height=fig_height,
-                   n_of_cols=number_of_cols,
-                   n_of_rows=number_of_rows)
-        grass.run_command("d.mon", stop=extension)
+                          width=2,
+                          env=env)
+    map_legend(extension=k.PNG,
+               map_name=idw_raster,
+               fig_width=fig_width,
+               fig_height=fig_height,
+               n_of_cols=number_of_cols,
+               n_of_rows=number_of_rows,
+               env=env)
+
+
+def render_png_map(idw_raster: str,
+                   sel_vector: Optional[str],
+                   outfile: os.PathLike,
+                   fig_width: float,
+                   fig_height: float,
+                   number_of_cols: int,
+                   number_of_rows: int,
+                   background_color: Optional[str] = k.NO_BG_COLOR):
+    """ Render a PNG map straight to file with GRASS_RENDER_IMMEDIATE and a
+        GRASS_RENDER_FILE of its own, so that maps do not compete for the
+        process-global d.mon monitor and can be rendered concurrently. """
+    env = get_render_env(outfile=outfile,
+                         width=fig_width,
+                         height=fig_height,
+                         background_color=background_color)
+    draw_png_layers(idw_raster=idw_raster,
+                    sel_vector=sel_vector,
+                    fig_width=fig_width,
+                    fig_height=fig_height,
+                    number_of_cols=number_of_cols,
+                    number_of_rows=number_of_rows,
+                    env=env)
+    return outfile
+
+
+def render_composited_png_map(idw_raster: str,
+                              sel_vector: Optional[str],
+                              outfile: os.PathLike,
+                              fig_width: float,
+                              fig_height: float,
+                              number_of_cols: int,
+                              number_of_rows: int,
+                              relief_file: os.PathLike,
+                              overlay_file: os.PathLike,
+                              background_color: Optional[str] =
+                              k.NO_BG_COLOR):
+    """ Render only the layers that change from map to map, i.e., the
+        colored surface and, on a transparent layer of its own, points and
+        legend, then composite them with the pre-rendered static layers
+        (see get_static_layers). The surface is blended with the shaded
+        relief as d.his does. """
+    surface_file = k.RENDER_DIR / f"{idw_raster}_surface.png"
+    top_file = k.RENDER_DIR / f"{idw_raster}_top.png"
+    grass.run_command("d.rast",
+                      map=idw_raster,
+                      env=get_render_env(outfile=surface_file,
+                                         width=fig_width,
+                                         height=fig_height))
+    draw_points_and_legend(idw_raster=idw_raster,
+                           sel_vector=sel_vector,
+                           fig_width=fig_width,
+                           fig_height=fig_height,
+                           number_of_cols=number_of_cols,
+                           number_of_rows=number_of_rows,
+                           env=get_render_env(outfile=top_file,
+                                              width=fig_width,
+                                              height=fig_height))
+    surface = comp.blend_intensity(surface=comp.read_layer(surface_file),
+                                   relief=comp.read_layer(relief_file))
+    image = comp.composite_layers([surface,
+                                   comp.read_layer(overlay_file),
+                                   comp.read_layer(top_file)],
+                                  background_color=background_color)
+    image.save(outfile)
+    surface_file.unlink()
+    top_file.unlink()
+    return outfile
+
+
+def render_native_png_map(idw_raster: str,
+                          sel_vector: Optional[str],
+                          outfile: os.PathLike,
+                          fig_width: float,
+                          fig_height: float,
+                          number_of_cols: int,
+                          number_of_rows: int,
+                          overlay_file: Optional[os.PathLike] = None,
+                          background_color: Optional[str] = k.NO_BG_COLOR,
+                          color_rule: Optional[str] = "panoply.txt",
+                          value_range: Optional[tuple] = None,
+                          outlier_colors: Optional[tuple] = None):
+    """ Draw a PNG map in Python from the interpolated raster and shaded
+        relief read as arrays, with the color rule applied through a lookup
+        table and points and legend drawn with Pillow (see
+        composite.render_map). Values beyond value_range get the end
+        colors of the rule or, with outlier_colors (r:g:b or names for
+        values below and above it), the colors of a box plot color rule.
+        Needs no r.colors and no display driver; the overlay is one of the
+        static layers (see get_static_layers). """
+    size = (round(fig_width), round(fig_height))
+    region = grass.region()
+    values = garray.array(mapname=idw_raster, null="nan")
+    relief = read_relief(k.mapping_data["shaded_relief"],
+                         tuple(cache.region_key(region).values()))
+    if value_range is None:
+        value_range = (float(np.nanmin(values)), float(np.nanmax(values)))
+    color_table = clr.get_color_table(color_rule, *value_range)
+    point_coords = (np.empty((0, 2)) if sel_vector is None
+                    else read_point_coordinates(sel_vector))
+    # Same frame as d.* commands, so that the map fits the overlay
+    frame = comp.map_frame(region, size)
+    cols, rows = comp.map_pixels(point_coords[:, 0], point_coords[:, 1],
+                                 region, frame)
+    overlay = None if overlay_file is None else comp.read_layer(overlay_file)
+    image = comp.render_map(values=np.asarray(values),
+                            relief=relief,
+                            color_table=color_table,
+                            size=size,
+                            cols=cols,
+                            rows=rows,
+                            overlay=overlay,
+                            background_color=background_color,
+                            value_range=value_range,
+                            frame=frame,
+                            outlier_colors=(
+                                None if outlier_colors is None
+                                else tuple(clr.parse_rgb(color)
+                                           for color in outlier_colors)))
+    image.save(outfile)
+    return outfile
+
+
+@functools.lru_cache(maxsize=4)
+def read_relief(relief_map: str,
+                region_key: tuple):
+    """ Shaded relief as an array, read once per process and region. """
+    return np.asarray(garray.array(mapname=relief_map, null="nan"))
+
+
+def read_point_coordinates(vector_map: str):
+    """ Coordinates of the points of a vector map as an (n, 2) array. """
+    points_output = grass.read_command("v.out.ascii",
+                                       input=vector_map,
+                                       type="point",
+                                       format="point",
+                                       separator="pipe")
+    return np.genfromtxt(StringIO(points_output), delimiter="|",
+                         usecols=(0, 1), ndmin=2)
 
 
-def loop_and_map_ps(extension: str,
+def get_static_layers(fig_width: float,
+                      fig_height: float):
+    """ Shaded relief and overlay (see draw_static_overlay) images for the
+        current location, region and figure size. They are rendered on a
+        transparent background once and then taken from the cache. """
+    region = grass.region()
+    key = cache.hash_key(grass.gisenv()["LOCATION_NAME"],
+                         cache.region_key(region),
+                         round(fig_width),
+                         round(fig_height),
+                         k.mapping_data["shaded_relief"],
+                         k.mapping_data["coastline"],
+                         k.mapping_data["admin_divisions"])
+    relief_file = cache.cache_file("relief", key, ".png")
+    overlay_file = cache.cache_file("overlay", key, ".png")
+    if not relief_file.exists():
+        render_static_layer(
+            relief_file, fig_width, fig_height,
+            lambda env: grass.run_command(
+                "d.rast", map=k.mapping_data["shaded_relief"], env=env))
+    if not overlay_file.exists():
+        render_static_layer(overlay_file, fig_width, fig_height,
+                            lambda env: draw_static_overlay(env=env))
+    return relief_file, overlay_file
+
+
+def render_static_layer(outfile: pathlib.Path,
+                        fig_width: float,
+                        fig_height: float,
+                        draw):
+    """ Render a layer with draw(env) to a temporary file first, so that an
+        interrupted run does not leave a partial layer in the cache. """
+    tmp_file = outfile.with_suffix(".tmp.png")
+    draw(get_render_env(outfile=tmp_file,
+                        width=fig_width,
+                        height=fig_height))
+    os.replace(tmp_file, outfile)
+
+
+def get_render_env(outfile: os.PathLike,
+                   width: float,
+                   height: float,
+                   background_color: Optional[str] = k.NO_BG_COLOR):
+    """ Copy of the current environment with variables that make d.*
+        commands draw straight to outfile, see
+        https://grass.osgeo.org/grass-stable/manuals/variables.html """
+    # Successive d.* commands add to the file when it exists
+    pathlib.Path(outfile).unlink(missing_ok=True)
+    env = os.environ.copy()
+    env["GRASS_RENDER_IMMEDIATE"] = k.PNG
+    env["GRASS_RENDER_FILE"] = str(outfile)
+    env["GRASS_RENDER_FILE_READ"] = "TRUE"
+    env["GRASS_RENDER_WIDTH"] = str(round(width))
+    env["GRASS_RENDER_HEIGHT"] = str(round(height))
+    if background_color == k.NO_BG_COLOR:
+        env["GRASS_RENDER_TRANSPARENT"] = "TRUE"
+    else:
+        env["GRASS_RENDER_TRANSPARENT"] = "FALSE"
+        env["GRASS_RENDER_BACKGROUNDCOLOR"] = "".join(
+            f"{round(channel * 255):02X}"
+            for channel in grass.parse_color(background_color))
+    return env
+
+
+def loop_and_map_ps(file_types: list,
                     surf_raster_list: list,
                     sel_vector_list: list,
                     fig_width: float,
-                    fig_height: float):
-    for idw_raster, sel_vector in zip(surf_raster_list, sel_vector_list):
-        outfile = k.PS_DIR / f"{idw_raster}.{extension}"
+                    fig_height: float,
+                    number_of_cols: Optional[int] = None,
+                    number_of_rows: Optional[int] = None,
+                    n_workers: Optional[int] = None):
+    """ Run ps.map once per map to Encapsulated PostScript, then convert to
+        file_types (vector formats, and PNG when made from ps.map output)
+        in a pool (see export.export_maps). """
+    eps_files = []
+    for idw_raster in surf_raster_list:
+        sel_vector = get_points_for_raster(idw_raster, sel_vector_list)
+        eps_file = k.RENDER_DIR / f"{idw_raster}.{k.EPS}"
         ps_instructions_file = write_psmap_instructions(
             interpolated_raster=idw_raster,
             selected_points=sel_vector,
             outfile_name=idw_raster,
             fig_width=fig_width,
-            fig_height=fig_height)
+            fig_height=fig_height,
+            number_of_cols=number_of_cols,
+            number_of_rows=number_of_rows)
         grass.run_command("ps.map", overwrite=True,
                           flags="e",
                           input=ps_instructions_file,
-                          output=outfile)
+                          output=eps_file)
+        eps_files.append(eps_file)
+    export.export_maps(eps_files=eps_files,
+                       file_types=file_types,
+                       n_workers=n_workers)
 
 
 def get_map_list_from_pattern(map_type: str,
@@ -524,13 +1181,32 @@ def get_map_list_from_pattern(map_type: str,
     return map_dict[f"{mapping_mapset}"]
 
 
+def get_points_for_raster(surf_raster: str,
+                          sel_vector_list: list):
+    """ Selected points vector an interpolated raster was computed from,
+        i.e., sel_<name> for <prefix><name> or, for wide table vectors,
+        sel_<table> for <prefix><table>_<variable>. None when there is no
+        such vector, and maps are then drawn without points. """
+    surf_name = surf_raster
+    for prefix in k.INTERPOLATION_PREFIXES:
+        if surf_raster.startswith(prefix):
+            surf_name = surf_raster.replace(prefix, "", 1)
+    matching_vectors = [
+        sel_vector for sel_vector in sel_vector_list
+        if (surf_name + "_").startswith(
+            sel_vector.replace(k.SELECTED_PREFIX, "", 1) + "_")]
+    # Longest match, in case a table name is the prefix of another one
+    return max(matching_vectors, key=len, default=None)
+
+
 def map_legend(extension: str,
                fig_width: float,
                fig_height: float,
                n_of_cols: int,
                n_of_rows: int,
                map_name: Optional[str] = None,
-               smart_legend_position: Optional[bool] = False):
+               smart_legend_position: Optional[bool] = False,
+               env: Optional[dict] = None):
     # sourcery skip: assign-if-exp, switch
     # Check fig_width, fig_height and
     # if n_of_cols >= n_of_rows then legend goes to bottom
@@ -548,7 +1224,8 @@ def map_legend(extension: str,
                           color="black",
                           labelnum=5,
                           at=legend_coords,
-                          font="Arial")
+                          font="Arial",
+                          env=env)
     elif extension == "ps":
         # Compute paper size and legend position
         bottom_legend = True
@@ -569,58 +1246,407 @@ def map_legend(extension: str,
 
 
 def draw_map_box(width: Optional[int] = 2,
-                 bordercolor: Optional[str] = "black"):
+                 bordercolor: Optional[str] = "black",
+                 env: Optional[dict] = None):
     grass.run_command("d.grid",
                       flags="wn",
                       size="5:0:0",
                       color="black",
                       width=width,
-                      bordercolor=bordercolor)
+                      bordercolor=bordercolor,
+                      env=env)
 
 
-if __name__ == "__main__":
-    # The following groups of functions may become a specialized function
-    # to which a GRASS session and a dictionary of (constant?) parameters
-    # are fed, so that the different current variants of the GIS scripts
-    # are run transparently for e.g., Italy, Europe, North America, etc.
+def import_latlong_points(wide_table: Optional[bool] = False,
+                          tmp_dir: Optional[os.PathLike] = k.TMP_DIR):
+    """ Import points from text files into the lat/long location of the
+        current location settings (see constants.use_location). """
     with Session(**k.latlong_session):
         cleanup.print_grass_environment()
         cleanup.clean_up_vectors()
-        ascii_to_vector()
-        cleanup.list_vector_maps()
-    with Session(**k.mapping_session):
+        ascii_to_vector(tmp_dir=tmp_dir, wide_table=wide_table)
         cleanup.list_vector_maps()
-        cleanup.clean_up_vectors()
-        cleanup.clean_up_rasters()
+
+
+def import_points(project_in_python: bool,
+                  select_in_python: bool,
+                  wide_table: bool,
+                  stream_tables: bool,
+                  table_columns: dict,
+                  point_selection: dict,
+                  tmp_dir: os.PathLike):
+    """ Import points to the mapping location the way run_pipeline options
+        say: projected in Python from CASAS tables or text files, selected
+        in memory or not, or with v.proj from the lat/long location. Only
+        points projected in Python can be streamed from tables. """
+    check_import_options(project_in_python, stream_tables)
+    if project_in_python and stream_tables:
+        tables_to_vector(
+            inp.iter_tables(**table_columns),
+            wide_table=wide_table,
+            digital_elevation_map=(k.mapping_data["digital_elevation"]
+                                   if select_in_python else None),
+            **point_selection)
+    elif project_in_python and select_in_python:
+        ascii_to_projected_vector(
+            tmp_dir=tmp_dir,
+            wide_table=wide_table,
+            digital_elevation_map=k.mapping_data["digital_elevation"],
+            **point_selection)
+    elif project_in_python:
+        ascii_to_projected_vector(tmp_dir=tmp_dir,
+                                  wide_table=wide_table)
+    else:
         project_vector_to_current_location(
             source_location=k.latlong_session["location"],
             source_mapset=k.latlong_session["mapset"])
+
+
+def run_module_stages(project_in_python: bool,
+                      select_in_python: bool,
+                      wide_table: bool,
+                      stream_tables: bool,
+                      table_columns: dict,
+                      point_selection: dict,
+                      tmp_dir: os.PathLike,
+                      use_cache: bool,
+                      sketches: Optional[dict]):
+    """ Import, region, mask, select and interpolate stages of
+        run_pipeline as GRASS GIS modules, the way run_pipeline options
+        say. sketches is filled as in interpolation.run_interpolation_jobs.
+        Returns the range of interpolated values. """
+    with tracing.stage("import"):
+        import_points(project_in_python, select_in_python,
+                      wide_table, stream_tables, table_columns,
+                      point_selection, tmp_dir)
+    with tracing.stage("region"):
         set_mapping_region(
             map_of_subregions=k.mapping_data["admin_divisions"]["map_name"],
             column_name=k.mapping_data["admin_divisions"]["column"],
-            selected_subregions=",".join(k.mapping_data["admin_divisions"]
-                                                       ["division_names"]
-                                                       [:10])
-            )
+            selected_subregions=",".join(
+                k.mapping_data["admin_divisions"]["division_names"][:10]),
+            use_cache=use_cache)
         set_crop_area(k.mapping_data["digital_elevation"],
                       900,
                       k.mapping_data["crop"]["harvest_area_fraction"],
-                      0.3)
-        surf.select_interpolation_points(k.mapping_data["digital_elevation"],
-                                         altitude_cap=2000,
-                                         lower_bound=0)
+                      0.3,
+                      use_cache=use_cache)
+    if not (project_in_python and select_in_python):
+        with tracing.stage("select"):
+            surf.select_interpolation_points(
+                k.mapping_data["digital_elevation"],
+                **point_selection)
+    with tracing.stage("interpolate"):
         (abs_max_idw, abs_min_idw) = surf.interpolate_points_idw(
             vector_layer=1,
             number_of_points=3,
-            power=2.0)
+            power=2.0,
+            use_cache=use_cache,
+            sketches=sketches)
         # surf.interpolate_points_bspline(vector_layer=1,
         #                                 method="bicubic")
-        (fig_width, fig_height,
-         number_of_cols, number_of_rows) = set_output_image(1)
-        make_maps(
-                  fig_width=fig_width,
-                  fig_height=fig_height,
-                  number_of_cols=number_of_cols,
-                  number_of_rows=number_of_rows,
-                  background_color="white",
-                  file_types=["png", "ps"])
+    return abs_max_idw, abs_min_idw
+
+
+def run_backend_stages(processing: bk.Backend,
+                       wide_table: bool,
+                       table_columns: dict,
+                       point_selection: dict,
+                       use_cache: Optional[bool] = False,
+                       number_of_points: Optional[int] = 3,
+                       power: Optional[float] = 2.0):
+    """ Import, region, mask, interpolate and statistics stages of
+        run_pipeline through a backend (see backend.py). Points are read
+        from tables, projected and selected in memory, as with
+        stream_tables and select_in_python. The region and mapping region
+        raster are set as in set_mapping_region, and the mask holds the
+        conditions of set_crop_area. IDW surfaces are clipped to the mapping
+        region, as by interpolation.interpolate_points_idw, and named as
+        its rasters. Rasters and selected points are then maps of the
+        mapping mapset whatever the backend, for make_maps. Returns the
+        range of interpolated values, from the statistics the backend
+        returns with each surface. """
+    digital_elevation_map = k.mapping_data["digital_elevation"]
+    crop_area = k.mapping_data["crop"]["harvest_area_fraction"]
+    crs = pts.get_location_crs()
+    point_sets = {}
+    with tracing.stage("import"):
+        for key, chunks in itertools.groupby(inp.iter_tables(**table_columns),
+                                             key=lambda x: x[0]):
+            df = pd.concat([df for _, df in chunks], ignore_index=True)
+            for mapname, df_part in split_table(key, df, wide_table).items():
+                variable_names = list(df_part.columns[2:])
+                name = f"{k.SELECTED_PREFIX}{mapname}"
+                processing.import_points(name, pts.prepare_table(
+                    df_part, crs,
+                    value_columns=variable_names,
+                    digital_elevation_map=digital_elevation_map,
+                    **point_selection))
+                point_sets[name] = variable_names
+    with tracing.stage("region"):
+        set_mapping_region(
+            map_of_subregions=k.mapping_data["admin_divisions"]["map_name"],
+            column_name=k.mapping_data["admin_divisions"]["column"],
+            selected_subregions=",".join(
+                k.mapping_data["admin_divisions"]["division_names"][:10]),
+            use_cache=use_cache)
+        region = grass.region()
+        processing.set_region(north=region["n"],
+                              south=region["s"],
+                              east=region["e"],
+                              west=region["w"],
+                              resolution=region["nsres"])
+        processing.load_rasters([k.REGION_RASTER, digital_elevation_map,
+                                 crop_area])
+    with tracing.stage("mask"):
+        processing.build_mask(output=k.CROP_ELEVATION_MASK,
+                              region_raster=k.REGION_RASTER,
+                              digital_elevation_map=digital_elevation_map,
+                              max_altitude=900,
+                              crop_area=crop_area,
+                              crop_fraction_cap=0.3)
+    raster_stats = {}
+    with tracing.stage("interpolate"):
+        for name, variable_names in point_sets.items():
+            base_name = name.replace(k.SELECTED_PREFIX, "", 1)
+            for variable_name in variable_names:
+                # Named as in interpolation.get_interpolation_jobs
+                output = (f"{k.IDW_PREFIX}{base_name}"
+                          if variable_name == base_name else
+                          f"{k.IDW_PREFIX}{base_name}_{variable_name}")
+                raster_stats[output] = processing.interpolate(
+                    points=name,
+                    column=variable_name,
+                    output=output,
+                    mask=k.REGION_RASTER,
+                    number_of_points=number_of_points,
+                    power=power)
+    with tracing.stage("stats"):
+        abs_max_idw, abs_min_idw = surf.get_absolute_range(raster_stats)
+    with tracing.stage("save"):
+        processing.save_to_mapset(rasters=[*raster_stats,
+                                           k.CROP_ELEVATION_MASK],
+                                  points=list(point_sets))
+    return abs_max_idw, abs_min_idw
+
+
+def check_import_options(project_in_python: bool,
+                         stream_tables: bool,
+                         select_in_python: Optional[bool] = False,
+                         backend: Optional[str] = None):
+    if stream_tables and not project_in_python:
+        raise ValueError("stream_tables needs project_in_python, since "
+                         "points imported to the lat/long location are "
+                         "projected from text files with v.proj")
+    if backend is not None and not (project_in_python and select_in_python
+                                    and stream_tables):
+        raise ValueError("backend needs project_in_python, select_in_python"
+                         " and stream_tables, since points reach a backend"
+                         " as tables selected in memory")
+
+
+def run_pipeline(project_in_python: Optional[bool] = False,
+                 select_in_python: Optional[bool] = False,
+                 wide_table: Optional[bool] = False,
+                 stream_tables: Optional[bool] = False,
+                 table_columns: Optional[dict] = None,
+                 point_selection: Optional[dict] = None,
+                 file_types: Optional[list] = None,
+                 import_latlong: Optional[bool] = True,
+                 tmp_dir: Optional[os.PathLike] = k.TMP_DIR,
+                 trace_file: Optional[os.PathLike] = None,
+                 use_cache: Optional[bool] = False,
+                 common_legend: Optional[bool] = False,
+                 png_from_ps: Optional[bool] = False,
+                 backend: Optional[str] = None):
+    """ Map the current location (see constants.use_location): import
+        points, set mapping region and crop area, select and interpolate
+        points and make maps. Set import_latlong to False when points are
+        already in the lat/long location (see run_locations). With
+        trace_file, GRASS GIS module runs are traced by stage (see
+        tracing.py). With use_cache, region, masks and interpolated rasters
+        made before from the same inputs are reused (see cache.py). With
+        common_legend, all maps share a color rule over their overall
+        range; with png_from_ps, PNG maps are converted from ps.map output
+        (see make_maps). With backend (k.GRASS_BACKEND or k.MEMORY_BACKEND,
+        needs project_in_python, select_in_python and stream_tables),
+        points are imported, masked and interpolated with IDW through that
+        backend (see run_backend_stages) instead of the GRASS GIS modules
+        of the other options. Returns the range of interpolated values and
+        the number of maps drawn. """
+    table_columns = ({"lon": "Longitude",
+                      "lat": "Latitude",
+                      "variables": ["meanTdda"]}
+                     if table_columns is None else table_columns)
+    point_selection = ({"altitude_cap": 2000,
+                        "lower_bound": 0}
+                       if point_selection is None else point_selection)
+    file_types = ["png", "ps"] if file_types is None else file_types
+    # Before anything is imported to the lat/long location
+    check_import_options(project_in_python, stream_tables, select_in_python,
+                         backend)
+    processing = None if backend is None else bk.get_backend(backend)
+    k.make_dirs()
+    with tracing.trace_run(trace_file):
+        if not project_in_python and import_latlong:
+            with tracing.stage("import"):
+                import_latlong_points(wide_table=wide_table, tmp_dir=tmp_dir)
+        with Session(**k.mapping_session):
+            cleanup.list_vector_maps()
+            cleanup.clean_up_vectors()
+            cleanup.clean_up_rasters()
+            # Quantile sketches of interpolated rasters, for common_legend
+            sketches = {} if common_legend else None
+            if processing is None:
+                abs_max_idw, abs_min_idw = run_module_stages(
+                    project_in_python, select_in_python, wide_table,
+                    stream_tables, table_columns, point_selection, tmp_dir,
+                    use_cache, sketches)
+            else:
+                abs_max_idw, abs_min_idw = run_backend_stages(
+                    processing, wide_table, table_columns, point_selection,
+                    use_cache=use_cache)
+            with tracing.stage("maps"):
+                (fig_width, fig_height,
+                 number_of_cols, number_of_rows) = set_output_image(1)
+                make_maps(
+                          fig_width=fig_width,
+                          fig_height=fig_height,
+                          number_of_cols=number_of_cols,
+                          number_of_rows=number_of_rows,
+                          background_color="white",
+                          file_types=file_types,
+                          common_legend=common_legend,
+                          sketches=sketches,
+                          png_from_ps=png_from_ps)
+            number_of_maps = len(get_map_list_from_pattern(
+                "raster", f"{k.IDW_PREFIX}*", k.mapping_session["mapset"]))
+    return {"abs_min": abs_min_idw,
+            "abs_max": abs_max_idw,
+            "maps": number_of_maps}
+
+
+def run_location(location_name: str,
+                 **pipeline_options):
+    """ Map one entry of locations.py with run_pipeline, writing output to
+        its own subdirectory of k.BASE_OUT_DIR. Meant to run in a process
+        of its own (see run_locations): errors are reported in the returned
+        summary instead of being raised, so that other locations go on. """
+    start = time.perf_counter()
+    k.use_location(location_name)
+    k.use_output_dir(k.BASE_OUT_DIR / location_name)
+    if pipeline_options.get("trace_file") is not None:
+        # One trace per location, in its own report directory
+        pipeline_options["trace_file"] = (
+            k.REPORT_DIR / pathlib.Path(pipeline_options["trace_file"]).name)
+    summary = {"location": location_name,
+               "output_dir": str(k.OUT_DIR)}
+    try:
+        summary.update(run_pipeline(**pipeline_options))
+        summary["status"] = "done"
+    except Exception as error:
+        summary["status"] = "failed"
+        summary["error"] = repr(error)
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    return summary
+
+
+def run_locations(location_names: list,
+                  n_workers: Optional[int] = None,
+                  **pipeline_options):
+    """ Map several entries of locations.py at the same time, each in its
+        own process and GRASS session (see run_location), and write a
+        summary of all runs to k.BASE_OUT_DIR. Locations may share a
+        lat/long location and mapset, so points are imported there once
+        per lat/long session, before mapping starts. """
+    k.make_dirs()
+    if not pipeline_options.get("project_in_python", False):
+        latlong_sessions = []
+        for location_name in location_names:
+            latlong_session = getattr(loc, location_name)["latlong_session"]
+            if latlong_session not in latlong_sessions:
+                latlong_sessions.append(latlong_session)
+                k.use_location(location_name)
+                import_latlong_points(
+                    wide_table=pipeline_options.get("wide_table", False),
+                    tmp_dir=pipeline_options.get("tmp_dir", k.TMP_DIR))
+        pipeline_options["import_latlong"] = False
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(run_location, location_name,
+                                   **pipeline_options)
+                   for location_name in location_names]
+        summaries = [future.result() for future in futures]
+    write_batch_summary(summaries)
+    return summaries
+
+
+def write_batch_summary(summaries: list,
+                        outfile: Optional[os.PathLike] = None):
+    outfile = (k.BASE_OUT_DIR / "batch_summary.json"
+               if outfile is None else outfile)
+    with open(outfile, "w") as f:
+        json.dump(summaries, f, indent=4)
+    print("\nBatch summary:\n")
+    for summary in summaries:
+        print(f"{summary['location']}: {summary['status']}"
+              f" in {summary['seconds']} s"
+              + (f", {summary['maps']} maps in {summary['output_dir']}"
+                 if summary["status"] == "done"
+                 else f" ({summary['error']})"))
+
+
+if __name__ == "__main__":
+    # Project points with pyproj and import them straight into the mapping
+    # location, instead of going through the lat/long location and v.proj
+    project_in_python = False
+    # Sample elevation and select points in memory before import (needs
+    # project_in_python), instead of v.what.rast and v.extract per vector
+    select_in_python = False
+    # Import each CASAS output table once with all selected variables
+    wide_table = False
+    # Read CASAS output tables and stream selected columns to v.in.ascii
+    # (needs project_in_python), instead of going through input.py text
+    # files in the temporary directory
+    stream_tables = False
+    table_columns = {"lon": "Longitude",
+                     "lat": "Latitude",
+                     "variables": ["meanTdda"]}
+    point_selection = {"altitude_cap": 2000,
+                       "lower_bound": 0}
+    # Trace GRASS GIS module runs by pipeline stage (see tracing.py)
+    trace_runs = False
+    # Reuse region, masks and rasters from previous runs (see cache.py)
+    use_cache = False
+    # One color rule over the overall range of all maps (see make_maps)
+    common_legend = False
+    # Import, mask and interpolate points through a backend (see
+    # backend.py), k.GRASS_BACKEND or k.MEMORY_BACKEND (needs
+    # project_in_python, select_in_python and stream_tables), instead of
+    # the GRASS GIS modules of the options above
+    backend = None
+    # Convert PNG maps from ps.map output, as the other formats, instead of
+    # drawing them with d.* commands (needs Ghostscript and Poppler)
+    png_from_ps = False
+    # Entry of locations.py to map
+    location = k.DEFAULT_LOCATION
+    # Entries of locations.py mapped at the same time (see run_locations);
+    # leave empty to map location only
+    batch_locations = []
+    pipeline_options = {"project_in_python": project_in_python,
+                        "select_in_python": select_in_python,
+                        "wide_table": wide_table,
+                        "stream_tables": stream_tables,
+                        "table_columns": table_columns,
+                        "point_selection": point_selection,
+                        "file_types": ["png", "ps"],
+                        "trace_file": (k.REPORT_DIR / "trace.json"
+                                       if trace_runs else None),
+                        "use_cache": use_cache,
+                        "common_legend": common_legend,
+                        "png_from_ps": png_from_ps,
+                        "backend": backend}
+    if batch_locations:
+        run_locations(batch_locations, **pipeline_options)
+    else:
+        k.use_location(location)
+        run_pipeline(**pipeline_options)
@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -29,19 +29,12 @@
 import os
 import pathlib
 import constants as k
+import gis_init as ini
 
-from dotenv import load_dotenv
-
-load_dotenv()  # needed for grass_session
-
-from grass_session import Session  # noqa E402
-import grass.script as grass  # noqa E402
-
-# grassbin = os.getenv("GRASSBIN")
+Session = ini.Session
+grass = ini.GrassModule("grass.script")
 
 current_dir = pathlib.Path(__file__).parent
-print(current_dir)
-os.environ["GRASS_ADDON_PATH"] = str(current_dir)
 
 
 def main():
@@ -50,6 +43,8 @@ def main():
 
 
 if __name__ == "__main__":
+    print(current_dir)
+    os.environ["GRASS_ADDON_PATH"] = str(current_dir)
     with Session(**k.latlong_session):
         options, flags = grass.parser()
         main()
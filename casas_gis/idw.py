@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Inverse distance weighting computed in-process with NumPy and SciPy,
+    as an alternative to the v.surf.idw GRASS GIS command. Point values are
+    interpolated over the current GRASS region, masked with the mapping
+    region and written back to GRASS with a single raster write. See
+    https://grass.osgeo.org/grass-stable/manuals/libpython/script.html#module-script.array
+    IDW weights depend only on point coordinates, region, mask, npoints and
+    power, so they are stored as a sparse cell-by-point matrix and reused
+    for every variable and year mapped on the same set of points.
+    """
+
+import collections
+import numpy as np
+import constants as k
+import gis_init as ini
+import cache
+
+from io import StringIO
+from typing import Optional
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+grass = ini.GrassModule("grass.script")
+garray = ini.GrassModule("grass.script.array")
+
+# Weight matrices already used in this process, keyed as in the cache
+_weight_matrices = collections.OrderedDict()
+
+
+def read_vector_points(vector_map: str,
+                       column_name: str,
+                       vector_layer: Optional[str] = 1):
+    """ Read point coordinates and attribute values of a vector map into
+        NumPy arrays. Points with no value (NULL) are dropped. """
+    points_output = grass.read_command("v.out.ascii",
+                                       input=vector_map,
+                                       layer=vector_layer,
+                                       type="point",
+                                       format="point",
+                                       separator="pipe",
+                                       columns=column_name)
+    # Each line is x|y|cat|value
+    points = np.genfromtxt(StringIO(points_output), delimiter="|",
+                           usecols=(0, 1, 3), ndmin=2)
+    points = points[~np.isnan(points).any(axis=1)]
+    return points[:, :2], points[:, 2]
+
+
+def region_cell_centers(region: dict):
+    """ Easting and northing of cell centers of a GRASS region, as returned
+        by grass.region(), in two arrays shaped (rows, cols). """
+    rows, cols = int(region["rows"]), int(region["cols"])
+    eastings = region["w"] + (np.arange(cols) + 0.5) * region["ewres"]
+    northings = region["n"] - (np.arange(rows) + 0.5) * region["nsres"]
+    return np.meshgrid(eastings, northings)
+
+
+def idw_values(point_coords: np.ndarray,
+               point_values: np.ndarray,
+               target_coords: np.ndarray,
+               number_of_points: Optional[int] = 3,
+               power: Optional[float] = 2.0):
+    """ Inverse distance weighted estimate at each target coordinate using
+        its number_of_points nearest points, same as v.surf.idw npoints and
+        power options. A target falling on a point takes its value. """
+    weights = idw_weight_matrix(point_coords=point_coords,
+                                target_coords=target_coords,
+                                number_of_points=number_of_points,
+                                power=power)
+    return weights @ point_values
+
+
+def idw_weight_matrix(point_coords: np.ndarray,
+                      target_coords: np.ndarray,
+                      number_of_points: Optional[int] = 3,
+                      power: Optional[float] = 2.0):
+    """ Sparse (targets x points) matrix of normalized IDW weights, so that
+        the interpolated values are the matrix-vector product of the matrix
+        and the point values. Each row has number_of_points non-zeros. """
+    number_of_points = min(number_of_points, len(point_coords))
+    tree = cKDTree(point_coords)
+    distances, indices = tree.query(target_coords, k=number_of_points)
+    distances = distances.reshape(len(target_coords), number_of_points)
+    indices = indices.reshape(len(target_coords), number_of_points)
+    with np.errstate(divide="ignore"):
+        weights = 1.0 / distances ** power
+    exact = np.isinf(weights)
+    exact_rows = exact.any(axis=1)
+    weights[exact_rows] = exact[exact_rows]
+    weights /= weights.sum(axis=1, keepdims=True)
+    rows = np.repeat(np.arange(len(target_coords)), number_of_points)
+    return sparse.csr_matrix((weights.ravel(), (rows, indices.ravel())),
+                             shape=(len(target_coords), len(point_coords)))
+
+
+def get_idw_weight_matrix(point_coords: np.ndarray,
+                          region: dict,
+                          mask: np.ndarray,
+                          number_of_points: Optional[int] = 3,
+                          power: Optional[float] = 2.0):
+    """ IDW weight matrix for the masked cells of a region, loaded from
+        the cache when one was already built for the same point
+        coordinates, region, mask, npoints and power. The least recently
+        used matrices are dropped beyond k.IDW_WEIGHTS_MEMORY_SIZE in memory
+        and k.IDW_WEIGHTS_CACHE_SIZE on disk. """
+    key = cache.hash_key(point_coords, cache.region_key(region), mask,
+                         number_of_points, power)
+    if key in _weight_matrices:
+        _weight_matrices.move_to_end(key)
+        return _weight_matrices[key]
+    weights_file = cache.cache_file("idw_weights", key, ".npz")
+    if weights_file.exists():
+        weights = sparse.load_npz(weights_file)
+        cache.touch_cache_file(weights_file)
+    else:
+        eastings, northings = region_cell_centers(region)
+        weights = idw_weight_matrix(
+            point_coords=point_coords,
+            target_coords=np.column_stack((eastings[mask],
+                                           northings[mask])),
+            number_of_points=number_of_points,
+            power=power)
+        with cache.atomic_file(weights_file) as f:
+            sparse.save_npz(f, weights)
+        cache.prune_cache_files("idw_weights", ".npz",
+                                k.IDW_WEIGHTS_CACHE_SIZE)
+    _weight_matrices[key] = weights
+    while len(_weight_matrices) > k.IDW_WEIGHTS_MEMORY_SIZE:
+        _weight_matrices.popitem(last=False)
+    return weights
+
+
+def read_region_mask(region_raster: Optional[str] = k.REGION_RASTER):
+    """ Boolean array of the current region, True where the mapping region
+        raster has data (r.out.bin writes NULL cells as zero). """
+    return garray.array(mapname=region_raster) != 0
+
+
+def interpolate_vector_idw_numpy(vector_map: str,
+                                 column_name: str,
+                                 output_map: str,
+                                 vector_layer: Optional[str] = 1,
+                                 number_of_points: Optional[int] = 3,
+                                 power: Optional[float] = 2.0,
+                                 region_raster: Optional[str] =
+                                 k.REGION_RASTER):
+    """ Interpolate a column of a vector map over the mapping region (the
+        whole region when region_raster is None) in memory and write the
+        result as a raster map. Takes the same arguments and returns the
+        same output raster name and statistics as
+        interpolation.interpolate_vector_idw, so engines can be swapped. """
+    point_coords, point_values = read_vector_points(vector_map,
+                                                    column_name,
+                                                    vector_layer)
+    region = grass.region()
+    mask = (np.ones((region["rows"], region["cols"]), bool)
+            if region_raster is None else read_region_mask(region_raster))
+    weights = get_idw_weight_matrix(point_coords=point_coords,
+                                    region=region,
+                                    mask=mask,
+                                    number_of_points=number_of_points,
+                                    power=power)
+    surface = np.full(mask.shape, np.nan)
+    surface[mask] = weights @ point_values
+    raster_stats = get_array_stats(surface[mask])
+    # NaN is the null value of floating point GRASS rasters
+    raster = garray.array()
+    raster[...] = surface
+    raster.write(mapname=output_map, overwrite=True)
+    return output_map, raster_stats
+
+
+def get_array_stats(values: np.ndarray):
+    """ Subset of r.univar -g statistics for an array of cell values. """
+    if values.size == 0:
+        return {"n": 0, "min": np.nan, "max": np.nan, "mean": np.nan}
+    return {"n": values.size,
+            "min": values.min(),
+            "max": values.max(),
+            "mean": values.mean()}
@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -17,13 +17,17 @@
 
 import os
 from pathlib import Path
+from typing import Optional
 import pandas as pd
 
 
+# Directories are created when files are written, not at import
 INPUT_DIR = os.path.join(os.getcwd(), 'casas_gis/input_data')
-os.makedirs(INPUT_DIR, exist_ok=True)
 TMP_DIR = os.path.join(os.getcwd(), 'casas_gis/tmp')
-os.makedirs(TMP_DIR, exist_ok=True)
+
+# Coordinates keep full precision, model output variables do not need it
+COORDINATE_DTYPE = 'float64'
+VARIABLE_DTYPE = 'float32'
 
 
 def csv_to_df(filepath):
@@ -31,6 +35,7 @@ def csv_to_df(filepath):
 
 
 def df_to_csv(df, filename, tmp_dir=TMP_DIR):
+    os.makedirs(tmp_dir, exist_ok=True)
     filepath = os.path.join(tmp_dir, filename)
     df.to_csv(filepath, sep='\t', index=False)
 
@@ -84,6 +89,114 @@ def select_variable(df_dict, lon, lat, variable, tmp_dir=TMP_DIR):
         df_to_csv(df_select, tmp_file_name, tmp_dir)
 
 
+def select_variables(df_dict, lon, lat, variables, tmp_dir=TMP_DIR):
+    """ Write one temporary file per CASAS output table with coordinates
+        and all selected variables, to be imported once as a single vector
+        map with one column per variable (see grass.ascii_to_vector). """
+    for key, df in df_dict.items():
+        lon_series = extract_columns_from_df(df, lon)
+        lat_series = extract_columns_from_df(df, lat)
+        variable_series = [extract_columns_from_df(df, variable)
+                           for variable in variables]
+        df_select = pd.concat([lon_series,
+                               lat_series,
+                               *variable_series], axis=1)
+        tmp_file_name = f"{key}.txt"
+        df_to_csv(df_select, tmp_file_name, tmp_dir)
+
+
+def get_column_names(filepath, column_ids):
+    """ Column names for a list of column names or integer indexes, as
+        accepted by extract_columns_from_df, from the file header only. """
+    header = pd.read_csv(filepath, sep='\t', nrows=0).columns
+    column_names = []
+    for column_id in column_ids:
+        try:
+            column_names.append(header[int(column_id)])
+        except ValueError:
+            column_names.append(column_id)
+    return column_names
+
+
+def read_table(filepath, lon, lat, variables,
+               engine: Optional[str] = None,
+               chunksize: Optional[int] = None):
+    """ Read only longitude, latitude and variable columns of a CASAS
+        output file, with explicit dtypes, so that wide string columns
+        such as Path_Archivo are never loaded. Columns are returned in the
+        order lon, lat, variables. With chunksize, returns an iterator of
+        tables of at most chunksize rows. engine='pyarrow' is faster on
+        large files but does not support chunksize. """
+    lon, lat, *variables = get_column_names(filepath,
+                                            [lon, lat, *variables])
+    columns = [lon, lat, *variables]
+    dtype = {lon: COORDINATE_DTYPE, lat: COORDINATE_DTYPE}
+    dtype.update({variable: VARIABLE_DTYPE for variable in variables})
+    if engine == 'pyarrow' and chunksize is not None:
+        raise ValueError("The pyarrow engine does not support chunksize")
+    tables = pd.read_csv(filepath, sep='\t', usecols=columns, dtype=dtype,
+                         engine=engine, chunksize=chunksize)
+    if chunksize is None:
+        return tables[columns]
+    return (chunk[columns] for chunk in tables)
+
+
+def iter_tables(lon, lat, variables,
+                input_dir=INPUT_DIR,
+                engine: Optional[str] = None,
+                chunksize: Optional[int] = None):
+    """ Yield (name, table) for CASAS output files in input_dir one at a
+        time, so that only one table (or one chunk of chunksize rows) is
+        in memory at any time. With chunksize, the same name is yielded
+        once per chunk. See read_table. """
+    # https://stackoverflow.com/a/10378012 (glob directory)
+    pathlist = Path(input_dir).rglob('*.txt')
+    for filepath in sorted(pathlist):
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        tables = read_table(filepath, lon, lat, variables,
+                            engine=engine, chunksize=chunksize)
+        if chunksize is None:
+            yield name, tables
+        else:
+            for chunk in tables:
+                yield name, chunk
+
+
+def select_tables(tables, tmp_dir=TMP_DIR,
+                  wide_table: Optional[bool] = False):
+    """ Write (name, table) pairs from iter_tables to temporary files, one
+        per variable as select_variable does or, with wide_table, one per
+        CASAS output table as select_variables does. Chunks of the same
+        table are appended to the same file. """
+    os.makedirs(tmp_dir, exist_ok=True)
+    written_files = set()
+    for key, df in tables:
+        if wide_table:
+            df_selects = {f"{key}.txt": df}
+        else:
+            df_selects = {f"{key}_{column}.txt": df.iloc[:, [0, 1, i]]
+                          for i, column in enumerate(df.columns[2:], 2)}
+        for tmp_file_name, df_select in df_selects.items():
+            filepath = os.path.join(tmp_dir, tmp_file_name)
+            append = tmp_file_name in written_files
+            df_select.to_csv(filepath, sep='\t', index=False,
+                             mode='a' if append else 'w',
+                             header=not append)
+            written_files.add(tmp_file_name)
+
+
+def print_table_columns(input_dir=INPUT_DIR):
+    """ Print numbered column names of each CASAS output file, reading
+        only the header line. """
+    pathlist = Path(input_dir).rglob('*.txt')
+    for filepath in sorted(pathlist):
+        header = pd.read_csv(filepath, sep='\t', nrows=0).columns
+        print(f'Columns of {Path(filepath).stem}:\n')
+        for index, column in enumerate(header):
+            print(f'{index:4}  {column}')
+        print('===========================================================\n')
+
+
 def concat_dfs(input_dir=INPUT_DIR):
     df_dict = csv_to_df_dict(input_dir)
     return pd.concat(df_dict.values(), ignore_index=True)
@@ -111,10 +224,11 @@ def test_df_concat(input_dir=INPUT_DIR):
 
 
 if __name__ == "__main__":
-    dict_of_dataframes = csv_to_df_dict()
-    get_df_info(dict_of_dataframes)
+    print_table_columns()
     longitude = input('Enter longitude "column name" or integer index: ')
     latitude = input('Enter latitude "column name" or integer index:  ')
-    variable = input('Enter variable "column name" or integer index: ')
-    select_variable(dict_of_dataframes,
-                    longitude, latitude, variable, tmp_dir=TMP_DIR)
+    variable = input('Enter variable "column name" or integer index '
+                     '(comma separated for a single wide table): ')
+    selected_tables = iter_tables(longitude, latitude, variable.split(","))
+    select_tables(selected_tables, tmp_dir=TMP_DIR,
+                  wide_table="," in variable)
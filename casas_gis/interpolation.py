@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -14,13 +14,23 @@
 
 """ Library of functionality reeated to interpolation. """
 
+import json
+import numpy as np
 import pandas as pd
 
 from typing import Optional
 from io import StringIO
 import constants as k
+import gis_init as ini
+import parallel as par
+import idw
+import mapcalc
+import points as pts
+import cache
+import sketch
 
-import grass.script as grass  # noqa E402
+grass = ini.GrassModule("grass.script")
+garray = ini.GrassModule("grass.script.array")
 
 
 def select_interpolation_points(digital_elevation_map,
@@ -43,12 +53,17 @@ def select_interpolation_points(digital_elevation_map,
                           map=vector_map,
                           raster=digital_elevation_map,
                           column="elevation")
+        map_name = vector_map.split("@")[0]
+        base_map_name = map_name.replace(k.IMPORTED_PREFIX, "", 1)
+        # Wide table vectors hold one column per variable (see
+        # grass.ascii_to_vector), so value bounds are applied per column
+        wide_table = base_map_name not in get_value_columns(vector_map)
         sql_conditions = []
         if altitude_cap is not None:
             sql_conditions.append(f"(elevation < {altitude_cap})")
-        elif upper_bound is not None:
+        elif upper_bound is not None and not wide_table:
             sql_conditions.append(f"({vector_map} <= {upper_bound})")
-        elif lower_bound is not None:
+        elif lower_bound is not None and not wide_table:
             sql_conditions.append(f"({vector_map} >= {lower_bound})")
         sql_formula = " and ".join(sql_conditions)
         output_map = vector_map.replace(k.IMPORTED_PREFIX,
@@ -57,124 +72,192 @@ def select_interpolation_points(digital_elevation_map,
                           input=vector_map,
                           output=output_map,
                           where=sql_formula)
+        if wide_table and altitude_cap is None:
+            drop_values_out_of_bounds(vector_map=output_map,
+                                      lower_bound=lower_bound,
+                                      upper_bound=upper_bound)
 
 
-def interpolate_points_idw(vector_layer: Optional[str] = 1,
-                           number_of_points: Optional[int] = 3,
-                           power: Optional[float] = 2.0):
-    """ Generate interpolated raster surface from vector point data based on
-        inverse distance weighting using v.surf.idw GRASS GIS command. """
+def drop_values_out_of_bounds(vector_map: str,
+                              lower_bound: Optional[float] = None,
+                              upper_bound: Optional[float] = None):
+    """ Set to NULL the values outside bounds in each variable column of a
+        wide table vector, so that points are dropped from interpolation of
+        that variable only. Interpolation skips NULL values. """
+    for column in get_value_columns(vector_map):
+        if upper_bound is not None:
+            sql_formula = f"({column} > {upper_bound})"
+        elif lower_bound is not None:
+            sql_formula = f"({column} < {lower_bound})"
+        else:
+            return
+        grass.run_command("v.db.update",
+                          map=vector_map.split("@")[0],
+                          column=column,
+                          value="NULL",
+                          where=sql_formula)
+
+
+def get_value_columns(vector_map: str):
+    """ Attribute columns of an imported vector map holding model output
+        variables, i.e., all columns except coordinates and elevation. """
+    columns = grass.vector_columns(vector_map)
+    return [column for column in columns if column not in k.POINT_COLUMNS]
+
+
+def get_interpolation_jobs(output_prefix: str):
+    """ List of (vector map, column, output raster) for each variable to be
+        interpolated. Vectors imported one per variable have a column named
+        after the map; wide table vectors have one column per variable and
+        output rasters are named after both table and column, so both give
+        the same raster names. """
     vector_list = grass.list_strings(type="vector",
                                      pattern=f"{k.SELECTED_PREFIX}*",
                                      mapset=".")
-    raster_stats = {}
-    max_values = []
-    min_values = []
+    interpolation_jobs = []
     for vector_map in vector_list:
         map_name = vector_map.split("@")[0]
         base_map_name = map_name.replace(k.SELECTED_PREFIX, "", 1)
-        output_map = map_name.replace(k.SELECTED_PREFIX,
-                                      k.IDW_PREFIX, 1)
-        grass.run_command("v.surf.idw", overwrite=True,
-                          flags="n",
-                          input=vector_map,
-                          layer=vector_layer,
-                          column=f"{base_map_name}",
-                          output=output_map,
-                          npoints=number_of_points,
-                          power=power)
-        # Clip interpolated raster to mapping region using map
-        # calculator because r.mask does not work with v.surf.idw
-        # see https://trac.osgeo.org/grass/ticket/3363
-        calc_expression_mask = (f"{output_map} = "
-                                f"if ({k.REGION_RASTER}, "
-                                f"{output_map}, null())")
-        grass.mapcalc(calc_expression_mask, overwrite=True)
-        raster_stats[output_map] = grass.parse_command("r.univar",
-                                                       flags=("ge"),
-                                                       map=output_map)
-        max_values.append(raster_stats[output_map]["max"])
-        min_values.append(raster_stats[output_map]["min"])
-    abs_max_idw = max(max_values)
-    abs_min_idw = min(min_values)
+        value_columns = get_value_columns(vector_map)
+        if base_map_name in value_columns:
+            interpolation_jobs.append(
+                (vector_map, base_map_name,
+                 f"{output_prefix}{base_map_name}"))
+        else:
+            interpolation_jobs.extend(
+                (vector_map, column,
+                 f"{output_prefix}{base_map_name}_{column}")
+                for column in value_columns)
+    return interpolation_jobs
+
+
+def interpolate_points_idw(vector_layer: Optional[str] = 1,
+                           number_of_points: Optional[int] = 3,
+                           power: Optional[float] = 2.0,
+                           n_workers: Optional[int] = None,
+                           engine: Optional[str] = k.GRASS_ENGINE,
+                           use_cache: Optional[bool] = False,
+                           sketches: Optional[dict] = None):
+    """ Generate interpolated raster surface from vector point data based on
+        inverse distance weighting using v.surf.idw GRASS GIS command, or
+        in-process with NumPy when engine is k.NUMPY_ENGINE (see idw.py).
+        When n_workers is greater than one, vector maps are interpolated in
+        a pool of processes (see parallel.py). With use_cache, rasters
+        already interpolated from the same inputs are reused (see cache.py).
+        sketches, when given, is filled as in run_interpolation_jobs. """
+    if engine not in k.IDW_ENGINES:
+        raise ValueError(f"Unknown IDW engine '{engine}', "
+                         f"use one of {sorted(k.IDW_ENGINES)}")
+    interpolation_functions = {
+        k.GRASS_ENGINE: interpolate_vector_idw,
+        k.NUMPY_ENGINE: idw.interpolate_vector_idw_numpy}
+    jobs = [{"vector_map": vector_map,
+             "column_name": column_name,
+             "output_map": output_map,
+             "vector_layer": vector_layer,
+             "number_of_points": number_of_points,
+             "power": power,
+             "region_raster": get_region_raster()}
+            for vector_map, column_name, output_map
+            in get_interpolation_jobs(k.IDW_PREFIX)]
+    raster_stats = run_interpolation_jobs(
+        interpolation_functions[engine], jobs, n_workers, use_cache,
+        batch_postprocessing=engine == k.GRASS_ENGINE,
+        sketches=sketches)
+    abs_max_idw, abs_min_idw = get_absolute_range(raster_stats)
     # This is testing code that may go away at some point
-    print("Absolute (idw) raster max is ", max(max_values))
-    print("Absolute (idw) raster min is ", min(min_values))
+    print("Absolute (idw) raster max is ", abs_max_idw)
+    print("Absolute (idw) raster min is ", abs_min_idw)
 
     return abs_max_idw, abs_min_idw
 
 
+def interpolate_vector_idw(vector_map: str,
+                           column_name: str,
+                           output_map: str,
+                           vector_layer: Optional[str] = 1,
+                           number_of_points: Optional[int] = 3,
+                           power: Optional[float] = 2.0,
+                           region_raster: Optional[str] = k.REGION_RASTER,
+                           postprocess: Optional[bool] = True):
+    """ Interpolate a column of a vector map with v.surf.idw and clip it to
+        the mapping region. Returns output raster name and its statistics
+        or, without postprocess, output raster name and the r.mapcalc
+        assignment that clips it (see run_interpolation_jobs). """
+    grass.run_command("v.surf.idw", overwrite=True,
+                      flags="n",
+                      input=vector_map,
+                      layer=vector_layer,
+                      column=f"{column_name}",
+                      output=output_map,
+                      npoints=number_of_points,
+                      power=power)
+    # Clip interpolated raster to mapping region using map
+    # calculator because r.mask does not work with v.surf.idw
+    # see https://trac.osgeo.org/grass/ticket/3363
+    calc_expression_mask = mapcalc.assign(
+        output_map, mapcalc.where(output_map, region_raster))
+    if not postprocess:
+        return output_map, calc_expression_mask
+    mapcalc.evaluate([calc_expression_mask])
+    return output_map, get_raster_stats(output_map)
+
+
 def interpolate_points_bspline(vector_layer: Optional[str] = "1",
                                avg_west_distance: Optional[float] = None,
                                avg_north_distance: Optional[float] = None,
                                method: Optional[str] = "bicubic",
-                               smoothing_parameter: Optional[float] = None):
+                               smoothing_parameter: Optional[float] = None,
+                               n_workers: Optional[int] = None,
+                               use_cache: Optional[bool] = False,
+                               tune_lambda: Optional[bool] = False,
+                               sketches: Optional[dict] = None):
     """ Generate interpolated raster surface from vector point data based on
         bicubic or bilinear spline interpolation with Tykhonov regularization
         using v.surf.bspline GRASS GIS command. See also
         https://lists.osgeo.org/pipermail/grass-user/2010-February/054868.html
+        When n_workers is greater than one, vector maps are interpolated in a
+        pool of processes (see parallel.py). With use_cache, rasters already
+        interpolated from the same inputs are reused (see cache.py).
+        With tune_lambda and no smoothing_parameter, the smoothing
+        parameter of each vector map is found by a coarse-to-fine k-fold
+        search (see tune_bspline_lambda) instead of v.surf.bspline -c.
         """
-    vector_list = grass.list_strings(type="vector",
-                                     pattern=f"{k.SELECTED_PREFIX}*",
-                                     mapset=".")
-    compute_distance_between_points = (avg_west_distance or
-                                       avg_north_distance) is None
-    compute_smoothing_parameter = smoothing_parameter is None
-    raster_stats = {}
-    max_values = []
-    min_values = []
-    for vector_map in vector_list:
-        map_name = vector_map.split("@")[0]
-        base_map_name = map_name.replace(k.SELECTED_PREFIX, "", 1)
-        output_map = map_name.replace(k.SELECTED_PREFIX,
-                                      k.BSPLINE_PREFIX, 1)
-        if compute_distance_between_points:
-            distance_pair = get_distance_points_bspline(
-                input_vector_map=vector_map,
-                output_raster_map=output_map,
-                column_name=base_map_name)
-            avg_west_distance, avg_north_distance = distance_pair
-        if compute_smoothing_parameter:
-            smoothing_parameter = cross_validate_bspline(
-                input_vector_map=vector_map,
-                output_raster_map=output_map,
-                column_name=base_map_name,
-                avg_west_distance=avg_west_distance,
-                avg_north_distance=avg_north_distance,
+    jobs = [{"vector_map": vector_map,
+             "column_name": column_name,
+             "output_map": output_map,
+             "vector_layer": vector_layer,
+             "avg_west_distance": avg_west_distance,
+             "avg_north_distance": avg_north_distance,
+             "method": method,
+             "smoothing_parameter": smoothing_parameter,
+             "region_raster": get_region_raster()}
+            for vector_map, column_name, output_map
+            in get_interpolation_jobs(k.BSPLINE_PREFIX)]
+    if tune_lambda and smoothing_parameter is None:
+        for job in jobs:
+            if (job["avg_west_distance"] or
+                    job["avg_north_distance"]) is None:
+                (job["avg_west_distance"],
+                 job["avg_north_distance"]) = get_distance_points_bspline(
+                    input_vector_map=job["vector_map"],
+                    output_raster_map=job["output_map"],
+                    column_name=job["column_name"],
+                    vector_layer=vector_layer)
+            job["smoothing_parameter"] = tune_bspline_lambda(
+                vector_map=job["vector_map"],
+                column_name=job["column_name"],
+                output_map=job["output_map"],
+                avg_west_distance=job["avg_west_distance"],
+                avg_north_distance=job["avg_north_distance"],
                 method=method,
-                vector_layer=vector_layer)
-        grass.run_command("v.surf.bspline", overwrite=True,
-                          verbose=True,
-                          input=vector_map,
-                          layer=vector_layer,
-                          column=base_map_name,
-                          raster_output=output_map,
-                          mask=k.REGION_RASTER,
-                          ew_step=avg_west_distance,
-                          ns_step=avg_north_distance,
-                          method=method,
-                          lambda_i=smoothing_parameter)
-        # Remember to implement min-max check (lines 620-630 in gis script).
-        vector_stats = grass.parse_command("v.univar",
-                                           flags=("ge"),
-                                           map=vector_map,
-                                           layer=vector_layer,
-                                           type="point",
-                                           column=base_map_name)
-        vector_max = vector_stats["max"]
-        vector_min = vector_stats["min"]
-        calc_expression_minmax = (f"{output_map} = "
-                                  f"if (({output_map} < {vector_max}) && "
-                                  f"({output_map} > {vector_min}), "
-                                  f"{output_map}, null())")
-        grass.mapcalc(calc_expression_minmax, overwrite=True)
-        raster_stats[output_map] = grass.parse_command("r.univar",
-                                                       flags=("ge"),
-                                                       map=output_map)
-        max_values.append(raster_stats[output_map]["max"])
-        min_values.append(raster_stats[output_map]["min"])
-    abs_max_bspline = max(max_values)
-    abs_min_bspline = min(min_values)
+                vector_layer=vector_layer,
+                n_workers=n_workers)
+    raster_stats = run_interpolation_jobs(interpolate_vector_bspline,
+                                          jobs, n_workers, use_cache,
+                                          batch_postprocessing=True,
+                                          sketches=sketches)
+    abs_max_bspline, abs_min_bspline = get_absolute_range(raster_stats)
     # This is testing code that may go away at some point
     print("Absolute (bspline) raster max is ", abs_max_bspline)
     print("Absolute (bspline) raster min is ", abs_min_bspline)
@@ -182,23 +265,240 @@ def interpolate_points_bspline(vector_layer: Optional[str] = "1",
     return abs_max_bspline, abs_min_bspline
 
 
+def interpolate_vector_bspline(vector_map: str,
+                               column_name: str,
+                               output_map: str,
+                               vector_layer: Optional[str] = "1",
+                               avg_west_distance: Optional[float] = None,
+                               avg_north_distance: Optional[float] = None,
+                               method: Optional[str] = "bicubic",
+                               smoothing_parameter: Optional[float] = None,
+                               region_raster: Optional[str] = k.REGION_RASTER,
+                               postprocess: Optional[bool] = True):
+    """ Interpolate a column of a vector map with v.surf.bspline and drop
+        cells outside the range of point values. Returns output raster name
+        and its statistics or, without postprocess, output raster name and
+        the r.mapcalc assignment that drops them (see
+        run_interpolation_jobs). """
+    compute_distance_between_points = (avg_west_distance or
+                                       avg_north_distance) is None
+    compute_smoothing_parameter = smoothing_parameter is None
+    if compute_distance_between_points:
+        distance_pair = get_distance_points_bspline(
+            input_vector_map=vector_map,
+            output_raster_map=output_map,
+            column_name=column_name)
+        avg_west_distance, avg_north_distance = distance_pair
+    if compute_smoothing_parameter:
+        smoothing_parameter = cross_validate_bspline(
+            input_vector_map=vector_map,
+            output_raster_map=output_map,
+            column_name=column_name,
+            avg_west_distance=avg_west_distance,
+            avg_north_distance=avg_north_distance,
+            method=method,
+            vector_layer=vector_layer,
+            region_raster=region_raster)
+    grass.run_command("v.surf.bspline", overwrite=True,
+                      verbose=True,
+                      input=vector_map,
+                      layer=vector_layer,
+                      column=column_name,
+                      raster_output=output_map,
+                      mask=region_raster,
+                      ew_step=avg_west_distance,
+                      ns_step=avg_north_distance,
+                      method=method,
+                      lambda_i=smoothing_parameter)
+    # Remember to implement min-max check (lines 620-630 in gis script).
+    vector_stats = grass.parse_command("v.univar",
+                                       flags=("ge"),
+                                       map=vector_map,
+                                       layer=vector_layer,
+                                       type="point",
+                                       column=column_name)
+    vector_max = vector_stats["max"]
+    vector_min = vector_stats["min"]
+    calc_expression_minmax = mapcalc.assign(
+        output_map,
+        mapcalc.where(output_map,
+                      mapcalc.within(output_map, vector_min, vector_max)))
+    if not postprocess:
+        return output_map, calc_expression_minmax
+    mapcalc.evaluate([calc_expression_minmax])
+    return output_map, get_raster_stats(output_map)
+
+
+def run_interpolation_jobs(interpolation_function,
+                           jobs: list,
+                           n_workers: Optional[int] = None,
+                           use_cache: Optional[bool] = False,
+                           batch_postprocessing: Optional[bool] = False,
+                           sketches: Optional[dict] = None):
+    """ Run one interpolation function per job, either one after another
+        in the current mapset or, when n_workers is greater than one, in a
+        pool of processes each working in its own temporary mapset. In the
+        latter case, output rasters are copied back to the current mapset.
+        With use_cache, jobs whose inputs match a cached raster are not run
+        and the cached raster is copied instead (see cache.py).
+        With batch_postprocessing, interpolation functions only return the
+        r.mapcalc assignments that clip their rasters, and all rasters are
+        clipped by a single r.mapcalc run (see mapcalc.py).
+        When sketches is a dictionary, it is filled with a quantile sketch
+        of the cells of each raster, keyed by raster name, for color rules
+        over all rasters (see color.set_shared_color_rule). With
+        batch_postprocessing, sketches and statistics come from the same
+        single read of each raster; otherwise rasters are read once more.
+        Sketches are cached with the rasters.
+        Returns a dictionary of raster statistics keyed by raster name. """
+    raster_stats = {}
+    if use_cache:
+        job_keys = get_interpolation_keys(interpolation_function, jobs)
+        jobs_to_run = []
+        for job in jobs:
+            cached_stats = cache.restore_raster(
+                key=job_keys[job["output_map"]],
+                output_map=job["output_map"])
+            if cached_stats is None:
+                jobs_to_run.append(job)
+                continue
+            cached_sketch = cached_stats.pop("sketch", None)
+            if sketches is not None and cached_sketch is not None:
+                sketches[job["output_map"]] = (
+                    sketch.QuantileSketch.from_dict(cached_sketch))
+            raster_stats[job["output_map"]] = cached_stats
+        jobs = jobs_to_run
+    if batch_postprocessing:
+        jobs = [dict(job, postprocess=False) for job in jobs]
+    if n_workers is None or n_workers <= 1:
+        for job in jobs:
+            output_map, stats = interpolation_function(**job)
+            raster_stats[output_map] = stats
+    elif jobs:
+        par.save_shared_region()
+        results = par.map_in_temporary_mapsets(
+            session_settings=k.mapping_session,
+            func=interpolation_function,
+            jobs=jobs,
+            n_workers=n_workers,
+            merge=merge_interpolated_raster)
+        for output_map, stats in results:
+            raster_stats[output_map] = stats
+    output_maps = [job["output_map"] for job in jobs]
+    if batch_postprocessing:
+        mapcalc.evaluate([raster_stats[output_map]
+                          for output_map in output_maps])
+        for output_map in output_maps:
+            if sketches is None:
+                raster_stats[output_map] = get_raster_stats(output_map)
+            else:
+                # Instead of r.univar, not in addition to it
+                (raster_stats[output_map],
+                 sketches[output_map]) = get_raster_summary(output_map)
+    if sketches is not None:
+        for output_map in set(raster_stats) - set(sketches):
+            _, sketches[output_map] = get_raster_summary(output_map)
+    if use_cache:
+        for output_map in output_maps:
+            cache.store_raster(
+                key=job_keys[output_map],
+                raster_map=output_map,
+                raster_stats=raster_stats[output_map],
+                sketch=(None if sketches is None
+                        else sketches[output_map].to_dict()))
+    return raster_stats
+
+
+def merge_interpolated_raster(tmp_mapset: str,
+                              result: tuple):
+    """ Copy the output raster of an interpolation job from its temporary
+        mapset (see parallel.map_in_temporary_mapsets). """
+    output_map, _ = result
+    par.merge_rasters_from_mapset(raster_maps=[output_map],
+                                  tmp_mapset=tmp_mapset)
+
+
+def get_interpolation_keys(interpolation_function,
+                           jobs: list):
+    """ Cache key of each job, keyed by output raster: a hash of point
+        coordinates and values, region, mask and interpolation function
+        and parameters. """
+    region_key = cache.region_key(grass.region())
+    mask_keys = {}
+    job_keys = {}
+    for job in jobs:
+        region_raster = job["region_raster"]
+        if region_raster not in mask_keys:
+            mask_keys[region_raster] = cache.hash_key(
+                idw.read_region_mask(region_raster))
+        point_coords, point_values = idw.read_vector_points(
+            vector_map=job["vector_map"],
+            column_name=job["column_name"],
+            vector_layer=job["vector_layer"])
+        parameters = {name: value for name, value in job.items()
+                      if name not in ("vector_map", "column_name",
+                                      "output_map", "region_raster",
+                                      "postprocess")}
+        job_keys[job["output_map"]] = cache.hash_key(
+            interpolation_function.__name__,
+            point_coords, point_values,
+            region_key, mask_keys[region_raster],
+            parameters)
+    return job_keys
+
+
+def get_raster_stats(raster_map: str):
+    return grass.parse_command("r.univar",
+                               flags=("ge"),
+                               map=raster_map)
+
+
+def get_raster_summary(raster_map: str,
+                       compression: Optional[int] = 100):
+    """ Statistics (as idw.get_array_stats) and quantile sketch of the
+        cells of a raster, read once. """
+    values = np.asarray(garray.array(mapname=raster_map, null="nan"))
+    values = values[~np.isnan(values)]
+    values_sketch = sketch.QuantileSketch(compression).update(values)
+    if values.size == 0:
+        return {"n": 0, "min": np.nan, "max": np.nan,
+                "mean": np.nan}, values_sketch
+    return idw.get_array_stats(values), values_sketch
+
+
+def get_region_raster():
+    """ Fully qualified name of the mapping region raster, so that it can
+        also be found from temporary mapsets. """
+    return f"{k.REGION_RASTER}@{k.mapping_session['mapset']}"
+
+
+def get_absolute_range(raster_stats: dict):
+    """ Absolute max and min across statistics of all rasters, as returned
+        by r.univar -g (values are parsed as strings). Rasters with no
+        cells, whose min and max are NaN, are left out; NaN when all of
+        them are empty. """
+    raster_stats = [stats for stats in raster_stats.values()
+                    if float(stats["n"]) > 0]
+    if not raster_stats:
+        return np.nan, np.nan
+    return (max(float(stats["max"]) for stats in raster_stats),
+            min(float(stats["min"]) for stats in raster_stats))
+
+
 def get_distance_points_bspline(input_vector_map: str,
                                 output_raster_map: str,
                                 column_name: str,
                                 vector_layer: Optional[str] = "1"):
-    """ Run v.surf.bspline with the -e flag first to get estimated mean
-        distance between points. That needs to be multiplied by two and
-        assigned to ew_step and ns_step. """
-    distance_output = grass.read_command("v.surf.bspline",
-                                         overwrite=True,
-                                         flags="e",
-                                         input=input_vector_map,
-                                         layer=vector_layer,
-                                         column=column_name,
-                                         raster_output=output_raster_map)
-    distance = distance_output.split()
-    # use tuple unpacking? (Bob 2021-12-15)
-    decimal_distance = float(distance[-1])
+    """ Mean distance between points, multiplied by two as ew_step and
+        ns_step of v.surf.bspline. Computed from point coordinates as mean
+        nearest neighbour distance (see points.mean_point_spacing) rather
+        than with a v.surf.bspline -e run per variable, so all variables
+        on the same points share it. output_raster_map is not used and is
+        kept for existing callers. """
+    point_coords, _ = idw.read_vector_points(vector_map=input_vector_map,
+                                             column_name=column_name,
+                                             vector_layer=vector_layer)
+    decimal_distance = pts.mean_point_spacing(point_coords)
     avg_west_distance = avg_north_distance = decimal_distance * 2
     return avg_west_distance, avg_north_distance
 
@@ -209,7 +509,8 @@ def cross_validate_bspline(input_vector_map: str,
                            avg_west_distance: float,
                            avg_north_distance: float,
                            method: str,
-                           vector_layer: Optional[str] = "1"):
+                           vector_layer: Optional[str] = "1",
+                           region_raster: Optional[str] = k.REGION_RASTER):
     """ Run v.surf.bspline with the -c flag to find the best Tykhonov
         regularizing parameter using a "leave-one-out" cross validation
         method, and assign the resulting value to lambda_i (smoothing). """
@@ -221,7 +522,7 @@ def cross_validate_bspline(input_vector_map: str,
         layer=vector_layer,
         column=f"{column_name}",
         raster_output=output_raster_map,
-        mask=k.REGION_RASTER,
+        mask=region_raster,
         ew_step=avg_west_distance,
         ns_step=avg_north_distance,
         method=method)
@@ -238,7 +539,8 @@ def cross_validate_bspline(input_vector_map: str,
         cross_validation_df[minimizer_column].idxmin()]["lambda"]
     # Print cross validation report
     outfile_path = k.REPORT_DIR
-    outfile_name = f"{column_name}_cross_validation.txt"
+    report_name = output_raster_map.replace(k.BSPLINE_PREFIX, "", 1)
+    outfile_name = f"{report_name}_cross_validation.txt"
     outfile = outfile_path / outfile_name
     cross_validation_output = (
         "Cross validation for\new_step (average west distance) = "
@@ -251,3 +553,210 @@ def cross_validate_bspline(input_vector_map: str,
     with open(outfile, 'w') as f:
         f.write(cross_validation_output)
     return smoothing_parameter
+
+
+def tune_bspline_lambda(vector_map: str,
+                        column_name: str,
+                        output_map: str,
+                        avg_west_distance: float,
+                        avg_north_distance: float,
+                        method: str,
+                        vector_layer: Optional[str] = "1",
+                        n_workers: Optional[int] = None,
+                        n_folds: Optional[int] = k.BSPLINE_CV_FOLDS,
+                        coarse_lambdas: Optional[tuple] =
+                        k.BSPLINE_COARSE_LAMBDAS,
+                        refine_steps: Optional[int] = 5):
+    """ Find the smoothing parameter (lambda_i) of v.surf.bspline with the
+        lowest k-fold cross validation rms error in two stages: coarse
+        candidates first, then refine_steps values on a log grid spanning
+        the neighbouring coarse candidates of the best one. Candidates of
+        each stage are evaluated in parallel (see evaluate_bspline_lambdas).
+        The result depends on point coordinates, steps and method only, so
+        it is cached and reused for all variables and years mapped on the
+        same points. """
+    point_coords, _ = idw.read_vector_points(vector_map,
+                                             column_name,
+                                             vector_layer)
+    key = cache.hash_key("bspline_lambda", point_coords,
+                         float(avg_west_distance), float(avg_north_distance),
+                         method, n_folds, tuple(coarse_lambdas), refine_steps)
+    tuning_file = cache.cache_file("bspline_lambda", key, ".json")
+    if tuning_file.exists():
+        with open(tuning_file) as f:
+            smoothing_parameter = json.load(f)["lambda"]
+        print(f"Reusing tuned lambda_i {smoothing_parameter} for {output_map}")
+        return smoothing_parameter
+    rms_errors = evaluate_bspline_lambdas(
+        vector_map=vector_map,
+        column_name=column_name,
+        avg_west_distance=avg_west_distance,
+        avg_north_distance=avg_north_distance,
+        method=method,
+        lambdas=coarse_lambdas,
+        vector_layer=vector_layer,
+        n_folds=n_folds,
+        n_workers=n_workers)
+    coarse_best = min(rms_errors, key=rms_errors.get)
+    log_lambdas = np.log10(sorted(coarse_lambdas))
+    best_index = int(np.argmin(np.abs(log_lambdas - np.log10(coarse_best))))
+    fine_lambdas = np.logspace(log_lambdas[max(best_index - 1, 0)],
+                               log_lambdas[min(best_index + 1,
+                                               len(log_lambdas) - 1)],
+                               refine_steps)
+    rms_errors.update(evaluate_bspline_lambdas(
+        vector_map=vector_map,
+        column_name=column_name,
+        avg_west_distance=avg_west_distance,
+        avg_north_distance=avg_north_distance,
+        method=method,
+        lambdas=[float(smoothing_parameter)
+                 for smoothing_parameter in fine_lambdas
+                 if not np.isclose(list(rms_errors),
+                                   smoothing_parameter).any()],
+        vector_layer=vector_layer,
+        n_folds=n_folds,
+        n_workers=n_workers))
+    smoothing_parameter = min(rms_errors, key=rms_errors.get)
+    with cache.atomic_file(tuning_file, "w") as f:
+        json.dump({"lambda": smoothing_parameter,
+                   "rms": sorted(rms_errors.items())}, f, indent=1)
+    write_lambda_search_report(output_map=output_map,
+                               avg_west_distance=avg_west_distance,
+                               avg_north_distance=avg_north_distance,
+                               n_folds=n_folds,
+                               smoothing_parameter=smoothing_parameter,
+                               rms_errors=rms_errors)
+    return smoothing_parameter
+
+
+def evaluate_bspline_lambdas(vector_map: str,
+                             column_name: str,
+                             avg_west_distance: float,
+                             avg_north_distance: float,
+                             method: str,
+                             lambdas: list,
+                             vector_layer: Optional[str] = "1",
+                             n_folds: Optional[int] = k.BSPLINE_CV_FOLDS,
+                             n_workers: Optional[int] = None):
+    """ Cross validation rms error of each smoothing parameter in lambdas,
+        one after another or, when n_workers is greater than one, in a pool
+        of processes each working in its own temporary mapset. """
+    jobs = [{"vector_map": vector_map,
+             "column_name": column_name,
+             "vector_layer": vector_layer,
+             "ew_step": avg_west_distance,
+             "ns_step": avg_north_distance,
+             "method": method,
+             "smoothing_parameter": smoothing_parameter,
+             "n_folds": n_folds}
+            for smoothing_parameter in lambdas]
+    if n_workers is None or n_workers <= 1:
+        rms_errors = [cross_validate_bspline_lambda(**job) for job in jobs]
+    else:
+        par.save_shared_region()
+        rms_errors = par.map_in_temporary_mapsets(
+            session_settings=k.mapping_session,
+            func=cross_validate_bspline_lambda,
+            jobs=jobs,
+            n_workers=n_workers)
+    return dict(zip(lambdas, rms_errors))
+
+
+def cross_validate_bspline_lambda(vector_map: str,
+                                  column_name: str,
+                                  vector_layer: str,
+                                  ew_step: float,
+                                  ns_step: float,
+                                  method: str,
+                                  smoothing_parameter: float,
+                                  n_folds: Optional[int] =
+                                  k.BSPLINE_CV_FOLDS):
+    """ Root mean square error of v.surf.bspline with one smoothing
+        parameter in a k-fold cross validation: points are split into
+        n_folds by category, and each fold is predicted at its own points
+        (sparse_input) from a surface fitted to the other folds. """
+    fold_maps = [f"cv_train_{column_name}", f"cv_test_{column_name}",
+                 f"cv_predicted_{column_name}"]
+    train_map, test_map, predicted_map = fold_maps
+    squared_errors = []
+    for fold in range(n_folds):
+        for output, operator in ((train_map, "!="), (test_map, "=")):
+            grass.run_command("v.extract", overwrite=True, quiet=True,
+                              input=vector_map,
+                              layer=vector_layer,
+                              where=(f"cat % {n_folds} {operator} {fold} "
+                                     f"AND {column_name} IS NOT NULL"),
+                              output=output)
+        grass.run_command("v.surf.bspline", overwrite=True, quiet=True,
+                          input=train_map,
+                          layer=vector_layer,
+                          column=column_name,
+                          sparse_input=test_map,
+                          output=predicted_map,
+                          ew_step=ew_step,
+                          ns_step=ns_step,
+                          method=method,
+                          lambda_i=smoothing_parameter)
+        observed = read_point_values(test_map, column_name, vector_layer)
+        predicted = read_sparse_predictions(predicted_map)
+        squared_errors.extend((predicted[cat] - value) ** 2
+                              for cat, value in observed.items()
+                              if cat in predicted)
+    grass.run_command("g.remove", flags="f", quiet=True,
+                      type="vector",
+                      name=",".join(fold_maps))
+    return float(np.sqrt(np.mean(squared_errors)))
+
+
+def read_point_values(vector_map: str,
+                      column_name: str,
+                      vector_layer: Optional[str] = "1"):
+    """ Attribute values of points keyed by category. """
+    points_output = grass.read_command("v.out.ascii",
+                                       input=vector_map,
+                                       layer=vector_layer,
+                                       type="point",
+                                       format="point",
+                                       separator="pipe",
+                                       columns=column_name)
+    # Each line is x|y|cat|value
+    points = np.genfromtxt(StringIO(points_output), delimiter="|",
+                           usecols=(2, 3), ndmin=2)
+    return {int(cat): value for cat, value in points}
+
+
+def read_sparse_predictions(vector_map: str):
+    """ Values interpolated by v.surf.bspline at sparse_input points, which
+        it writes as the z coordinate of 3D points, keyed by category. """
+    points_output = grass.read_command("v.out.ascii",
+                                       input=vector_map,
+                                       type="point",
+                                       format="point",
+                                       separator="pipe")
+    # Each line is x|y|z|cat
+    points = np.genfromtxt(StringIO(points_output), delimiter="|",
+                           usecols=(2, 3), ndmin=2)
+    return {int(cat): z for z, cat in points}
+
+
+def write_lambda_search_report(output_map: str,
+                               avg_west_distance: float,
+                               avg_north_distance: float,
+                               n_folds: int,
+                               smoothing_parameter: float,
+                               rms_errors: dict):
+    report_name = output_map.replace(k.BSPLINE_PREFIX, "", 1)
+    outfile = k.REPORT_DIR / f"{report_name}_lambda_search.txt"
+    lines = [f"{n_folds}-fold cross validation for",
+             f"ew_step (average west distance) = {avg_west_distance} and",
+             f"ns_step (average north distance) = {avg_north_distance}",
+             f"Selected lambda_i (smoothing parameter) = "
+             f"{smoothing_parameter} (minimizes rms)",
+             "",
+             "lambda|rms"]
+    lines.extend(f"{smoothing_parameter}|{rms_error}"
+                 for smoothing_parameter, rms_error
+                 in sorted(rms_errors.items()))
+    with open(outfile, 'w') as f:
+        f.write("\n".join(lines) + "\n")
@@ -2,9 +2,9 @@
 #
 # AUTHOR(S):    Luigi Ponti quartese gmail com
 #
-# PURPOSE:      
+# PURPOSE:
 #
-# NOTE:         
+# NOTE:
 #
 # Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
 #                   of Sustainable Agricultural Systems).
@@ -36,7 +36,11 @@ andalusia = {
             "color": "128:128:128",
             "width": 3
         },
-        "target_region": "andalusia",
+        "target_region": {
+            "map_name": "andalusia",
+            "color": "23:23:23",
+            "width": 3
+        },
         "admin_divisions": {
             "map_name": "andalusia_provinces",
             "column": "iso_3166_2",
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Build r.mapcalc expressions out of conditions, so that masking,
+    clipping and clamping a raster is a single expression, i.e., a single
+    pass over the raster, and evaluate several expressions with a single
+    r.mapcalc run that writes all of their output rasters. See
+    https://grass.osgeo.org/grass-stable/manuals/r.mapcalc.html """
+
+import gis_init as ini
+
+from typing import Optional
+
+grass = ini.GrassModule("grass.script")
+
+
+def all_of(*conditions):
+    """ Conditions joined with &&, skipping None. Returns None when there
+        are no conditions. """
+    conditions = [f"({condition})" for condition in conditions
+                  if condition is not None]
+    return " && ".join(conditions) if conditions else None
+
+
+def within(expression: str,
+           min_value: Optional[float] = None,
+           max_value: Optional[float] = None):
+    """ Condition that expression is strictly between min_value and
+        max_value (either bound can be left out). """
+    lower = None if min_value is None else f"{expression} > {min_value}"
+    upper = None if max_value is None else f"{expression} < {max_value}"
+    return all_of(lower, upper)
+
+
+def where(value: str,
+          *conditions):
+    """ value where all conditions hold, null elsewhere. """
+    condition = all_of(*conditions)
+    if condition is None:
+        return value
+    return f"if ({condition}, {value}, null())"
+
+
+def assign(output_map: str,
+           expression: str):
+    return f"{output_map} = {expression}"
+
+
+def evaluate(assignments: list,
+             overwrite: Optional[bool] = True,
+             **kwargs):
+    """ Run all assignments (see assign) in one r.mapcalc process, which
+        reads each input row once for all output rasters. An output raster
+        can also be one of the inputs. """
+    if assignments:
+        grass.mapcalc("\n".join(assignments), overwrite=overwrite, **kwargs)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Run GRASS GIS work in a pool of processes. Each worker opens its own
+    GRASS session and switches to a temporary mapset, so that workers never
+    write to the same mapset at the same time. See
+    https://grasswiki.osgeo.org/wiki/Parallelizing_Scripts """
+
+import os
+import shutil
+import pathlib
+import uuid
+import constants as k
+import gis_init as ini
+import tracing
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+Session = ini.Session
+grass = ini.GrassModule("grass.script")
+
+
+def save_shared_region(region_name: Optional[str] = k.SHARED_REGION):
+    """ Save current computational region in the current mapset so that
+        workers running in temporary mapsets can restore it. """
+    grass.run_command("g.region", overwrite=True, save=region_name)
+
+
+def get_temporary_mapset_name():
+    """ Name for a new temporary mapset, unique across processes. """
+    return f"{k.TMP_MAPSET_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}"
+
+
+def run_in_temporary_mapset(session_settings: dict,
+                            func: Callable,
+                            *args,
+                            tmp_mapset: Optional[str] = None,
+                            region_name: Optional[str] = k.SHARED_REGION,
+                            **kwargs):
+    """ Open a GRASS session on the mapping mapset, switch to a new
+        temporary mapset (tmp_mapset, or a new name) that can read maps in
+        the mapping mapset, restore the shared region, and call func there.
+        Returns the name of the temporary mapset and whatever func returns.
+        The temporary mapset is removed if func fails. """
+    source_mapset = session_settings["mapset"]
+    if tmp_mapset is None:
+        tmp_mapset = get_temporary_mapset_name()
+    try:
+        with Session(**session_settings):
+            grass.run_command("g.mapset", flags="c", quiet=True,
+                              mapset=tmp_mapset)
+            grass.run_command("g.mapsets", quiet=True,
+                              operation="add",
+                              mapset=source_mapset)
+            grass.run_command("g.region",
+                              region=f"{region_name}@{source_mapset}")
+            result = func(*args, **kwargs)
+    except BaseException:
+        remove_temporary_mapset(session_settings, tmp_mapset)
+        raise
+    return tmp_mapset, result
+
+
+def run_in_session(session_settings: dict,
+                   func: Callable,
+                   *args,
+                   **kwargs):
+    """ Open a GRASS session on a mapset and call func there. """
+    with Session(**session_settings):
+        return func(*args, **kwargs)
+
+
+def map_in_sessions(session_settings: dict,
+                    func: Callable,
+                    jobs: list,
+                    n_workers: Optional[int] = None):
+    """ Run func once per job (a dictionary of keyword arguments) in a
+        process pool, all workers in the same mapset. Only meant for work
+        that does not write maps, such as rendering. Returns results in
+        the same order as jobs. """
+    trace_context = tracing.get_context()
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [submit(executor, trace_context,
+                          run_in_session,
+                          session_settings,
+                          func,
+                          **job)
+                   for job in jobs]
+        return [get_result(future, trace_context) for future in futures]
+
+
+def map_in_temporary_mapsets(session_settings: dict,
+                             func: Callable,
+                             jobs: list,
+                             n_workers: Optional[int] = None,
+                             region_name: Optional[str] = k.SHARED_REGION,
+                             merge: Optional[Callable] = None):
+    """ Run func once per job (a dictionary of keyword arguments) in a
+        process pool, each call in its own temporary mapset. When all jobs
+        are done, merge (if any) is called here as merge(tmp_mapset, result)
+        for each job, e.g., to copy its rasters back to the current mapset
+        (see merge_rasters_from_mapset). Temporary mapsets are then removed,
+        whether jobs succeed or not. Returns results in the same order as
+        jobs. """
+    trace_context = tracing.get_context()
+    tmp_mapsets = [get_temporary_mapset_name() for _ in jobs]
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [submit(executor, trace_context,
+                              run_in_temporary_mapset,
+                              session_settings,
+                              func,
+                              tmp_mapset=tmp_mapset,
+                              region_name=region_name,
+                              **job)
+                       for tmp_mapset, job in zip(tmp_mapsets, jobs)]
+            results = [get_result(future, trace_context)[1]
+                       for future in futures]
+        if merge is not None:
+            for tmp_mapset, result in zip(tmp_mapsets, results):
+                merge(tmp_mapset, result)
+        return results
+    finally:
+        for tmp_mapset in tmp_mapsets:
+            remove_temporary_mapset(session_settings, tmp_mapset)
+
+
+def submit(executor: ProcessPoolExecutor,
+           trace_context: Optional[dict],
+           func: Callable,
+           *args,
+           **kwargs):
+    """ Submit func to a pool, traced in the worker when tracing is enabled
+        in this process (see tracing.call_traced). """
+    if trace_context is None:
+        return executor.submit(func, *args, **kwargs)
+    return executor.submit(tracing.call_traced, trace_context, func,
+                           *args, **kwargs)
+
+
+def get_result(future,
+               trace_context: Optional[dict]):
+    """ Result of a job sent with submit, merging its trace records. """
+    if trace_context is None:
+        return future.result()
+    result, events = future.result()
+    tracing.add_events(events)
+    return result
+
+
+def merge_rasters_from_mapset(raster_maps: list,
+                              tmp_mapset: str):
+    """ Copy rasters computed in a temporary mapset to the current mapset. """
+    for raster_map in raster_maps:
+        grass.run_command("g.copy", overwrite=True, quiet=True,
+                          raster=f"{raster_map}@{tmp_mapset},{raster_map}")
+
+
+def remove_temporary_mapset(session_settings: dict,
+                            tmp_mapset: str):
+    """ Delete a temporary mapset directory once its maps have been merged
+        back. Refuses to touch mapsets not created by this module. """
+    if not tmp_mapset.startswith(k.TMP_MAPSET_PREFIX):
+        raise ValueError(f"Not a temporary mapset: {tmp_mapset}")
+    mapset_path = (pathlib.Path(session_settings["gisdb"]) /
+                   session_settings["location"] / tmp_mapset)
+    shutil.rmtree(mapset_path, ignore_errors=True)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Work on tables of CASAS output points in memory before they reach
+    GRASS GIS, e.g., project longitude/latitude to the coordinate reference
+    system of the mapping location with pyproj, see
+    https://pyproj4.github.io/pyproj/stable/api/transformer.html
+    and sample elevation and filter points with array operations instead
+    of v.what.rast and v.extract. """
+
+import contextlib
+import functools
+import numpy as np
+import pandas as pd
+import cache
+import gis_init as ini
+
+from typing import Optional
+from pyproj import CRS, Transformer
+from scipy.spatial import cKDTree
+
+grass = ini.GrassModule("grass.script")
+garray = ini.GrassModule("grass.script.array")
+
+LATLONG_CRS = "EPSG:4326"
+
+# Elevations already sampled in this process, keyed as in the cache
+_elevations = {}
+# Mean spacing of point sets already seen in this process
+_spacings = {}
+
+
+def get_location_crs():
+    """ Coordinate reference system of the current GRASS location. """
+    return CRS.from_wkt(grass.read_command("g.proj", flags="wf"))
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(crs_wkt: str):
+    """ Transformer from longitude/latitude to a coordinate reference system
+        given as WKT. Building one is slow, so one per CRS is kept. """
+    return Transformer.from_crs(LATLONG_CRS, CRS.from_wkt(crs_wkt),
+                                always_xy=True)
+
+
+def project_coordinates(lon, lat, crs: CRS):
+    """ Project arrays of longitude and latitude in one vectorized call. """
+    transformer = get_transformer(crs.to_wkt())
+    return transformer.transform(lon, lat)
+
+
+def project_table(df: pd.DataFrame, crs: CRS):
+    """ Add projected x and y as first two columns of a table whose first
+        two columns are longitude and latitude (see input.select_variable),
+        keeping longitude and latitude as attributes. """
+    x, y = project_coordinates(df.iloc[:, 0].to_numpy(),
+                               df.iloc[:, 1].to_numpy(),
+                               crs)
+    df_projected = df.copy()
+    df_projected.insert(0, "y", y)
+    df_projected.insert(0, "x", x)
+    return df_projected
+
+
+def sample_raster(raster_map: str,
+                  x: np.ndarray,
+                  y: np.ndarray):
+    """ Values of a raster map at point coordinates, read once as an array
+        at the raster's own resolution over the bounding box of the points,
+        padded by a cell and aligned to the raster cells. The caller's
+        region is left as it was. Points outside the raster or on NULL
+        cells get NaN. """
+    values = np.full(len(x), np.nan)
+    info = grass.raster_info(raster_map)
+    bounds = {"n": min(np.nanmax(y, initial=-np.inf) + info["nsres"],
+                       info["north"]),
+              "s": max(np.nanmin(y, initial=np.inf) - info["nsres"],
+                       info["south"]),
+              "e": min(np.nanmax(x, initial=-np.inf) + info["ewres"],
+                       info["east"]),
+              "w": max(np.nanmin(x, initial=np.inf) - info["ewres"],
+                       info["west"])}
+    if bounds["n"] <= bounds["s"] or bounds["e"] <= bounds["w"]:
+        # No point on the raster
+        return values
+    grass.use_temp_region()
+    try:
+        grass.run_command("g.region", align=raster_map, **bounds)
+        region = grass.region()
+        raster = garray.array(mapname=raster_map, null="nan")
+    finally:
+        grass.del_temp_region()
+    cols = np.floor((x - region["w"]) / region["ewres"])
+    rows = np.floor((region["n"] - y) / region["nsres"])
+    # False for NaN coordinates as well
+    inside = ((rows >= 0) & (rows < raster.shape[0]) &
+              (cols >= 0) & (cols < raster.shape[1]))
+    values[inside] = raster[rows[inside].astype(int),
+                            cols[inside].astype(int)]
+    return values
+
+
+def get_elevation(digital_elevation_map: str,
+                  x: np.ndarray,
+                  y: np.ndarray):
+    """ Elevation at point coordinates, sampled once per elevation map and
+        set of points and then taken from the cache, since all variables
+        and years of a run share the same points. The elevation map is
+        keyed by its location, mapset and content (see
+        cache.get_input_raster_key), so that elevation is sampled again
+        when the map changes. """
+    key = cache.hash_key(cache.get_input_raster_key(digital_elevation_map),
+                         np.column_stack((x, y)))
+    if key in _elevations:
+        return _elevations[key]
+    elevation_file = cache.cache_file("elevation", key, ".npy")
+    if elevation_file.exists():
+        elevation = np.load(elevation_file)
+    else:
+        elevation = sample_raster(digital_elevation_map, x, y)
+        with cache.atomic_file(elevation_file) as f:
+            np.save(f, elevation)
+    _elevations[key] = elevation
+    return elevation
+
+
+def select_points(df: pd.DataFrame,
+                  value_columns: list,
+                  altitude_cap: Optional[float] = None,
+                  lower_bound: Optional[float] = None,
+                  upper_bound: Optional[float] = None):
+    """ In-memory version of interpolation.select_interpolation_points for
+        a table with an elevation column, with the same precedence of
+        altitude cap, upper bound and lower bound. Points out of bounds are
+        dropped; when the table holds several variables (wide table), their
+        values are set to NaN for the offending variable only. """
+    if altitude_cap is not None:
+        return df[df["elevation"] < altitude_cap]
+    if upper_bound is not None:
+        out_of_bounds = df[value_columns] > upper_bound
+    elif lower_bound is not None:
+        out_of_bounds = df[value_columns] < lower_bound
+    else:
+        return df
+    if len(value_columns) == 1:
+        return df[~out_of_bounds.iloc[:, 0]]
+    df_selected = df.copy()
+    df_selected[value_columns] = df[value_columns].mask(out_of_bounds)
+    return df_selected
+
+
+def prepare_table(df: pd.DataFrame,
+                  crs: CRS,
+                  value_columns: list,
+                  digital_elevation_map: Optional[str] = None,
+                  altitude_cap: Optional[float] = None,
+                  lower_bound: Optional[float] = None,
+                  upper_bound: Optional[float] = None):
+    """ Project a table of points (see project_table) and, when
+        digital_elevation_map is given, add elevation and select points
+        (see select_points). """
+    df_projected = project_table(df, crs)
+    if digital_elevation_map is None:
+        return df_projected
+    df_projected["elevation"] = get_elevation(digital_elevation_map,
+                                              df_projected["x"].to_numpy(),
+                                              df_projected["y"].to_numpy())
+    return select_points(df_projected,
+                         value_columns=value_columns,
+                         altitude_cap=altitude_cap,
+                         lower_bound=lower_bound,
+                         upper_bound=upper_bound)
+
+
+def stream_to_vector(dfs,
+                     output_map: str,
+                     columns: str):
+    """ Import tables of points, with x and y as first two columns, to a
+        single vector map through v.in.ascii stdin (input=-). """
+    process = start_vector_import(output_map, columns)
+    try:
+        for df in dfs:
+            write_to_vector_import(process, df)
+    except BaseException:
+        abort_vector_import(process)
+        raise
+    finish_vector_import(process, output_map)
+
+
+def start_vector_import(output_map: str,
+                        columns: str):
+    return grass.feed_command("v.in.ascii", overwrite=True,
+                              input="-",
+                              output=output_map,
+                              separator='tab',
+                              x=1, y=2, z=0,
+                              columns=columns)
+
+
+def write_to_vector_import(process, df: pd.DataFrame):
+    # Empty fields are imported as NULL
+    process.stdin.write(df.to_csv(sep='\t', index=False, header=False,
+                                  na_rep="").encode())
+
+
+def finish_vector_import(process, output_map: str):
+    """ Close stdin of a v.in.ascii process, so that it builds the map from
+        all rows written, and wait for it to exit. """
+    # The process may have exited already, e.g., on bad input
+    with contextlib.suppress(BrokenPipeError):
+        process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"v.in.ascii failed to import {output_map}")
+
+
+def abort_vector_import(process):
+    """ Stop a v.in.ascii process before it reads the end of stdin, so that
+        rows written so far are not imported as a complete map. Safe to
+        call after finish_vector_import. """
+    if process.poll() is None:
+        process.kill()
+    with contextlib.suppress(BrokenPipeError):
+        process.stdin.close()
+    process.wait()
+
+
+def mean_point_spacing(point_coords: np.ndarray):
+    """ Mean distance from each point to its nearest neighbour, found with a
+        KD-tree and computed once per set of point coordinates. Duplicate
+        points (zero distance) are not counted as neighbours. """
+    key = cache.hash_key(point_coords)
+    if key not in _spacings:
+        unique_coords = np.unique(point_coords, axis=0)
+        distances, _ = cKDTree(unique_coords).query(unique_coords, k=2)
+        _spacings[key] = float(distances[:, 1].mean())
+    return _spacings[key]
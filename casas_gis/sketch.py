@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Approximate quantiles of large streams of values (e.g., all cells of
+    all rasters in a batch) in bounded memory, with a merging t-digest, see
+    https://arxiv.org/abs/1902.04023
+    Values are summarized by at most about compression weighted centroids,
+    smaller near the tails, so extreme quantiles stay accurate. Sketches of
+    different rasters can be merged, and count, min and max are exact. """
+
+import numpy as np
+
+from typing import Optional
+
+
+class QuantileSketch:
+    def __init__(self, compression: Optional[int] = 100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        """ Add an array of values of any shape; NaN (NULL) is skipped. """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.compress(np.concatenate((self.means, values)),
+                      np.concatenate((self.weights, np.ones(values.size))))
+        return self
+
+    def merge(self, other: "QuantileSketch"):
+        """ Add the values summarized by another sketch. """
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress(np.concatenate((self.means, other.means)),
+                      np.concatenate((self.weights, other.weights)))
+        return self
+
+    def compress(self, means: np.ndarray, weights: np.ndarray):
+        """ Merge sorted centroids that fall in the same unit interval of
+            the arcsine scale function k(q) = compression / pi *
+            arcsin(2q - 1), which has narrow intervals near q = 0 and
+            q = 1. """
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        mid_quantiles = (cumulative - weights / 2) / cumulative[-1]
+        scale = (self.compression / np.pi *
+                 np.arcsin(2 * mid_quantiles - 1))
+        groups = np.floor(scale).astype(int)
+        groups -= groups[0]
+        self.weights = np.bincount(groups, weights=weights)
+        self.means = (np.bincount(groups, weights=weights * means) /
+                      np.where(self.weights > 0, self.weights, 1))
+        self.means = self.means[self.weights > 0]
+        self.weights = self.weights[self.weights > 0]
+
+    def to_dict(self):
+        """ State of the sketch as plain lists and numbers, e.g., to keep
+            it in a JSON file (see cache.py). """
+        return {"compression": self.compression,
+                "means": self.means.tolist(),
+                "weights": self.weights.tolist(),
+                "count": int(self.count),
+                "min": float(self.min),
+                "max": float(self.max)}
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        values_sketch = cls(state["compression"])
+        values_sketch.means = np.asarray(state["means"], dtype=float)
+        values_sketch.weights = np.asarray(state["weights"], dtype=float)
+        values_sketch.count = state["count"]
+        values_sketch.min = state["min"]
+        values_sketch.max = state["max"]
+        return values_sketch
+
+    def quantile(self, q):
+        """ Approximate value(s) at quantile(s) q, between 0 and 1. """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan)[()]
+        cumulative = np.cumsum(self.weights)
+        positions = (cumulative - self.weights / 2) / cumulative[-1]
+        return np.interp(q,
+                         np.concatenate(([0.0], positions, [1.0])),
+                         np.concatenate(([self.min], self.means,
+                                         [self.max])))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" Record GRASS GIS module runs (module, arguments, wall time, exit status
+    and pipeline stage) to see where the time of a run goes. When enabled,
+    the grass.script functions that run modules are wrapped, and so is
+    grass.script.core.start_command, which every module run goes through,
+    so that modules run inside grass.script helpers (e.g., grass.region,
+    raster_info, grass.script.array) are recorded too, from start until
+    the process is waited for. When disabled they are left untouched, so
+    tracing costs nothing. Records are written
+    as a Chrome trace (open in chrome://tracing or https://ui.perfetto.dev)
+    and summarized per module. Modules run by workers of a process pool
+    (see parallel.py) are recorded in the workers, with the stage the pool
+    was started in, and merged into the records of the main process. For
+    feed_command, which returns the running process, the time is that of
+    starting the module. """
+
+import contextlib
+import functools
+import json
+import os
+import pathlib
+import threading
+import time
+import gis_init as ini
+
+from typing import Optional
+
+TRACED_FUNCTIONS = ("run_command", "read_command", "parse_command",
+                    "write_command", "feed_command", "mapcalc")
+MAX_ARGUMENT_LENGTH = 200
+
+_originals = {}
+_events = []
+_stages = []
+_local = threading.local()
+_start = time.perf_counter()
+_start_time = time.time()
+
+
+def enable(start_time: Optional[float] = None):
+    """ Start recording, with times relative to now or, in pool workers,
+        to start_time (a time.time() value) of the main process. """
+    global _start, _start_time
+    if _originals:
+        return
+    grass = ini.import_grass_module("grass.script")
+    _events.clear()
+    _start = time.perf_counter()
+    _start_time = time.time()
+    if start_time is not None:
+        _start -= _start_time - start_time
+        _start_time = start_time
+    for name in TRACED_FUNCTIONS:
+        _originals[name] = getattr(grass, name)
+        setattr(grass, name, traced(name, _originals[name]))
+    core = ini.import_grass_module("grass.script.core")
+    _originals["start_command"] = core.start_command
+    core.start_command = traced_start_command(core.start_command)
+
+
+def disable():
+    """ Stop recording and put back the original functions. Records are
+        kept until the next enable. """
+    grass = ini.import_grass_module("grass.script")
+    core = ini.import_grass_module("grass.script.core")
+    for name, function in _originals.items():
+        setattr(core if name == "start_command" else grass, name, function)
+    _originals.clear()
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def traced(name: str, function):
+    """ function, recording its runs. A traced function called while
+        another one runs (e.g., parse_command calling read_command) is
+        not recorded again. """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, "active", False):
+            return function(*args, **kwargs)
+        _local.active = True
+        start = time.perf_counter()
+        status = 0
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            status = getattr(error, "returncode", None) or 1
+            raise
+        finally:
+            _local.active = False
+            record(get_module_name(name, args, kwargs), name, start,
+                   time.perf_counter(), status,
+                   format_arguments(name, args, kwargs))
+    return wrapper
+
+
+def traced_start_command(function):
+    """ start_command, recording module runs not already recorded by a
+        traced function (see traced) when the process is first waited for,
+        e.g., by communicate. """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, "active", False):
+            return function(*args, **kwargs)
+        module = get_module_name("start_command", args, kwargs)
+        arguments = format_arguments("start_command", args, kwargs)
+        start = time.perf_counter()
+        try:
+            process = function(*args, **kwargs)
+        except Exception as error:
+            record(module, "start_command", start, time.perf_counter(),
+                   getattr(error, "returncode", None) or 1, arguments)
+            raise
+        wait = process.wait
+
+        @functools.wraps(wait)
+        def traced_wait(*wait_args, **wait_kwargs):
+            returncode = wait(*wait_args, **wait_kwargs)
+            if process.wait is traced_wait:
+                # Recorded once, later waits are not module runs
+                process.wait = wait
+                record(module, "start_command", start, time.perf_counter(),
+                       returncode, arguments)
+            return returncode
+        process.wait = traced_wait
+        return process
+    return wrapper
+
+
+def get_module_name(name: str, args: tuple, kwargs: dict):
+    if name == "mapcalc":
+        return "r.mapcalc"
+    return args[0] if args else kwargs.get("prog", name)
+
+
+def format_arguments(name: str, args: tuple, kwargs: dict):
+    """ Module options as strings, long ones (e.g., stdin, expressions)
+        cut to MAX_ARGUMENT_LENGTH characters. """
+    arguments = dict(kwargs)
+    if name == "mapcalc" and args:
+        arguments["expression"] = args[0]
+    arguments.update({f"arg{i}": arg for i, arg in enumerate(args[1:], 1)
+                      if name != "mapcalc"})
+    return {key: str(value)[:MAX_ARGUMENT_LENGTH]
+            for key, value in arguments.items()}
+
+
+def record(module: str,
+           function: str,
+           start: float,
+           end: float,
+           status: int,
+           arguments: dict,
+           category: Optional[str] = "grass"):
+    _events.append({"name": module,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round((start - _start) * 1e6),
+                    "dur": round((end - start) * 1e6),
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": {"function": function,
+                             "stage": get_stage(),
+                             "status": status,
+                             **arguments}})
+
+
+def get_stage():
+    return "/".join(_stages) if _stages else None
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """ Label module runs with a pipeline stage; stages can be nested.
+        When tracing is enabled, the stage itself is recorded too. """
+    _stages.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if is_enabled():
+            record(name, "stage", start, time.perf_counter(), 0, {},
+                   category="stage")
+        _stages.pop()
+
+
+def get_context():
+    """ What a pool worker needs to record module runs as part of this
+        trace (see call_traced), or None when tracing is disabled. """
+    if not is_enabled():
+        return None
+    return {"start_time": _start_time, "stages": list(_stages)}
+
+
+def call_traced(context: dict, function, /, *args, **kwargs):
+    """ Call function in a pool worker with tracing enabled as in the main
+        process (see get_context). Returns what function returns and the
+        records of the call, to be merged with add_events. """
+    enable(start_time=context["start_time"])
+    worker_stages = list(_stages)
+    _stages[:] = context["stages"]
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        disable()
+        _stages[:] = worker_stages
+    return result, list(_events)
+
+
+def add_events(events: list):
+    """ Merge records of module runs made by pool workers. """
+    _events.extend(events)
+
+
+def get_summary():
+    """ Number of runs, failed runs, total, mean and longest wall time per
+        module, longest total first. """
+    modules = {}
+    for event in _events:
+        if event["cat"] != "grass":
+            continue
+        summary = modules.setdefault(event["name"],
+                                     {"module": event["name"],
+                                      "calls": 0,
+                                      "failed": 0,
+                                      "total_s": 0.0,
+                                      "max_s": 0.0})
+        seconds = event["dur"] / 1e6
+        summary["calls"] += 1
+        summary["failed"] += event["args"]["status"] != 0
+        summary["total_s"] += seconds
+        summary["max_s"] = max(summary["max_s"], seconds)
+    for summary in modules.values():
+        summary["mean_s"] = summary["total_s"] / summary["calls"]
+    return sorted(modules.values(), key=lambda s: s["total_s"],
+                  reverse=True)
+
+
+def format_summary(summary: list):
+    lines = [f"{'module':24}{'calls':>8}{'failed':>8}{'total s':>12}"
+             f"{'mean s':>12}{'max s':>12}"]
+    for s in summary:
+        lines.append(f"{s['module']:24}{s['calls']:8}{s['failed']:8}"
+                     f"{s['total_s']:12.3f}{s['mean_s']:12.4f}"
+                     f"{s['max_s']:12.4f}")
+    return "\n".join(lines)
+
+
+def write_trace(outfile: os.PathLike):
+    """ Write the Chrome trace to outfile and the per-module summary next
+        to it (same name ending in _summary.txt), and print the summary.
+        """
+    outfile = pathlib.Path(outfile)
+    outfile.parent.mkdir(parents=True, exist_ok=True)
+    with open(outfile, "w") as f:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, f)
+    summary = format_summary(get_summary())
+    with open(outfile.with_name(f"{outfile.stem}_summary.txt"), "w") as f:
+        f.write(f"{summary}\n")
+    print(f"\nGRASS GIS module runs (trace in {outfile}):\n")
+    print(summary)
+
+
+@contextlib.contextmanager
+def trace_run(outfile: Optional[os.PathLike] = None):
+    """ Trace module runs within the block and write them to outfile (see
+        write_trace). Does nothing when outfile is None. """
+    if outfile is None:
+        yield
+        return
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+        write_trace(outfile)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+""" casas_gis modules import each other by name (e.g., import constants as
+    k), so their directory is put on sys.path. It is appended rather than
+    prepended, so that casas_gis/grass.py does not hide the grass package of
+    GRASS GIS. Modules only import GRASS GIS when first used (see
+    gis_init.py), so the tests below that do not run GRASS GIS modules need
+    no GRASS GIS installation. """
+
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] /
+                    "casas_gis"))
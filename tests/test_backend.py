@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backend
+import idw
+
+
+def make_backend():
+    memory = backend.MemoryBackend()
+    region = memory.set_region(north=39, south=0, east=58, west=0,
+                               resolution=10)
+    assert (region["rows"], region["cols"]) == (4, 6)
+    assert (region["n"], region["e"]) == (40, 60)
+    elevation = np.full((4, 6), 500.0)
+    elevation[0] = 3000.0
+    elevation[1, 0] = np.nan
+    memory.add_raster("elevation", elevation)
+    crop_area = np.ones((4, 6))
+    crop_area[:, -1] = 0
+    memory.add_raster("crop_area", crop_area)
+    memory.import_points("points", pd.DataFrame({
+        "x": [5.0, 55.0, 25.0, 35.0],
+        "y": [5.0, 35.0, 15.0, 25.0],
+        "var1": [1.0, 2.0, 3.0, np.nan]}))
+    return memory
+
+
+def test_build_mask():
+    memory = make_backend()
+    memory.build_mask("mask", digital_elevation_map="elevation",
+                      max_altitude=2000, crop_area="crop_area")
+    expected = np.ones((4, 6), bool)
+    expected[0] = False
+    expected[1, 0] = False
+    expected[:, -1] = False
+    np.testing.assert_array_equal(memory.get_mask("mask"), expected)
+
+
+def test_interpolate_matches_idw():
+    memory = make_backend()
+    memory.build_mask("mask", digital_elevation_map="elevation",
+                      max_altitude=2000)
+    stats = memory.interpolate("points", "var1", "surface", mask="mask")
+    surface = memory.get_raster("surface")
+    cells = memory.get_mask("mask")
+    assert np.isnan(surface[~cells]).all()
+    eastings, northings = idw.region_cell_centers(memory.region)
+    np.testing.assert_allclose(surface[cells], idw.idw_values(
+        np.array([[5.0, 5.0], [55.0, 35.0], [25.0, 15.0]]),
+        np.array([1.0, 2.0, 3.0]),
+        np.column_stack((eastings[cells], northings[cells]))))
+    assert stats["n"] == cells.sum()
+    np.testing.assert_allclose(stats["mean"], surface[cells].mean())
+
+
+def test_clip_and_stats():
+    memory = make_backend()
+    memory.interpolate("points", "var1", "surface")
+    memory.build_mask("mask", crop_area="crop_area")
+    memory.clip("surface", "clipped", mask="mask", min_value=1.5,
+                max_value=2.9)
+    clipped = memory.get_raster("clipped")
+    surface = memory.get_raster("surface")
+    keep = (surface > 1.5) & (surface < 2.9)
+    keep[:, -1] = False
+    np.testing.assert_array_equal(~np.isnan(clipped), keep)
+    stats = memory.stats("clipped")
+    assert stats["n"] == keep.sum()
+    assert stats["min"] > 1.5 and stats["max"] < 2.9
+    memory.clip("surface", "empty", min_value=10)
+    assert memory.stats("empty")["n"] == 0
+
+
+def test_get_backend():
+    assert isinstance(backend.get_backend("memory"), backend.MemoryBackend)
+    assert isinstance(backend.get_backend(), backend.GrassBackend)
+    with pytest.raises(ValueError):
+        backend.get_backend("gpu")
+
+
+def test_grass_backend_shares_pipeline_code(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(backend.pts, "stream_to_vector",
+                        lambda **kwargs: calls.update(stream=kwargs))
+    monkeypatch.setattr(
+        backend.idw, "interpolate_vector_idw_numpy",
+        lambda **kwargs: calls.update(idw=kwargs) or (
+            kwargs["output_map"],
+            {"n": 2, "min": np.float64(1), "max": 3, "mean": 2.0}))
+    grass_backend = backend.GrassBackend()
+    grass_backend.import_points("sel_a", pd.DataFrame({"x": [0.0],
+                                                       "y": [1.0],
+                                                       "var1": [2.0]}))
+    assert calls["stream"]["output_map"] == "sel_a"
+    assert calls["stream"]["columns"] == ("x double precision, "
+                                          "y double precision, "
+                                          "var1 double precision")
+    stats = grass_backend.interpolate("sel_a", "var1", "idw_a",
+                                      mask="mapping_region")
+    assert calls["idw"]["region_raster"] == "mapping_region"
+    assert stats == {"n": 2.0, "min": 1.0, "max": 3.0, "mean": 2.0}
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import numpy as np
+
+import color
+import sketch
+
+
+def rule_lines(color_rule_text):
+    lines = color_rule_text.splitlines()
+    assert lines[-1] == "end"
+    return [(float(value), rgb) for value, rgb in
+            (line.split() for line in lines[:-1])]
+
+
+def test_range_color_rule():
+    lines = rule_lines(color.get_range_color_rule("panoply.txt", 10, 40))
+    values = [value for value, _ in lines]
+    assert len(lines) == len(color.read_color_rule("panoply.txt"))
+    assert values[0] == 10 and values[-1] == 40
+    assert lines[0][1] == "4:14:216" and lines[-1][1] == "158:0:0"
+    np.testing.assert_allclose(values[1], 10 + 30 * 0.067)
+
+
+def test_range_color_rule_end_colors_beyond_range():
+    lines = rule_lines(color.get_range_color_rule("panoply.txt", 10, 40,
+                                                  abs_min=0, abs_max=50))
+    assert lines[0] == (0, "4:14:216")
+    assert lines[-1] == (50, "158:0:0")
+
+
+def test_range_color_rule_outliers():
+    lines = rule_lines(color.get_range_color_rule(
+        "panoply.txt", 10, 40, abs_min=0, abs_max=50,
+        outlier_low="0:0:121", outlier_high="87:0:0"))
+    values = [value for value, _ in lines]
+    assert lines[:2] == [(0, "0:0:121"), (values[1], "0:0:121")]
+    assert lines[-2:] == [(values[-2], "87:0:0"), (50, "87:0:0")]
+    assert values[1] < 10 == values[2]
+    assert values[-3] == 40 < values[-2]
+    assert len(set(values)) == len(values)
+    assert values == sorted(values)
+
+
+def test_range_color_rule_outliers_at_range():
+    # No outlier band when the data do not go beyond the range
+    lines = rule_lines(color.get_range_color_rule(
+        "panoply.txt", 1e6, 1e6 + 1, abs_min=1e6, abs_max=1e6 + 1,
+        outlier_low="0:0:121", outlier_high="87:0:0"))
+    assert "0:0:121" not in dict(lines).values()
+    assert len(set(value for value, _ in lines)) == len(lines)
+
+
+def test_color_table():
+    table = color.get_color_table("panoply.txt", 0, 1)
+    assert table.shape == (256, 3)
+    assert tuple(table[0]) == (4, 14, 216)
+    assert tuple(table[-1]) == (158, 0, 0)
+
+
+def test_merge_sketches():
+    sketches = {"a": sketch.QuantileSketch().update(np.arange(10.0)),
+                "b": sketch.QuantileSketch().update(np.arange(10.0, 30.0))}
+    merged = color.merge_sketches(["a", "b"], sketches)
+    assert (merged.count, merged.min, merged.max) == (30, 0, 29)
+    assert color.merge_sketches(["a", "c"], sketches) is None
+    assert color.merge_sketches(["a"]) is None
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import numpy as np
+
+import composite
+
+REGION = {"n": 200.0, "s": 100.0, "e": 400.0, "w": 200.0}
+
+
+def test_apply_color_table():
+    color_table = np.array([[0, 0, 0], [128, 128, 128], [255, 255, 255]],
+                           dtype=np.uint8)
+    values = np.array([[0.0, 5.0], [10.0, np.nan], [-3.0, 99.0]])
+    rgba = composite.apply_color_table(values, color_table, 0, 10)
+    assert rgba.shape == (3, 2, 4)
+    np.testing.assert_array_equal(rgba[..., 0],
+                                  [[0, 128], [255, 0], [0, 255]])
+    np.testing.assert_array_equal(rgba[..., 3],
+                                  [[255, 255], [255, 0], [255, 255]])
+
+
+def test_apply_color_table_constant():
+    color_table = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8)
+    rgba = composite.apply_color_table(np.full((2, 2), 7.0), color_table,
+                                       7, 7)
+    np.testing.assert_array_equal(rgba[..., :3], np.full((2, 2, 3),
+                                                         [1, 2, 3]))
+
+
+def test_apply_color_table_outliers():
+    color_table = np.array([[0, 0, 0], [255, 255, 255]], dtype=np.uint8)
+    values = np.array([-1.0, 0.0, 10.0, 11.0, np.nan])
+    rgba = composite.apply_color_table(values, color_table, 0, 10,
+                                       outlier_colors=((0, 0, 121),
+                                                       (87, 0, 0)))
+    np.testing.assert_array_equal(rgba[:, :3], [[0, 0, 121],
+                                                [0, 0, 0],
+                                                [255, 255, 255],
+                                                [87, 0, 0],
+                                                [0, 0, 0]])
+    np.testing.assert_array_equal(rgba[:, 3], [255, 255, 255, 255, 0])
+
+
+def test_map_frame():
+    # The region is twice as wide as high
+    assert composite.map_frame(REGION, (800, 600)) == (0, 100, 800, 400)
+    assert composite.map_frame(REGION, (800, 200)) == (200, 0, 400, 200)
+
+
+def test_map_pixels():
+    frame = composite.map_frame(REGION, (800, 600))
+    cols, rows = composite.map_pixels(np.array([200.0, 400.0, 300.0]),
+                                      np.array([200.0, 100.0, 150.0]),
+                                      REGION, frame)
+    np.testing.assert_allclose(cols, [0, 800, 400])
+    np.testing.assert_allclose(rows, [100, 500, 300])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import numpy as np
+import pytest
+
+import idw
+
+
+def brute_force_idw(point_coords, point_values, target_coords,
+                    number_of_points, power):
+    estimates = []
+    for target in target_coords:
+        distances = np.hypot(*(point_coords - target).T)
+        nearest = np.argsort(distances)[:number_of_points]
+        if distances[nearest[0]] == 0:
+            estimates.append(point_values[nearest[0]])
+            continue
+        weights = 1 / distances[nearest] ** power
+        estimates.append(weights @ point_values[nearest] / weights.sum())
+    return np.array(estimates)
+
+
+@pytest.mark.parametrize("number_of_points, power",
+                         [(1, 2.0), (3, 2.0), (5, 1.0), (12, 3.0)])
+def test_idw_values_match_brute_force(number_of_points, power):
+    rng = np.random.default_rng(42)
+    point_coords = rng.uniform(0, 1000, (40, 2))
+    point_values = rng.uniform(-10, 10, 40)
+    target_coords = rng.uniform(0, 1000, (200, 2))
+    np.testing.assert_allclose(
+        idw.idw_values(point_coords, point_values, target_coords,
+                       number_of_points=number_of_points, power=power),
+        brute_force_idw(point_coords, point_values, target_coords,
+                        number_of_points, power))
+
+
+def test_idw_weight_matrix_rows():
+    rng = np.random.default_rng(1)
+    point_coords = rng.uniform(0, 100, (10, 2))
+    target_coords = np.vstack((point_coords[:3],
+                               rng.uniform(0, 100, (20, 2))))
+    weights = idw.idw_weight_matrix(point_coords, target_coords,
+                                    number_of_points=4)
+    assert weights.shape == (23, 10)
+    np.testing.assert_allclose(weights.sum(axis=1).A.ravel(), 1)
+    assert all(np.diff(weights.indptr) == 4)
+    # Targets on a point take its value only
+    np.testing.assert_allclose(weights[:3].toarray(), np.eye(3, 10))
+
+
+def test_more_neighbours_than_points():
+    point_coords = np.array([[0.0, 0.0], [10.0, 0.0]])
+    values = idw.idw_values(point_coords, np.array([1.0, 3.0]),
+                            np.array([[5.0, 0.0]]), number_of_points=12)
+    np.testing.assert_allclose(values, [2.0])
+
+
+def test_region_cell_centers():
+    region = {"n": 20, "s": 0, "e": 30, "w": 0,
+              "nsres": 10, "ewres": 10, "rows": 2, "cols": 3}
+    eastings, northings = idw.region_cell_centers(region)
+    np.testing.assert_array_equal(eastings, [[5, 15, 25], [5, 15, 25]])
+    np.testing.assert_array_equal(northings, [[15, 15, 15], [5, 5, 5]])
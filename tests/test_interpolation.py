@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import math
+
+import interpolation
+
+
+def test_absolute_range_skips_empty_rasters():
+    empty = {"n": "0", "min": "nan", "max": "nan"}
+    raster_stats = {"idw_a": empty,
+                    "idw_b": {"n": "4", "min": "-1.5", "max": "3"},
+                    "idw_c": {"n": "2", "min": "0", "max": "7.25"},
+                    "idw_d": empty}
+    assert interpolation.get_absolute_range(raster_stats) == (7.25, -1.5)
+
+
+def test_absolute_range_all_empty():
+    abs_max, abs_min = interpolation.get_absolute_range(
+        {"idw_a": {"n": 0, "min": math.nan, "max": math.nan}})
+    assert math.isnan(abs_max) and math.isnan(abs_min)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import mapcalc
+
+
+def test_within():
+    assert mapcalc.within("a", 0, 10) == "(a > 0) && (a < 10)"
+    assert mapcalc.within("a", min_value=0) == "(a > 0)"
+    assert mapcalc.within("a", max_value=10) == "(a < 10)"
+    assert mapcalc.within("a") is None
+
+
+def test_where():
+    assert mapcalc.where("a") == "a"
+    assert mapcalc.where("a", None) == "a"
+    assert mapcalc.where("a", "mask") == "if ((mask), a, null())"
+    assert (mapcalc.where("a", "mask", mapcalc.within("a", 0)) ==
+            "if ((mask) && ((a > 0)), a, null())")
+
+
+def test_assign():
+    assert (mapcalc.assign("out", mapcalc.where("a", "mask")) ==
+            "out = if ((mask), a, null())")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import numpy as np
+import pandas as pd
+
+import points
+
+
+def make_table():
+    return pd.DataFrame({"x": [0.0, 1.0, 2.0, 3.0],
+                         "y": [0.0, 1.0, 2.0, 3.0],
+                         "var1": [-1.0, 5.0, 20.0, 8.0],
+                         "var2": [3.0, -2.0, 4.0, 30.0],
+                         "elevation": [100.0, 900.0, 2500.0, 1999.0]})
+
+
+def test_altitude_cap_comes_first():
+    df = points.select_points(make_table(), ["var1"], altitude_cap=2000,
+                              lower_bound=0)
+    assert df["elevation"].tolist() == [100.0, 900.0, 1999.0]
+
+
+def test_no_selection():
+    df = make_table()
+    assert points.select_points(df, ["var1"]) is df
+
+
+def test_bounds_drop_points_of_one_variable():
+    df = points.select_points(make_table(), ["var1"], lower_bound=0)
+    assert df["var1"].tolist() == [5.0, 20.0, 8.0]
+    # Upper bound wins over lower bound
+    df = points.select_points(make_table(), ["var1"], lower_bound=0,
+                              upper_bound=10)
+    assert df["var1"].tolist() == [-1.0, 5.0, 8.0]
+
+
+def test_bounds_mask_values_of_wide_tables():
+    df = points.select_points(make_table(), ["var1", "var2"],
+                              upper_bound=10)
+    assert len(df) == 4
+    np.testing.assert_array_equal(df["var1"], [-1.0, 5.0, np.nan, 8.0])
+    np.testing.assert_array_equal(df["var2"], [3.0, -2.0, 4.0, np.nan])
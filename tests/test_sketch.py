@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#
+# AUTHOR(S):    Luigi Ponti quartese gmail com
+#
+# PURPOSE:
+#
+# NOTE:
+#
+# Copyright:    (c) 2021-2024 CASAS (Center for the Analysis
+#                   of Sustainable Agricultural Systems).
+#                   https://www.casasglobal.org/).
+#
+#               SPDX-License-Identifier: GPL-3.0-or-later
+
+import numpy as np
+import pytest
+
+from sketch import QuantileSketch
+
+QUANTILES = [0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999]
+
+
+def rank_error(values, estimates, quantiles):
+    """ Distance between the rank of each estimate and its quantile. """
+    ranks = np.searchsorted(np.sort(values), estimates) / len(values)
+    return np.abs(ranks - quantiles)
+
+
+@pytest.mark.parametrize("distribution", ["normal", "lognormal", "uniform"])
+def test_quantile_error(distribution):
+    rng = np.random.default_rng(7)
+    values = getattr(rng, distribution)(size=200_000)
+    values_sketch = QuantileSketch()
+    for chunk in np.array_split(values, 20):
+        values_sketch.update(chunk)
+    estimates = values_sketch.quantile(QUANTILES)
+    errors = rank_error(values, estimates, QUANTILES)
+    assert errors.max() < 0.005
+    # Tails are more accurate than the middle
+    assert errors[[0, -1]].max() < 0.0005
+    assert len(values_sketch.means) <= 2 * values_sketch.compression
+
+
+def test_merge():
+    rng = np.random.default_rng(3)
+    a, b = rng.normal(0, 1, 50_000), rng.normal(5, 2, 30_000)
+    merged = QuantileSketch().update(a).merge(QuantileSketch().update(b))
+    values = np.concatenate((a, b))
+    assert merged.count == values.size
+    assert merged.min == values.min()
+    assert merged.max == values.max()
+    assert rank_error(values, merged.quantile(QUANTILES),
+                      QUANTILES).max() < 0.005
+    assert merged.merge(QuantileSketch()).count == values.size
+
+
+def test_nan_and_empty():
+    values_sketch = QuantileSketch()
+    assert np.isnan(values_sketch.quantile(0.5))
+    values_sketch.update(np.array([[np.nan, 1.0], [2.0, np.nan]]))
+    assert values_sketch.count == 2
+    assert values_sketch.quantile(0) == 1.0
+    assert values_sketch.quantile(1) == 2.0
+
+
+def test_dict_round_trip():
+    values_sketch = QuantileSketch(50).update(np.arange(1000.0))
+    restored = QuantileSketch.from_dict(values_sketch.to_dict())
+    assert restored.compression == 50
+    assert restored.count == 1000
+    np.testing.assert_array_equal(restored.quantile(QUANTILES),
+                                  values_sketch.quantile(QUANTILES))